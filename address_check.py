@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""
+Address Validation
+
+Checks the addresses of a whole netplan document (or desired state) in
+one pass, before anything is written:
+
+    addresses     valid, with a prefix, usable by a host (not the network
+                  or broadcast address of an IPv4 subnet), not assigned twice
+    subnets       no subnet configured on two interfaces (an error) and no
+                  subnet of one interface overlapping another's (a warning)
+    gateways      a host address inside a subnet of the route's own
+                  interface (unless the route is on-link), not a local
+                  address, and default routes with distinct metrics
+    nameservers   valid host addresses
+
+Addresses are parsed with inet_pton into integers (ipaddress objects are
+only built for messages), and every subnet goes into a SubnetIndex: the
+(first, last) address ranges sorted, with the furthest end reached so far
+kept for each position. Overlaps come out of a single sweep (the subnets
+still open kept in a heap by end address) and "which subnets contain this
+address" is a binary search, so thousands of interfaces are checked in
+O(n log n) instead of comparing every subnet with every other one.
+
+The same parsers back the interactive prompts, so a typo is caught when
+it is typed rather than by 'netplan apply'.
+
+References:
+    - Python ipaddress: https://docs.python.org/3/library/ipaddress.html
+    - Python bisect: https://docs.python.org/3/library/bisect.html
+    - inet_pton(3): https://man7.org/linux/man-pages/man3/inet_pton.3.html
+    - Netplan Reference (routes, on-link): https://netplan.io/reference/#routing
+    - RFC 3021, 31-bit prefixes on point-to-point links: https://www.rfc-editor.org/rfc/rfc3021
+"""
+
+import bisect
+import heapq
+import ipaddress
+import socket
+
+DEFAULT_ROUTES = ("default", "0.0.0.0/0", "::/0")
+BITS = {4: 32, 6: 128}
+
+_ADDRESS = {4: ipaddress.IPv4Address, 6: ipaddress.IPv6Address}
+_INTERFACE = {4: ipaddress.IPv4Interface, 6: ipaddress.IPv6Interface}
+
+
+def _host(value, version=None):
+    """
+    Parse a host address into (version, integer).
+
+    Raises:
+        ValueError: with a message fit for the user
+    """
+    text = str(value).strip()
+    try:
+        if ":" in text:
+            parsed = 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+        else:
+            parsed = 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big")
+    except OSError:
+        addr = ipaddress.ip_address(text)    # the error message, or a scoped IPv6 address
+        parsed = addr.version, int(addr)
+    if version is not None and parsed[0] != version:
+        raise ValueError(f"{text} is not an IPv{version} address")
+    n = parsed[1]
+    if n == 0 or (parsed[0] == 4 and (n >> 24 == 127 or n >> 28 == 14)) or \
+            (parsed[0] == 6 and (n == 1 or n >> 120 == 0xff)):
+        raise ValueError(f"{text} is not a usable host address")
+    return parsed
+
+
+def _cidr(value, version=None):
+    """
+    Parse an interface address with its prefix into (version, address,
+    first, last) integers.
+
+    Raises:
+        ValueError: with a message fit for the user
+    """
+    text = str(value).strip()
+    host, slash, prefix = text.partition("/")
+    if not slash:
+        raise ValueError(f"{text} has no /prefix")
+    v, n = _host(host, version)
+    if not (prefix.isdigit() and int(prefix) <= BITS[v]):
+        raise ValueError(f"invalid prefix length /{prefix}")
+    span = (1 << (BITS[v] - int(prefix))) - 1
+    first, last = n & ~span, n | span
+    if v == 4 and span > 1 and n in (first, last):
+        kind = "network" if n == first else "broadcast"
+        raise ValueError(f"{host} is the {kind} address of {subnet_text((v, first, last))}")
+    return v, n, first, last
+
+
+def parse_host_address(value, version=None):
+    """
+    Parse an address that a host can use (a gateway or nameserver).
+
+    Args:
+        value (str): e.g. '192.168.1.1'
+        version (int or None): require IPv4 (4) or IPv6 (6)
+
+    Returns:
+        IPv4Address or IPv6Address
+
+    Raises:
+        ValueError: with a message fit for the user
+    """
+    v, n = _host(value, version)
+    return _ADDRESS[v](n)
+
+
+def parse_host_interface(value, version=None):
+    """
+    Parse an address with its prefix (e.g. '192.168.1.50/24') for an
+    interface: it must be a usable host address of its subnet.
+
+    Returns:
+        IPv4Interface or IPv6Interface
+
+    Raises:
+        ValueError: with a message fit for the user
+    """
+    v, n, first, last = _cidr(value, version)
+    return _INTERFACE[v]((n, BITS[v] - (last - first).bit_length()))
+
+
+def validate_address(value, with_prefix=False):
+    """
+    Check an address (with its /prefix when `with_prefix`) without
+    building ipaddress objects; raises ValueError like the parsers above.
+    """
+    if with_prefix:
+        _cidr(value)
+    else:
+        _host(value)
+
+
+def subnet_text(subnet):
+    """Format a (version, first, last, ...) subnet as 'address/prefix'."""
+    version, first, last = subnet[:3]
+    return f"{_ADDRESS[version](first)}/{BITS[version] - (last - first).bit_length()}"
+
+
+class SubnetIndex:
+    """
+    Subnets as (version, first, last, owner) tuples, owner being an
+    interface name, sorted by first address (widest first), with the
+    furthest last address reached up to each position so containment
+    lookups know when to stop.
+    """
+    __slots__ = ("_keys", "_entries", "_reach")
+
+    def __init__(self, subnets):
+        """
+        Args:
+            subnets (iterable): (version, first, last, owner) tuples
+        """
+        entries = sorted(subnets, key=lambda e: (e[0], e[1], -e[2]))
+        self._entries = entries
+        self._keys = [(e[0], e[1]) for e in entries]
+        self._reach = []
+        version, reach = None, -1
+        for e in entries:
+            if e[0] != version:
+                version, reach = e[0], -1
+            reach = max(reach, e[2])
+            self._reach.append(reach)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def containing(self, version, value):
+        """Return the subnets that contain the address (version, value)."""
+        found = []
+        i = bisect.bisect_right(self._keys, (version, value)) - 1
+        while i >= 0 and self._entries[i][0] == version and self._reach[i] >= value:
+            if self._entries[i][2] >= value:
+                found.append(self._entries[i])
+            i -= 1
+        return found
+
+    def conflicts(self):
+        """
+        Sweep the subnets once and yield (other, subnet) for every pair of
+        overlapping subnets of different owners, `other` starting first
+        (or at the same address). Overlaps within one owner are ignored:
+        several addresses of one subnet on a link are normal.
+
+        The sweep keeps the subnets still open at the current start
+        address in a heap ordered by their last address, so the cost is
+        O(n log n) plus the number of pairs reported.
+        """
+        active = []      # (last, position, subnet) of subnets not yet ended
+        version = None
+        for position, e in enumerate(self._entries):
+            if e[0] != version:
+                version, active = e[0], []
+            while active and active[0][0] < e[1]:
+                heapq.heappop(active)
+            for _last, _position, other in sorted(active, key=lambda a: a[1]):
+                if other[3] != e[3]:
+                    yield other, e
+            heapq.heappush(active, (e[2], position, e))
+
+
+def check_document(doc):
+    """
+    Validate every address, subnet, gateway and nameserver of a netplan
+    document.
+
+    Args:
+        doc (NetplanDocument): see netplan_model.py
+
+    Returns:
+        (errors, warnings): two lists of str
+    """
+    errors, warnings = [], []
+    owners = {}      # (version, address) -> interface
+    subnets = []     # (version, first, last, interface)
+    own = {}         # interface -> its subnets
+    interfaces = list(doc.interfaces())
+
+    for iface in interfaces:
+        mine = own[iface.name] = []
+        for value in iface.addresses:
+            try:
+                v, n, first, last = _cidr(value)
+            except ValueError as e:
+                errors.append(f"{iface.name} address {value}: {e}")
+                continue
+            if (v, n) in owners:
+                errors.append(f"{iface.name} address {value}: already assigned to {owners[v, n]}")
+                continue
+            owners[v, n] = iface.name
+            mine.append((v, first, last, iface.name))
+        subnets.extend(mine)
+
+    first_owner = {}
+    reported = set()
+    for subnet in subnets:
+        owner = first_owner.setdefault(subnet[:3], subnet[3])
+        if owner != subnet[3] and subnet not in reported:
+            reported.add(subnet)
+            errors.append(f"{subnet_text(subnet)} is configured on both {owner} and {subnet[3]}")
+
+    index = SubnetIndex(subnets)
+    for other, subnet in index.conflicts():
+        if other[:3] != subnet[:3]:
+            warnings.append(f"{subnet_text(other)} on {other[3]} overlaps "
+                            f"{subnet_text(subnet)} on {subnet[3]}")
+
+    defaults = {4: [], 6: []}
+    for iface in interfaces:
+        for route in iface.routes:
+            if route.via is None:
+                continue
+            where = f"{iface.name} route to {route.to} via {route.via}"
+            try:
+                via = _host(route.via)
+            except ValueError as e:
+                errors.append(f"{where}: {e}")
+                continue
+            if route.to in DEFAULT_ROUTES:
+                defaults[via[0]].append((iface.name, route.metric))
+            problem = _gateway_problem(iface, route, via, own[iface.name], owners, index)
+            if problem:
+                errors.append(f"{where}: {problem}")
+
+        for value in iface.nameservers.addresses:
+            try:
+                _host(value)
+            except ValueError as e:
+                errors.append(f"{iface.name} nameserver {value}: {e}")
+
+    for version, routes in defaults.items():
+        if len(routes) > 1 and len({metric for _name, metric in routes}) < len(routes):
+            warnings.append(f"{len(routes)} IPv{version} default routes without distinct metrics "
+                            f"({', '.join(name for name, _metric in routes)})")
+    return errors, warnings
+
+
+def _gateway_problem(iface, route, via, subnets, owners, index):
+    """Return why `via` cannot be the gateway of a route of `iface`, or None."""
+    version, value = via
+    if via in owners:
+        return f"the gateway is a local address (on {owners[via]})"
+    if route.on_link or (version == 6 and value >> 118 == 0x3fa):    # fe80::/10
+        return None
+    same = [s for s in subnets if s[0] == version]
+    if not same:
+        # IPv6 may still get an address from router advertisements
+        if iface.dhcp4 if version == 4 else (iface.dhcp6 or subnets or iface.dhcp4):
+            return None
+        if subnets:
+            return f"{iface.name} has no IPv4 address and DHCPv4 is off"
+        return "gateway on an interface without addresses or DHCP"
+    for subnet in same:
+        if subnet[1] <= value <= subnet[2]:
+            if version == 4 and subnet[2] - subnet[1] > 1 and value in subnet[1:3]:
+                kind = "network" if value == subnet[1] else "broadcast"
+                return f"the gateway is the {kind} address of {subnet_text(subnet)}"
+            return None
+    elsewhere = [f"{subnet_text(s)} on {s[3]}" for s in index.containing(version, value)
+                 if s[3] != iface.name]
+    hint = f"; it is on {', '.join(elsewhere)}" if elsewhere else ""
+    return (f"gateway is not on any subnet of {iface.name} "
+            f"({', '.join(subnet_text(s) for s in same)}){hint}; set on-link if that is intended")
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+Agent Module
+
+Long-running agent mode ('assignment2.py --agent'). It keeps the interface
+inventory and the parsed live nftables ruleset in memory and serves the
+network and firewall operations over a Unix domain socket, so repeated
+calls skip interpreter start-up, imports and rescans.
+
+Caches stay correct without polling:
+    - an rtnetlink multicast socket (link and address groups) invalidates
+      the inventory whenever the kernel reports a change;
+    - an 'nft monitor' child invalidates the ruleset on any nftables event.
+If a watcher cannot be started, the matching cache is simply reloaded on
+every request.
+
+Protocol: one JSON object per line in each direction. A connection may
+send any number of requests. Each connection gets a thread, but requests
+are served one at a time: an apply captures the output of the tool's
+print-based steps by swapping sys.stdout, which is process-wide.
+
+    -> {"op": "interfaces"}
+    <- {"ok": true, "result": [...], "elapsed_ms": 0.2}
+
+    -> {"op": "apply_firewall", "args": {"rules": "/etc/nftables.conf", "incremental": true}}
+    <- {"ok": true, "result": {"status": "changed", "output": "..."}, "elapsed_ms": 41.7}
+
+Operations: ping, interfaces, interface, ruleset, refresh, stats,
+apply_network, apply_firewall, shutdown. See agentctl.py for a client.
+
+References:
+    - Python socketserver: https://docs.python.org/3/library/socketserver.html
+    - unix(7): https://man7.org/linux/man-pages/man7/unix.7.html
+    - rtnetlink(7) multicast groups: https://man7.org/linux/man-pages/man7/rtnetlink.7.html
+    - nft(8) monitor: https://www.netfilter.org/projects/nftables/manpage.html
+"""
+
+import contextlib
+import errno
+import io
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+import apply_state
+import discovery
+import firewall
+import netplan_utils
+import nft_ruleset
+import preflight
+
+SOCKET_PATH = "/run/assignment2/agent.sock"
+
+# rtnetlink multicast groups (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+
+class AgentError(Exception):
+    """A request the agent cannot serve; reported to the client as an error."""
+
+
+class Agent:
+    """Warm state plus the operations the socket exposes."""
+
+    def __init__(self, loader=discovery.discover_interfaces):
+        self.inventory = discovery.InterfaceInventory(loader)
+        self.started = time.time()
+        self.requests = 0
+        self.ruleset_loads = 0
+        self.link_watch = False
+        self.nft_watch = False
+        self._ruleset = None
+        self._ruleset_lock = threading.Lock()
+        self._request_lock = threading.Lock()   # one request at a time, see _captured
+        self._monitor = None
+        self.server = None
+
+    # -- caches --------------------------------------------------------------
+    def live_ruleset(self):
+        """Return the parsed live ruleset, reading it only when it may have changed."""
+        with self._ruleset_lock:
+            if self._ruleset is None or not self.nft_watch:
+                self._ruleset = nft_ruleset.load_live_ruleset()
+                self.ruleset_loads += 1
+            return self._ruleset
+
+    def interfaces(self):
+        """Return the inventory, rescanned first if link changes are not watched."""
+        if not self.link_watch:
+            self.inventory.invalidate()
+        return self.inventory
+
+    def invalidate(self):
+        self.inventory.invalidate()
+        with self._ruleset_lock:
+            self._ruleset = None
+
+    def _watch_links(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, discovery.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        except OSError as e:
+            self._log(f"link watcher unavailable ({e}); rescanning on every request")
+            return
+        self.link_watch = True
+        while True:
+            try:
+                sock.recv(65536)
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:  # ENOBUFS: events were dropped, still a change
+                    self.link_watch = False
+                    return
+            self.inventory.invalidate()
+
+    def _watch_nft(self):
+        try:
+            self._monitor = subprocess.Popen(["nft", "monitor"], stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL, text=True)
+        except OSError as e:
+            self._log(f"nft monitor unavailable ({e}); re-reading the ruleset on every request")
+            return
+        self.nft_watch = True
+        for _line in self._monitor.stdout:
+            with self._ruleset_lock:
+                self._ruleset = None
+        self.nft_watch = False
+
+    def _log(self, message):
+        # outside a request, so it never lands in an apply's captured output
+        with self._request_lock:
+            print(f"[agent] {message}", flush=True)
+
+    def start_watchers(self):
+        for target in (self._watch_links, self._watch_nft):
+            threading.Thread(target=target, daemon=True).start()
+
+    # -- operations ----------------------------------------------------------
+    def op_ping(self, args):
+        return {"pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1)}
+
+    def op_interfaces(self, args):
+        records = self.interfaces().records()
+        return [records[name] for name in sorted(records)]
+
+    def op_interface(self, args):
+        rec = self.interfaces().get(args.get("name"))
+        if rec is None:
+            raise AgentError(f"no such interface: {args.get('name')}")
+        return rec
+
+    def op_ruleset(self, args):
+        ruleset = self.live_ruleset()
+        tables = []
+        for (family, name), table in sorted(ruleset.tables.items()):
+            tables.append({
+                "family": family,
+                "name": name,
+                "chains": {c: len(chain.rules) for c, chain in table.chains.items()},
+                "sets": {n: len(s.elements) for n, s in table.sets.items()},
+            })
+        return {"tables": tables, "rules": ruleset.rule_count()}
+
+    def op_refresh(self, args):
+        self.invalidate()
+        return {"interfaces": len(self.inventory.records())}
+
+    def op_stats(self, args):
+        return {"requests": self.requests, "interface_scans": self.inventory.scans,
+                "ruleset_loads": self.ruleset_loads, "link_watch": self.link_watch,
+                "nft_watch": self.nft_watch}
+
+    def _captured(self, func, *fargs, **kwargs):
+        """
+        Run a printing operation and return its output (added to the error
+        message if the operation raises AgentError). redirect_stdout swaps
+        sys.stdout for the whole process; this is only safe because
+        handle() serves one request at a time.
+        """
+        out = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(out):
+                status = func(*fargs, **kwargs)
+        except AgentError as e:
+            raise AgentError(f"{e}\n{out.getvalue().strip()}".strip()) from None
+        return {"status": status, "output": out.getvalue()}
+
+    def op_apply_network(self, args):
+        if "config" not in args:
+            raise AgentError("apply_network needs args.config (desired-state file)")
+        return self._captured(netplan_utils.configure_network_from_file,
+                              args["config"], self.interfaces())
+
+    def _apply_firewall(self, rules, incremental, stream):
+        if not os.path.isfile(rules):
+            print(f"File '{rules}' not found.")
+            return apply_state.FAILED
+        unchanged, file_sha, _live = apply_state.nftables_unchanged(rules)
+        if unchanged:
+            print("No changes: this rules file was already applied and the live ruleset "
+                  "has not changed since. Skipping apply.")
+            return apply_state.UNCHANGED
+        if not preflight.run(rules_paths=[rules]):
+            raise AgentError("pre-flight checks failed; the live ruleset was not touched")
+        live = self.live_ruleset() if incremental else None
+        result = firewall.apply_rules(rules, incremental=incremental, stream=stream,
+                                      file_sha=file_sha, live=live)
+        with self._ruleset_lock:
+            self._ruleset = None
+        return result
+
+    def op_apply_firewall(self, args):
+        if "rules" not in args:
+            raise AgentError("apply_firewall needs args.rules (nftables rules file)")
+        return self._captured(self._apply_firewall, args["rules"],
+                              bool(args.get("incremental")), bool(args.get("stream")))
+
+    def op_shutdown(self, args):
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {"stopping": True}
+
+    def handle(self, request):
+        """Serve one decoded request and return the response mapping."""
+        with self._request_lock:
+            return self._handle(request)
+
+    def _handle(self, request):
+        start = time.monotonic()
+        self.requests += 1
+        try:
+            if not isinstance(request, dict):
+                raise AgentError("request must be a JSON object")
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            if handler is None:
+                raise AgentError(f"unknown op: {request.get('op')!r}")
+            args = request.get("args") or {}
+            response = {"ok": True, "result": handler(args)}
+        except (AgentError, OSError, ValueError, subprocess.SubprocessError) as e:
+            response = {"ok": False, "error": str(e)}
+        except Exception as e:
+            # a bug or a malformed request must not drop the connection
+            response = {"ok": False, "error": f"internal error: {type(e).__name__}: {e}"}
+        response["elapsed_ms"] = round((time.monotonic() - start) * 1000, 3)
+        return response
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"ok": False, "error": f"invalid JSON: {e}"}
+            else:
+                response = self.server.agent.handle(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path=SOCKET_PATH, agent=None):
+    """
+    Run the agent until a shutdown request or Ctrl+C.
+
+    The socket is created mode 0600, so only root can talk to the agent.
+    """
+    agent = agent or Agent()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.agent = agent
+    agent.server = server
+    agent.start_watchers()
+    agent.inventory.records()  # warm up before the first request
+    print(f"[agent] listening on {path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        if agent._monitor is not None:
+            agent._monitor.terminate()
+        print("[agent] stopped")
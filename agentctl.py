@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Agent Client
+
+Thin command-line client for the agent started with 'assignment2.py
+--agent'. It imports nothing from the tool itself, so a call costs one
+small interpreter start plus a socket round trip.
+
+Usage:
+    sudo python3 agentctl.py ping
+    sudo python3 agentctl.py interfaces
+    sudo python3 agentctl.py interface eth0
+    sudo python3 agentctl.py ruleset
+    sudo python3 agentctl.py apply-network /path/to/desired-state.json
+    sudo python3 agentctl.py apply-firewall /path/to/rules.nft --incremental
+    sudo python3 agentctl.py stats | refresh | shutdown
+
+Exit status: 0 on success, 1 on error, 3 when an apply found nothing to
+change (same as assignment2.py).
+
+References:
+    - Python socket: https://docs.python.org/3/library/socket.html
+    - Python argparse: https://docs.python.org/3/library/argparse.html
+"""
+
+import argparse
+import json
+import socket
+import sys
+
+SOCKET_PATH = "/run/assignment2/agent.sock"
+EXIT_NO_CHANGES = 3
+
+
+def call(op, args=None, path=SOCKET_PATH, timeout=300):
+    """
+    Send one request to the agent and return the decoded response.
+
+    Raises:
+        OSError: if the agent is not reachable
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"op": op, "args": args or {}}).encode() + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise OSError("agent closed the connection without replying")
+    return json.loads(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Client for the assignment2 agent")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"agent socket (default: {SOCKET_PATH})")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON response")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("ping", "interfaces", "ruleset", "stats", "refresh", "shutdown"):
+        sub.add_parser(name)
+    p = sub.add_parser("interface")
+    p.add_argument("name")
+    p = sub.add_parser("apply-network")
+    p.add_argument("config")
+    p = sub.add_parser("apply-firewall")
+    p.add_argument("rules")
+    p.add_argument("--incremental", action="store_true")
+    p.add_argument("--stream", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    request = {}
+    if args.command == "interface":
+        request = {"name": args.name}
+    elif args.command == "apply-network":
+        request = {"config": args.config}
+    elif args.command == "apply-firewall":
+        request = {"rules": args.rules, "incremental": args.incremental, "stream": args.stream}
+
+    try:
+        response = call(args.command.replace("-", "_"), request, args.socket)
+    except OSError as e:
+        print(f"[ERROR] Cannot reach the agent at {args.socket}: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(response, indent=2))
+    elif not response["ok"]:
+        print(f"[ERROR] {response['error']}", file=sys.stderr)
+    elif isinstance(response["result"], dict) and "output" in response["result"]:
+        print(response["result"]["output"], end="")
+        print(f"[{response['result']['status']}] in {response['elapsed_ms']:.1f} ms")
+    elif args.command == "interfaces":
+        for rec in response["result"]:
+            addr = rec["ipv4"][0] if rec["ipv4"] else "N/A"
+            print(f"{rec['index']}) {rec['name']:10s}  {addr:18s}  {rec['state']:8s}  mtu {rec['mtu']}")
+    else:
+        print(json.dumps(response["result"], indent=2))
+
+    if not response["ok"]:
+        return 1
+    status = response["result"].get("status") if isinstance(response["result"], dict) else None
+    if status == "failed":
+        return 1
+    if status == "unchanged":
+        return EXIT_NO_CHANGES
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+Apply State Module
+
+Remembers what the tool last applied, by content hash, so that runs whose
+desired state is already in place can skip the backup, the write and the
+apply entirely.
+
+State is kept in /var/lib/assignment2/state.json:
+
+    {
+      "netplan":  {"path": ..., "sha256": ..., "applied_at": ...},
+      "nftables": {"files": [{"path": ..., "sha256": ..., "applied_at": ...}, ...],
+                   "live_sha256": ..., "applied_at": ...},
+      "fastpath": {"path": ..., "sha256": ..., "devices": [...], "applied_at": ...}
+    }
+
+A run can apply several rules files (--rules, then the ruleset compiled
+from --allow-list / --deny-list), so nftables files are recorded by
+absolute path, in apply order, next to one live hash: the one taken after
+the last apply. A file with 'flush ruleset' starts the list anew. A file
+is unchanged only when it was the last one applied, its hash matches its
+record and the live ruleset still matches that hash.
+
+References:
+    - Python hashlib: https://docs.python.org/3/library/hashlib.html
+    - Python json: https://docs.python.org/3/library/json.html
+    - Filesystem Hierarchy Standard, /var/lib: https://refspecs.linuxfoundation.org/FHS_3.0/fhs/ch05s08.html
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+from datetime import datetime
+
+import executor
+import nft_ruleset
+
+STATE_DIR = "/var/lib/assignment2"
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+
+# Results returned by the configure_* flows
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+_COUNTER_RE = re.compile(r"\b(counter|quota [^{};\n]*?) packets \d+ bytes \d+|\bused \d+ \w*bytes")
+
+
+def content_hash(data):
+    """Return the sha256 hex digest of a str or bytes value."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """Return the sha256 of a file's bytes, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def rules_hash(path):
+    """Hash a rules file together with every file it includes."""
+    digest = hashlib.sha256()
+    for text, _source, _lineno in nft_ruleset.iter_source_lines(path):
+        digest.update(text.encode())
+    return digest.hexdigest()
+
+
+def flushes_ruleset(path):
+    """True if a rules file (or one it includes) contains 'flush ruleset'."""
+    for text, _source, _lineno in nft_ruleset.iter_source_lines(path):
+        if text.split("#", 1)[0].strip().rstrip(";").split() == ["flush", "ruleset"]:
+            return True
+    return False
+
+
+def live_ruleset_hash():
+    """
+    Hash the kernel's current ruleset, ignoring counter and quota values
+    (they change with traffic, not with configuration). The listing is
+    hashed as it streams in, so a huge ruleset is never held in memory.
+    """
+    digest = hashlib.sha256()
+    for line in executor.iter_lines(["nft", "list", "ruleset"]):
+        digest.update(_COUNTER_RE.sub(r"\1", line).encode())
+    return digest.hexdigest()
+
+
+def load_state():
+    """Return the saved state mapping (empty if missing or unreadable)."""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record(kind, **fields):
+    """
+    Save what was just applied for one kind ("netplan", "nftables" or
+    "fastpath").
+    Failing to save only costs an unnecessary apply next time, so errors
+    are reported but not raised.
+    """
+    state = load_state()
+    fields["applied_at"] = datetime.now().isoformat(timespec="seconds")
+    state[kind] = fields
+    _save_state(state)
+
+
+def _save_state(state):
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp = STATE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, STATE_FILE)
+    except OSError as e:
+        print(f"Warning: could not save apply state to {STATE_FILE}: {e}")
+
+
+def netplan_unchanged(path, content):
+    """
+    True if the file on disk already holds exactly this content and it is
+    the content this tool last applied.
+    """
+    wanted = content_hash(content)
+    if file_hash(path) != wanted:
+        return False
+    return load_state().get("netplan", {}).get("sha256") == wanted
+
+
+def nftables_record(state=None):
+    """
+    Return the nftables record as {"files": [...], "live_sha256": ...}
+    (empty if nothing was applied), converting the older single-file
+    record.
+    """
+    saved = (load_state() if state is None else state).get("nftables") or {}
+    if "path" in saved:
+        files = [{"path": saved["path"], "sha256": saved.get("sha256"),
+                  "applied_at": saved.get("applied_at")}]
+        return {"files": files, "live_sha256": saved.get("live_sha256")}
+    return {"files": list(saved.get("files", [])), "live_sha256": saved.get("live_sha256")}
+
+
+def nftables_unchanged(rules_path):
+    """
+    True if this rules file was the last one applied, with its current
+    content, and the live ruleset has not changed since. (A file applied
+    earlier may have been overridden by a later one, so only the last
+    file can be judged against the recorded live hash.)
+
+    Returns:
+        (unchanged (bool), file_sha256, live_sha256 or None)
+    """
+    wanted = rules_hash(rules_path)
+    saved = nftables_record()
+    path = os.path.abspath(rules_path)
+    last = saved["files"][-1] if saved["files"] else {}
+    if last.get("path") != path or last.get("sha256") != wanted:
+        return False, wanted, None
+    try:
+        live = live_ruleset_hash()
+    except (OSError, subprocess.SubprocessError):
+        return False, wanted, None
+    return live == saved["live_sha256"], wanted, live
+
+
+def record_nftables(rules_path, file_sha=None):
+    """
+    Record a successful nft apply of one file, and the live hash after it.
+
+    The record lists the files that make up the live ruleset in apply
+    order, the last one applied at the end. A file with 'flush ruleset'
+    replaces everything applied before it, so it starts the list anew.
+    """
+    try:
+        live = live_ruleset_hash()
+    except (OSError, subprocess.SubprocessError):
+        live = None
+    saved = nftables_record()
+    entry = {"path": os.path.abspath(rules_path), "sha256": file_sha or rules_hash(rules_path),
+             "applied_at": datetime.now().isoformat(timespec="seconds")}
+    try:
+        flushes = flushes_ruleset(rules_path)
+    except (OSError, ValueError):
+        flushes = False
+    if flushes:
+        files = [entry]
+    else:
+        files = [f for f in saved["files"] if f["path"] != entry["path"]] + [entry]
+    record("nftables", files=files, live_sha256=live)
+
+
+def rebase_nftables(previous_live):
+    """
+    Keep the nftables record valid after the tool changed the live ruleset
+    outside the rules file (the flowtable fast-path table): a record that
+    matched the live ruleset before the change is moved to the new hash.
+    """
+    saved = nftables_record()
+    if not saved["files"] or previous_live is None or saved["live_sha256"] != previous_live:
+        return
+    try:
+        live = live_ruleset_hash()
+    except (OSError, subprocess.SubprocessError):
+        return
+    record("nftables", files=saved["files"], live_sha256=live)
+
+
+def forget(kind):
+    """Drop the record of one kind (it was removed from the system)."""
+    state = load_state()
+    if state.pop(kind, None) is not None:
+        _save_state(state)
@@ -16,6 +16,29 @@ Usage:
     sudo python3 assignment2.py --mode network
     sudo python3 assignment2.py --mode firewall --rules /path/to/rules.nft
     sudo python3 assignment2.py --mode both
+    sudo python3 assignment2.py --config /path/to/desired-state.json
+    sudo python3 assignment2.py --mode firewall --rules /path/to/rules.nft --incremental
+    sudo python3 assignment2.py --mode firewall --deny-list blocked.txt --allow-list allowed.csv
+    python3 assignment2.py --rules /path/to/rules.nft --analyze
+    sudo python3 assignment2.py --rules /path/to/rules.nft --apply-optimized
+    sudo python3 assignment2.py --profile 60 --reordered-rules /tmp/reordered.nft
+    sudo python3 assignment2.py --router-profile
+    python3 assignment2.py --router-profile --dry-run --hw-root /path/to/fixture
+    sudo python3 assignment2.py --balance-irqs eth0
+    python3 assignment2.py --fastpath eth0,eth1 --dry-run
+    sudo python3 assignment2.py --fastpath eth0,eth1 --check
+    sudo python3 assignment2.py --mode firewall --rules rules.nft --fastpath eth0,eth1
+    sudo python3 assignment2.py --query 10.1.2.3:443 --query-cache
+    sudo python3 assignment2.py --query "chain inet filter input" --page 3
+    sudo python3 assignment2.py --mode network --list-backups
+    sudo python3 assignment2.py --mode both --rollback 1
+    sudo python3 assignment2.py --config state.json --trace --metrics-prom
+    sudo python3 assignment2.py --agent      (then: sudo python3 agentctl.py interfaces)
+    sudo python3 assignment2.py --watch      (re-applies what drifts from the last apply)
+    python3 assignment2.py --render inventory.json --output rendered/ --jobs 8
+    python3 assignment2.py --fleet inventory.json --parallel 20 --canary 2 --wave-size 50
+    python3 assignment2.py --fleet inventory.json --transport local --fleet-root /tmp/fleet
+    sudo python3 assignment2.py --watch --dry-run --watch-debounce 5
 
 References:
     - Python argparse: https://docs.python.org/3/library/argparse.html
@@ -30,11 +53,16 @@ import sys
 import os
 import subprocess
 
+__version__ = "1.0.0"
+
+# Exit code when every requested step found its desired state already applied
+EXIT_NO_CHANGES = 3
+
 # STEP 1: Checks Python Version (before any other imports)
 # ============================================================================
-if sys.version_info < (3, 6):
+if sys.version_info < (3, 8):
     print("\n" + "="*60)
-    print("ERROR: This script requires Python 3.6 or higher")
+    print("ERROR: This script requires Python 3.8 or higher")
     print("="*60)
     print(f"You are running Python {sys.version_info.major}.{sys.version_info.minor}")
     print("\nPlease upgrade Python or use a compatible environment.")
@@ -54,8 +82,14 @@ def check_root_privileges():
     return os.geteuid() == 0
 
 
-# Performs root check immediately
-if not check_root_privileges():
+def require_root():
+    """
+    Exits with a usage message unless running as root. Called from main()
+    rather than at import time, so the modules can be imported (and
+    benchmarked) without root, and --help / --version work for anyone.
+    """
+    if check_root_privileges():
+        return
     print("\n" + "="*60)
     print("ERROR: This script must be run with root privileges")
     print("="*60)
@@ -68,12 +102,26 @@ if not check_root_privileges():
     sys.exit(1)
 
 
-
-# STEP 3: Import modules (after root check)
+# STEP 3: Import modules
 # ============================================================================
 try:
+    import agent
+    import apply_state
+    import backup_store
+    import desired_state
+    import discovery
+    import inventory_render
+    import drift_watch
+    import fleet
     import netplan_utils
     import firewall
+    import nft_flowtable
+    import irq_balance
+    import metrics
+    import nft_profile
+    import nft_query
+    import preflight
+    import sysctl_profile
 except ImportError as e:
     print("\n" + "="*60)
     print("ERROR: Failed to import required modules")
@@ -81,6 +129,7 @@ except ImportError as e:
     print(f"\nDetails: {e}")
     print("\nPlease ensure all required files are in the same directory:")
     print("  - network_core.py     (Person 1)")
+    print("  - discovery.py        (Person 1)")
     print("  - netplan_utils.py    (Person 2)")
     print("  - firewall.py         (Person 3)")
     print("  - assignment2.py      (Person 4 - this file)")
@@ -122,12 +171,673 @@ def parse_args():
              "If omitted, the script will ask interactively."
     )
     
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="Desired-state file (JSON) describing all ethernets, VLANs, bonds and "
+             "bridges. Validated as a whole, written as one netplan file and applied "
+             "once. Implies --mode network when --mode is omitted."
+    )
+    
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Diff the rules file against the live ruleset and apply only the "
+             "changes in one atomic nft transaction instead of reloading everything."
+    )
+    
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream very large rules files into nft with include expansion and "
+             "syntax checks, keeping memory use flat."
+    )
+    
+    parser.add_argument(
+        "--allow-list",
+        metavar="PATH",
+        action="append",
+        help="Text/CSV list of addresses, CIDRs and ports to accept. "
+             "Compiled into nftables sets and verdict maps (can be repeated)."
+    )
+    
+    parser.add_argument(
+        "--deny-list",
+        metavar="PATH",
+        action="append",
+        help="Text/CSV list of addresses, CIDRs and ports to drop (can be repeated)."
+    )
+    
+    parser.add_argument(
+        "--compiled-rules",
+        metavar="PATH",
+        default=firewall.COMPILED_RULES_FILE,
+        help=f"Where to write the ruleset compiled from the lists "
+             f"(default: {firewall.COMPILED_RULES_FILE})."
+    )
+    
+    parser.add_argument(
+        "--analyze",
+        action="store_true",
+        help="Analyze the rules file for duplicate, shadowed and mergeable rules and "
+             "print an equivalent optimized ruleset with a cost estimate; nothing is "
+             "applied. Implies --mode firewall when --mode is omitted."
+    )
+    
+    parser.add_argument(
+        "--apply-optimized",
+        action="store_true",
+        help="Like --analyze, then apply the optimized ruleset incrementally "
+             "(with the usual confirmation and backup)."
+    )
+    
+    parser.add_argument(
+        "--optimized-rules",
+        metavar="PATH",
+        help="Write the optimized ruleset here instead of printing it "
+             "(default with --apply-optimized: next to the rules file, as NAME.optimized.nft)."
+    )
+    
+    parser.add_argument(
+        "--profile",
+        metavar="SECONDS",
+        type=float,
+        help="Profile the live ruleset for SECONDS using rule counters: hit rates per "
+             "rule and chain, rules that never match, and a reordering that puts hot "
+             "accept rules first. Runs after the firewall step, or on its own without --mode."
+    )
+    
+    parser.add_argument(
+        "--profile-interval",
+        metavar="SECONDS",
+        type=float,
+        default=nft_profile.DEFAULT_INTERVAL,
+        help=f"Seconds between counter reads (default: {nft_profile.DEFAULT_INTERVAL:g})."
+    )
+    
+    parser.add_argument(
+        "--keep-counters",
+        action="store_true",
+        help="Keep the counters --profile adds to rules that had none."
+    )
+    
+    parser.add_argument(
+        "--reordered-rules",
+        metavar="PATH",
+        help="Write the ruleset reordered by --profile here (apply it with --incremental)."
+    )
+    
+    parser.add_argument(
+        "--query",
+        metavar="QUERY",
+        help="Query the live ruleset instead of printing it: 'ADDRESS[:PORT]' (rules "
+             "matching it), 'chain [FAMILY] [TABLE] CHAIN', 'set [FAMILY] [TABLE] NAME', "
+             "'handle [FAMILY] TABLE N' or 'summary'."
+    )
+    
+    parser.add_argument(
+        "--page",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Page of the --query result to show (default: 1)."
+    )
+    
+    parser.add_argument(
+        "--page-size",
+        metavar="N",
+        type=int,
+        default=nft_query.PAGE_SIZE,
+        help=f"Lines per --query page (default: {nft_query.PAGE_SIZE})."
+    )
+    
+    parser.add_argument(
+        "--query-cache",
+        action="store_true",
+        help="Keep the ruleset index between runs, reused until the ruleset "
+             "generation changes."
+    )
+    
+    parser.add_argument(
+        "--fastpath",
+        metavar="IFACES",
+        help="Offload established forwarded TCP/UDP connections between the comma-separated "
+             "interfaces to an nftables flowtable (its own table, kept across reloads); "
+             "'off' removes it."
+    )
+    
+    parser.add_argument(
+        "--fastpath-rules",
+        metavar="PATH",
+        default=firewall.FASTPATH_RULES_FILE,
+        help=f"Where the fast path rules are written (default: {firewall.FASTPATH_RULES_FILE})."
+    )
+    
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="With --fastpath: validate the fast path (including 'nft -c') without "
+             "writing or applying anything."
+    )
+    
+    parser.add_argument(
+        "--router",
+        action="store_true",
+        help="With the interactive network flow: afterwards offer IPv4 forwarding "
+             "(with the router profile and fast path) and IRQ balancing for the "
+             "chosen interface."
+    )
+    
+    parser.add_argument(
+        "--router-profile",
+        action="store_true",
+        help="Compute router sysctls (backlog, conntrack, socket buffers, busy poll) "
+             f"and RPS/XPS masks from the hardware, write {sysctl_profile.PROFILE_FILE} "
+             "and apply it with one sysctl call."
+    )
+    
+    parser.add_argument(
+        "--balance-irqs",
+        metavar="IFACE",
+        help="Spread IFACE's IRQs and RPS/XPS queues across the CPUs of its NUMA node, "
+             "show the per-CPU interrupt distribution before and after, and persist "
+             "the result in a systemd unit."
+    )
+    
+    parser.add_argument(
+        "--irq-sample",
+        metavar="SECONDS",
+        type=float,
+        default=irq_balance.SAMPLE_SECONDS,
+        help=f"Interrupt rate sampling window for --balance-irqs (default: {irq_balance.SAMPLE_SECONDS})."
+    )
+    
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="With --router-profile / --balance-irqs / --fastpath: show the computed "
+             "values or generated rules, write nothing. With --watch: report drift only."
+    )
+    
+    parser.add_argument(
+        "--hw-root",
+        metavar="DIR",
+        help="Read DIR/proc and DIR/sys instead of /proc and /sys (fixture trees); "
+             "implies --dry-run."
+    )
+    
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help="Do not run the pre-flight checks (netplan generate in a scratch root, "
+             "nft -c, address/gateway sanity) before writing anything."
+    )
+    
+    parser.add_argument(
+        "--rollback",
+        metavar="N",
+        type=int,
+        help="Restore the N-th most recent backup (1 = newest) of the netplan "
+             "configuration, the nftables ruleset, or both, as chosen by --mode."
+    )
+    
+    parser.add_argument(
+        "--list-backups",
+        action="store_true",
+        help="List the stored backups for --mode (numbered as --rollback expects) and exit."
+    )
+    
+    parser.add_argument(
+        "--keep-backups",
+        metavar="COUNT",
+        type=int,
+        default=backup_store.KEEP_COUNT,
+        help=f"Backups kept per kind; 0 keeps all (default: {backup_store.KEEP_COUNT})."
+    )
+    
+    parser.add_argument(
+        "--backup-max-age",
+        metavar="DAYS",
+        type=int,
+        default=backup_store.MAX_AGE_DAYS,
+        help=f"Evict backups older than this; 0 disables (default: {backup_store.MAX_AGE_DAYS})."
+    )
+    
+    parser.add_argument(
+        "--agent",
+        action="store_true",
+        help="Run as a long-lived agent that keeps the interface inventory and live "
+             "ruleset in memory and serves requests on a Unix socket (see agentctl.py)."
+    )
+    
+    parser.add_argument(
+        "--render",
+        metavar="INVENTORY",
+        help="Render every host's netplan YAML and nftables ruleset from an inventory "
+             "file into --output, offline (see inventory_render.py). Needs no root; "
+             "cannot be combined with --mode."
+    )
+    
+    parser.add_argument(
+        "--output",
+        metavar="DIR",
+        default="rendered",
+        help="Output directory for --render (default: rendered)."
+    )
+    
+    parser.add_argument(
+        "--jobs",
+        metavar="N",
+        type=int,
+        help="Worker processes for --render (default: one per CPU)."
+    )
+    
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --render: ignore the input-hash cache and render every host."
+    )
+    
+    parser.add_argument(
+        "--fleet",
+        metavar="INVENTORY",
+        help="Render an inventory (like --render, into --output) and push each host's "
+             "state to it and apply it there, canary first, then in waves (see fleet.py). "
+             "Needs no local root; cannot be combined with --mode."
+    )
+    
+    parser.add_argument(
+        "--transport",
+        choices=sorted(fleet.TRANSPORTS),
+        default="ssh",
+        help="How --fleet reaches hosts: ssh, or local (every host a directory under "
+             "--fleet-root, for testing on one machine) (default: ssh)."
+    )
+    
+    parser.add_argument(
+        "--fleet-root",
+        metavar="DIR",
+        default="fleet-hosts",
+        help="Host directories for --transport local (default: fleet-hosts)."
+    )
+    
+    parser.add_argument(
+        "--parallel",
+        metavar="N",
+        type=int,
+        default=fleet.PARALLEL,
+        help=f"Hosts --fleet works on at once (default: {fleet.PARALLEL})."
+    )
+    
+    parser.add_argument(
+        "--canary",
+        metavar="N",
+        type=int,
+        default=fleet.CANARY,
+        help=f"Hosts in the first wave unless the inventory marks canaries "
+             f"(default: {fleet.CANARY})."
+    )
+    
+    parser.add_argument(
+        "--wave-size",
+        metavar="N",
+        type=int,
+        default=fleet.WAVE_SIZE,
+        help=f"Hosts per wave after the canaries; 0 for one wave (default: {fleet.WAVE_SIZE})."
+    )
+    
+    parser.add_argument(
+        "--max-failures",
+        metavar="N",
+        type=int,
+        default=0,
+        help="Failed hosts tolerated before --fleet stops starting new waves (default: 0)."
+    )
+    
+    parser.add_argument(
+        "--fleet-command",
+        metavar="CMD",
+        help="Command run on each host instead of the transport's default; {python}, "
+             "{dir} and {host} are filled in. Exit 0 = changed, 3 = unchanged, "
+             "4 = checked, anything else = failed."
+    )
+    
+    parser.add_argument(
+        "--fleet-timeout",
+        metavar="SECONDS",
+        type=float,
+        default=fleet.TIMEOUT,
+        help=f"Per-host time limit for --fleet, push included (default: {fleet.TIMEOUT:g})."
+    )
+    
+    parser.add_argument(
+        "--ssh-option",
+        metavar="OPT",
+        action="append",
+        default=[],
+        help="Extra 'ssh -o' option for --transport ssh (repeatable), e.g. User=admin."
+    )
+    
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch link/address events and nftables ruleset changes and re-apply "
+             "whatever drifts from the last applied netplan file and rules file."
+    )
+    
+    parser.add_argument(
+        "--watch-debounce",
+        metavar="SECONDS",
+        type=float,
+        default=drift_watch.DEBOUNCE,
+        help=f"Quiet time before a burst of events is checked (default: {drift_watch.DEBOUNCE:g})."
+    )
+    
+    parser.add_argument(
+        "--watch-resync",
+        metavar="SECONDS",
+        type=float,
+        default=drift_watch.RESYNC,
+        help=f"Full drift check even without events every this many seconds; 0 disables "
+             f"(default: {drift_watch.RESYNC:g})."
+    )
+    
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        default=agent.SOCKET_PATH,
+        help=f"Socket path for --agent (default: {agent.SOCKET_PATH})."
+    )
+    
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Print how long each stage (discovery, generation, backup, apply, "
+             "sysctl, nft) took at the end of the run."
+    )
+    
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write stage durations, rule counts and apply outcomes as JSON."
+    )
+    
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="PATH",
+        nargs="?",
+        const=metrics.DEFAULT_PROM_FILE,
+        help=f"Write the same metrics for the node_exporter textfile collector "
+             f"(default path: {metrics.DEFAULT_PROM_FILE})."
+    )
+    
     # parser.add_argument(
     #     "--interface",
     #     help="Interface name to configure (skips selection menu)"
     # )
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    # --render and --fleet are runs of their own; with --mode (or an option
+    # implying it) they would be silently skipped
+    implied_mode = args.mode or args.config or args.analyze or args.apply_optimized
+    for option, value in (("--render", args.render), ("--fleet", args.fleet)):
+        if value and implied_mode:
+            parser.error(f"{option} cannot be combined with --mode "
+                         f"(or --config/--analyze/--apply-optimized, which imply it)")
+    return args
+
+
+def run_network(args, inventory):
+    """
+    Runs the network step for CLI mode: batch mode from --config, or the
+    interactive single-interface flow.
+
+    Returns:
+        apply_state.CHANGED / UNCHANGED, or None if the user aborted
+    """
+    if args.config:
+        result = netplan_utils.configure_network_from_file(args.config, inventory)
+        metrics.outcome("netplan", result)
+        if result == apply_state.FAILED:
+            raise RuntimeError(f"network configuration from {args.config} failed")
+        return result
+    result = netplan_utils.configure_network(inventory, router=args.router)
+    metrics.outcome("netplan", result)
+    if result == apply_state.FAILED:
+        raise RuntimeError("network configuration failed")
+    return result
+
+
+def run_firewall(args):
+    """
+    Runs the firewall step for CLI mode: the --rules file first, then the
+    ruleset compiled from --allow-list / --deny-list, if any. With
+    --analyze / --apply-optimized each file is analyzed (and optimized)
+    instead.
+
+    Returns:
+        apply_state.UNCHANGED if every file was already applied, otherwise
+        apply_state.CHANGED (or None if the user aborted)
+    """
+    options = {"incremental": args.incremental, "stream": args.stream}
+    paths = []
+    if args.rules or not (args.allow_list or args.deny_list):
+        paths.append(args.rules)
+    if args.allow_list or args.deny_list:
+        compiled = firewall.compile_lists(
+            args.allow_list or [], args.deny_list or [], args.compiled_rules
+        )
+        if compiled is None:
+            raise RuntimeError("allow/deny lists could not be compiled")
+        paths.append(compiled)
+
+    results = []
+    for path in paths:
+        if args.analyze or args.apply_optimized:
+            if path is None:
+                raise RuntimeError("--analyze and --apply-optimized need --rules or allow/deny lists")
+            result = firewall.optimize_rules(path, args.optimized_rules, apply=args.apply_optimized)
+        else:
+            result = firewall.configure_firewall(rules_path_arg=path, **options)
+        metrics.outcome("nftables", result)
+        if result == apply_state.FAILED:
+            raise RuntimeError("firewall configuration failed")
+        results.append(result)
+    if None in results:
+        return None
+    if all(r == apply_state.UNCHANGED for r in results):
+        return apply_state.UNCHANGED
+    metrics.outcome("nftables", apply_state.CHANGED)
+    return apply_state.CHANGED
+
+
+def run_preflight(args):
+    """
+    With --mode both, checks the network and firewall input together before
+    either step writes anything. The steps skip checks that already passed.
+    """
+    yaml_content = None
+    if args.config:
+        try:
+            state = desired_state.load(args.config)
+        except (OSError, desired_state.DesiredStateError):
+            return  # the network step reports this before writing anything
+        yaml_content = netplan_utils.build_netplan_document(state)
+    rules = [args.rules] if args.rules and os.path.isfile(args.rules) else []
+    if yaml_content is None or not rules:
+        return  # only one side known up front: each step checks its own
+    with metrics.span("preflight"):
+        passed = preflight.run(netplan_utils.NETPLAN_FILE, yaml_content, rules)
+    if not passed:
+        raise RuntimeError("pre-flight checks failed; nothing was written")
+
+
+def run_profile(args):
+    """Runs --profile against the live ruleset."""
+    if args.profile <= 0 or args.profile_interval <= 0:
+        raise RuntimeError("--profile and --profile-interval need a positive number of seconds")
+    if not firewall.profile_firewall(args.profile, args.profile_interval,
+                                     args.reordered_rules, args.keep_counters):
+        raise RuntimeError("profiling the live ruleset failed")
+
+
+def hardware_roots(args):
+    """The /proc and /sys roots to read: --hw-root fixture trees or the real ones."""
+    if args.hw_root:
+        return os.path.join(args.hw_root, "proc"), os.path.join(args.hw_root, "sys")
+    return sysctl_profile.PROC_ROOT, sysctl_profile.SYS_ROOT
+
+
+def run_router_profile(args):
+    """Runs --router-profile, from --hw-root fixture trees if given."""
+    proc_root, sys_root = hardware_roots(args)
+    with metrics.span("router_profile"):
+        ok = sysctl_profile.run(args.dry_run, proc_root, sys_root)
+    if not ok:
+        raise RuntimeError("applying the router profile failed")
+
+
+def run_balance_irqs(args):
+    """Runs --balance-irqs; fixture counters are static, so they are not sampled."""
+    proc_root, sys_root = hardware_roots(args)
+    sample = 0 if args.hw_root else args.irq_sample
+    with metrics.span("irq_balance"):
+        ok = irq_balance.run(args.balance_irqs, args.dry_run, sample, proc_root, sys_root)
+    if not ok:
+        raise RuntimeError(f"balancing the IRQs of {args.balance_irqs} failed")
+
+
+def run_render(args):
+    """Runs --render: every host of an inventory into --output."""
+    if args.jobs is not None and args.jobs < 1:
+        raise RuntimeError("--jobs must be at least 1")
+    print(f"\n==== Rendering {args.render} ====\n")
+    try:
+        with metrics.span("render"):
+            result = inventory_render.render(args.render, args.output, args.jobs, args.force)
+    except inventory_render.InventoryError as e:
+        print(f"Inventory is invalid ({len(e.errors)} problem(s)), nothing was rendered:")
+        for error in e.errors:
+            print(f"  - {error}")
+        raise RuntimeError("the inventory is invalid") from None
+    metrics.set_value("hosts_rendered", result["rendered"])
+    metrics.set_value("hosts_unchanged", result["unchanged"])
+    metrics.set_value("hosts_failed", result["failed"])
+    metrics.set_value("hosts_per_second", round(result["hosts_per_second"], 1))
+    if result["failed"]:
+        raise RuntimeError(f"{result['failed']} host(s) failed to render")
+
+
+def run_fleet(args):
+    """Runs --fleet: render the inventory, then roll it out over --transport."""
+    if args.parallel < 1 or args.fleet_timeout <= 0:
+        raise RuntimeError("--parallel and --fleet-timeout must be positive")
+    if min(args.canary, args.wave_size, args.max_failures) < 0:
+        raise RuntimeError("--canary, --wave-size and --max-failures cannot be negative")
+    if args.jobs is not None and args.jobs < 1:
+        raise RuntimeError("--jobs must be at least 1")
+    if args.transport == "local":
+        transport = fleet.LocalTransport(args.fleet_root)
+    else:
+        transport = fleet.SshTransport(option for opt in args.ssh_option for option in ("-o", opt))
+    print(f"\n==== Fleet apply from {args.fleet} ====\n")
+    try:
+        with metrics.span("fleet"):
+            result = fleet.deploy(args.fleet, args.output, transport, args.parallel, args.canary,
+                                  args.wave_size, args.max_failures, args.fleet_command,
+                                  args.fleet_timeout, args.jobs)
+    except inventory_render.InventoryError as e:
+        print(f"Inventory is invalid ({len(e.errors)} problem(s)), nothing was pushed:")
+        for error in e.errors:
+            print(f"  - {error}")
+        raise RuntimeError("the inventory is invalid") from None
+    if result is None:
+        raise RuntimeError("the inventory did not render")
+    for status, count in result["counts"].items():
+        metrics.set_value(f"hosts_{status}", count)
+    if result["stopped"] or any(not r.ok for r in result["results"]):
+        raise RuntimeError("the fleet rollout did not complete on every host")
+
+
+def run_query(args):
+    """Runs --query against the live ruleset."""
+    if args.page < 1 or args.page_size < 1:
+        raise RuntimeError("--page and --page-size must be at least 1")
+    if not firewall.query_ruleset(args.query, args.page, args.page_size):
+        raise RuntimeError("the ruleset query failed")
+
+
+def run_fastpath(args):
+    """Runs --fastpath: generate and apply, check, dry-run, or remove ('off')."""
+    if args.fastpath.strip().lower() == "off":
+        result = firewall.remove_fastpath()
+    else:
+        result = firewall.configure_fastpath(
+            nft_flowtable.parse_devices(args.fastpath), args.fastpath_rules,
+            dry_run=args.dry_run, check=args.check, rules_path=args.rules
+        )
+    metrics.outcome("fastpath", result)
+    if result == apply_state.FAILED:
+        raise RuntimeError("the flowtable fast path failed")
+    return result
+
+
+def needs_root(args):
+    """
+    False for runs that change nothing on this machine: analyzing a rules
+    file without applying it, rendering an inventory or rolling it out to
+    other hosts, or showing the router profile / IRQ plan / fast path with
+    --dry-run.
+    """
+    if args.analyze and not args.apply_optimized and args.mode == "firewall":
+        return False
+    if (args.render or args.fleet) and not args.mode:
+        return False
+    if (args.router_profile or args.balance_irqs or args.fastpath) and args.dry_run \
+            and not args.mode and args.profile is None:
+        return False
+    return True
+
+
+def backup_kinds(mode):
+    """Map --mode to the backup kinds it covers."""
+    return {"network": ["netplan"], "firewall": ["nftables"],
+            "both": ["netplan", "nftables"]}[mode]
+
+
+def run_backups(args):
+    """
+    Handles --list-backups and --rollback for the kinds selected by --mode.
+    """
+    if not args.mode:
+        raise RuntimeError("--rollback and --list-backups need --mode network, firewall or both")
+    for kind in backup_kinds(args.mode):
+        if args.list_backups:
+            backup_store.print_backups(kind)
+            continue
+        if kind == "netplan":
+            ok = backup_store.restore_netplan(args.rollback, netplan_utils.NETPLAN_FILE)
+        else:
+            ok = backup_store.restore_nftables(args.rollback)
+        if not ok:
+            raise RuntimeError(f"rollback of {kind} failed")
+        print(f"{kind} rolled back to backup #{args.rollback}.")
+
+
+def report_metrics(args):
+    """
+    Prints the --trace breakdown and writes the --metrics-json /
+    --metrics-prom files. Failing to write metrics never fails the run.
+    """
+    if args.trace:
+        metrics.print_trace()
+    for path, writer in ((args.metrics_json, metrics.write_json),
+                         (args.metrics_prom, metrics.write_prometheus)):
+        if path:
+            try:
+                writer(path)
+            except OSError as e:
+                print(f"[WARNING] Could not write metrics to {path}: {e}")
 
 
 # STEP 5: Interactive Menu
@@ -168,30 +878,33 @@ def interactive_mode():
         print("\n[INFO] Exiting. Goodbye!\n")
         sys.exit(0)
     
+    # One interface inventory for the whole run
+    inventory = discovery.InterfaceInventory()
+
     # Execute based on choice
     try:
         if choice == "1":
             print("\n" + "="*60)
             print("        NETWORK CONFIGURATION")
             print("="*60)
-            netplan_utils.configure_network()
+            metrics.outcome("netplan", netplan_utils.configure_network(inventory))
         
         elif choice == "2":
             print("\n" + "="*60)
             print("        FIREWALL CONFIGURATION")
             print("="*60)
-            firewall.configure_firewall()
+            metrics.outcome("nftables", firewall.configure_firewall())
         
         elif choice == "3":
             print("\n" + "="*60)
             print("        STEP 1/2: NETWORK CONFIGURATION")
             print("="*60)
-            netplan_utils.configure_network()
+            metrics.outcome("netplan", netplan_utils.configure_network(inventory))
             
             print("\n" + "="*60)
             print("        STEP 2/2: FIREWALL CONFIGURATION")
             print("="*60)
-            firewall.configure_firewall()
+            metrics.outcome("nftables", firewall.configure_firewall())
         
         print("\n" + "="*60)
         print("        OPERATION COMPLETED SUCCESSFULLY")
@@ -215,10 +928,62 @@ def main():
     Main function - entry point of the program.
     Manages and controls the workflow based on arguments or interactive mode.
     """
-    # Parse command-line arguments
+    # Parse command-line arguments, then make sure we are root
+    # (read-only runs need no privileges, see needs_root)
     args = parse_args()
+    if (args.analyze or args.apply_optimized) and not args.mode:
+        args.mode = "firewall"
+    if args.hw_root:
+        args.dry_run = True
+    if needs_root(args):
+        require_root()
+    backup_store.set_retention(args.keep_backups, args.backup_max_age)
+    preflight.set_enabled(not args.skip_preflight)
+    nft_query.set_cache(args.query_cache)
+
+    # One interface inventory for the whole run
+    inventory = discovery.InterfaceInventory()
     
     try:
+        # A desired-state file implies network mode
+        if args.config and not args.mode:
+            args.mode = "network"
+        
+        # Agent mode: serve requests until stopped
+        if args.agent:
+            agent.serve(args.socket)
+            return
+        
+        # Watch mode: keep the last applied state in place until stopped
+        if args.watch:
+            drift_watch.run(args.dry_run, args.watch_debounce, args.watch_resync)
+            return
+        
+        # Backup listing / rollback instead of a normal run
+        if args.list_backups or args.rollback is not None:
+            run_backups(args)
+            return
+        
+        # Tuning / rule profile only: no configuration step
+        standalone = args.router_profile or args.balance_irqs or args.fastpath \
+            or args.query or args.render or args.fleet or args.profile is not None
+        if standalone and not args.mode:
+            if args.router_profile:
+                run_router_profile(args)
+            if args.balance_irqs:
+                run_balance_irqs(args)
+            if args.fastpath:
+                run_fastpath(args)
+            if args.query:
+                run_query(args)
+            if args.render:
+                run_render(args)
+            if args.fleet:
+                run_fleet(args)
+            if args.profile is not None:
+                run_profile(args)
+            return
+        
         # If mode not provided → interactive selection
         if not args.mode:
             interactive_mode()
@@ -226,29 +991,49 @@ def main():
         
         # Non-interactive mode via CLI
         print(f"\n[INFO] Running in non-interactive mode: {args.mode}\n")
+        results = []
         
         if args.mode == "network":
             print("="*60)
             print("        NETWORK CONFIGURATION")
             print("="*60)
-            netplan_utils.configure_network()
+            results.append(run_network(args, inventory))
         
         elif args.mode == "firewall":
             print("="*60)
             print("        FIREWALL CONFIGURATION")
             print("="*60)
-            firewall.configure_firewall(rules_path_arg=args.rules)
+            results.append(run_firewall(args))
         
         elif args.mode == "both":
+            run_preflight(args)
             print("="*60)
             print("        STEP 1/2: NETWORK CONFIGURATION")
             print("="*60)
-            netplan_utils.configure_network()
+            results.append(run_network(args, inventory))
             
             print("\n" + "="*60)
             print("        STEP 2/2: FIREWALL CONFIGURATION")
             print("="*60)
-            firewall.configure_firewall(rules_path_arg=args.rules)
+            results.append(run_firewall(args))
+        
+        if args.router_profile:
+            run_router_profile(args)
+        if args.balance_irqs:
+            run_balance_irqs(args)
+        if args.fastpath:
+            results.append(run_fastpath(args))
+        if args.query:
+            run_query(args)
+        if args.profile is not None and args.mode in ("firewall", "both"):
+            run_profile(args)
+        
+        # Nothing to do anywhere → distinct exit code for scripts and CI
+        if all(r == apply_state.UNCHANGED for r in results):
+            print("\n" + "="*60)
+            print("        NO CHANGES: DESIRED STATE ALREADY APPLIED")
+            print("="*60 + "\n")
+            sys.exit(EXIT_NO_CHANGES)
         
         print("\n" + "="*60)
         print("        OPERATION COMPLETED SUCCESSFULLY")
@@ -265,6 +1050,10 @@ def main():
         traceback.print_exc()
         print("-" * 60 + "\n")
         sys.exit(1)
+    
+    finally:
+        if not (args.agent or args.watch):
+            report_metrics(args)
 
 
 # STEP 7: Entry Point
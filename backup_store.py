@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+"""
+Backup Store Module
+
+Keeps previous netplan and nftables states outside /etc, stored once per
+distinct content:
+
+    /var/lib/assignment2/backups/
+        objects/<sha256[:2]>/<sha256>    file contents, written once
+        index.json                       {"netplan": [entry, ...], "nftables": [...]}
+
+Each index entry is {"sha256", "saved_at", "epoch", "size"}; lists are kept
+newest first so that "the n-th previous state" is a single list lookup.
+Saving content identical to the newest entry only refreshes its timestamp.
+Retention evicts entries beyond a count or older than an age, and objects
+no longer referenced by any entry are deleted.
+
+References:
+    - Content-addressable storage (git objects): https://git-scm.com/book/en/v2/Git-Internals-Git-Objects
+    - Python hashlib: https://docs.python.org/3/library/hashlib.html
+    - Python os.replace: https://docs.python.org/3/library/os.html#os.replace
+"""
+
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import apply_state
+import executor
+
+STORE_DIR = os.path.join(apply_state.STATE_DIR, "backups")
+OBJECTS_DIR = os.path.join(STORE_DIR, "objects")
+INDEX_FILE = os.path.join(STORE_DIR, "index.json")
+KINDS = ("netplan", "nftables")
+
+# Retention defaults; the CLI can override them with set_retention()
+KEEP_COUNT = 20
+MAX_AGE_DAYS = 90
+
+_retention = {"count": KEEP_COUNT, "days": MAX_AGE_DAYS}
+
+
+def set_retention(count=None, days=None):
+    """
+    Change how many backups are kept per kind and for how long.
+    None leaves a limit unchanged; 0 disables it.
+    """
+    if count is not None:
+        _retention["count"] = count
+    if days is not None:
+        _retention["days"] = days
+
+
+def object_path(sha):
+    """Return the path of the object holding content with this hash."""
+    return os.path.join(OBJECTS_DIR, sha[:2], sha)
+
+
+def load_index():
+    """Return the index mapping kind -> entries (newest first)."""
+    try:
+        with open(INDEX_FILE) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    for kind in KINDS:
+        index.setdefault(kind, [])
+    return index
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _save_index(index):
+    _write_atomic(INDEX_FILE, json.dumps(index, indent=2, sort_keys=True).encode())
+
+
+def _store_object(chunks):
+    """Write content given as byte chunks, hashing it on the way; returns (sha, size)."""
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=OBJECTS_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        sha = digest.hexdigest()
+        path = object_path(sha)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return sha, size
+
+
+def _add_entry(index, kind, sha, size, epoch):
+    entries = index[kind]
+    stamp = datetime.fromtimestamp(epoch).isoformat(timespec="seconds")
+    if entries and entries[0]["sha256"] == sha:
+        # same content as the newest backup: nothing new to keep
+        entries[0].update(saved_at=stamp, epoch=epoch)
+        return False
+    entries.insert(0, {"sha256": sha, "saved_at": stamp, "epoch": epoch, "size": size})
+    entries.sort(key=lambda e: e["epoch"], reverse=True)
+    return True
+
+
+def apply_retention(index, now=None):
+    """
+    Evict entries over the count limit or older than the age limit (the
+    newest entry of each kind is always kept), then delete objects that
+    no entry references any more.
+
+    Returns:
+        int: number of entries evicted
+    """
+    now = time.time() if now is None else now
+    count, days = _retention["count"], _retention["days"]
+    evicted = 0
+    for kind in KINDS:
+        entries = index[kind]
+        keep = entries[:count] if count else list(entries)
+        if days:
+            cutoff = now - days * 86400
+            keep = keep[:1] + [e for e in keep[1:] if e["epoch"] >= cutoff]
+        evicted += len(entries) - len(keep)
+        index[kind] = keep
+
+    referenced = {e["sha256"] for kind in KINDS for e in index[kind]}
+    for path in glob.glob(os.path.join(OBJECTS_DIR, "??", "*")):
+        if os.path.basename(path) not in referenced and not path.endswith(".tmp"):
+            os.remove(path)
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # directory still holds other objects
+    return evicted
+
+
+def save(kind, data, epoch=None):
+    """
+    Store one state of the given kind.
+
+    Args:
+        kind (str): "netplan" or "nftables"
+        data (bytes or str): the content to keep
+
+    Returns:
+        str: the content hash
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return save_stream(kind, [data], epoch)
+
+
+def save_stream(kind, chunks, epoch=None):
+    """
+    Store one state given as an iterable of byte chunks, written to the
+    store as they arrive (for content too large to hold in memory).
+
+    Returns:
+        str: the content hash
+    """
+    index = load_index()
+    sha, size = _store_object(chunks)
+    _add_entry(index, kind, sha, size, time.time() if epoch is None else epoch)
+    apply_retention(index)
+    _save_index(index)
+    return sha
+
+
+def save_file(kind, path):
+    """Store the current contents of a file; returns the hash or None if missing."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return save(kind, data)
+
+
+def import_legacy_backups(path):
+    """
+    Move old '<path>.bak-YYYYmmdd-HHMMSS' copies into the store and remove
+    them from their directory (netplan reads every file there).
+
+    Returns:
+        int: number of legacy files imported
+    """
+    legacy = sorted(glob.glob(glob.escape(path) + ".bak-*"))
+    if not legacy:
+        return 0
+    index = load_index()
+    for old in legacy:
+        try:
+            stamp = datetime.strptime(old.rsplit(".bak-", 1)[1], "%Y%m%d-%H%M%S")
+            epoch = stamp.timestamp()
+        except ValueError:
+            epoch = os.path.getmtime(old)
+        with open(old, "rb") as f:
+            sha, size = _store_object(iter(lambda: f.read(1 << 20), b""))
+        _add_entry(index, "netplan", sha, size, epoch)
+    apply_retention(index)
+    _save_index(index)
+    for old in legacy:
+        os.remove(old)
+    return len(legacy)
+
+
+def entries(kind):
+    """Return the backups of one kind, newest first."""
+    return load_index()[kind]
+
+
+def get(kind, n):
+    """
+    Return (entry, content bytes) for the n-th most recent backup (1-based).
+
+    Raises:
+        IndexError: if there is no such backup
+    """
+    items = load_index()[kind]
+    if not 1 <= n <= len(items):
+        raise IndexError(f"no {kind} backup #{n} ({len(items)} available)")
+    entry = items[n - 1]
+    with open(object_path(entry["sha256"]), "rb") as f:
+        return entry, f.read()
+
+
+def print_backups(kind):
+    """Print the backups of one kind in the numbering --rollback uses."""
+    items = entries(kind)
+    print(f"{kind} backups ({len(items)}):")
+    for n, entry in enumerate(items, 1):
+        print(f"  {n:3d}) {entry['saved_at']}  {entry['sha256'][:12]}  {entry['size']} bytes")
+
+
+def restore_netplan(n, netplan_file):
+    """
+    Put the n-th most recent netplan backup back in place and apply it.
+    The current file is saved first, so a rollback can be rolled back.
+
+    Returns:
+        bool: True if the file was restored and 'netplan apply' succeeded
+    """
+    entry, data = get("netplan", n)
+    save_file("netplan", netplan_file)
+    print(f"Restoring {netplan_file} from backup #{n} ({entry['saved_at']})...")
+    _write_atomic(netplan_file, data)
+    os.chmod(netplan_file, 0o600)
+    try:
+        executor.run(["netplan", "apply"])
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not run 'netplan apply': {executor.describe(e)}")
+        return False
+    apply_state.record("netplan", path=netplan_file, sha256=entry["sha256"])
+    return True
+
+
+def save_live_ruleset():
+    """
+    Store the kernel's current nftables ruleset, streamed from 'nft list
+    ruleset' into the store; returns the hash or None.
+    """
+    try:
+        return save_stream("nftables", executor.iter_lines(["nft", "list", "ruleset"], text=False))
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Warning: could not back up the live nftables ruleset: {e}")
+        return None
+
+
+def restore_nftables(n):
+    """
+    Replace the live ruleset with the n-th most recent backup in one
+    transaction, saving the current ruleset first. The live ruleset then
+    no longer comes from the recorded rules files, so their record is
+    dropped: re-applying one is a real change, and --watch does not take
+    the rollback for drift.
+
+    Returns:
+        bool: True if nft accepted the restored ruleset
+    """
+    entry, data = get("nftables", n)
+    save_live_ruleset()
+    print(f"Restoring nftables ruleset from backup #{n} ({entry['saved_at']})...")
+    try:
+        executor.run(["nft", "-f", "-"], input=b"flush ruleset\n" + data, text=False)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Error restoring nftables ruleset (nothing was changed): {executor.describe(e)}")
+        return False
+    apply_state.forget("nftables")
+    return True
+
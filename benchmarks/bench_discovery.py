@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Discovery Benchmark
+
+Compares the legacy subprocess path ('ip -br addr' plus one
+'ip -4 addr show dev <iface>' per interface) with the one-pass
+discovery backend in discovery.py.
+
+Usage:
+    python3 benchmarks/bench_discovery.py [--rounds N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discovery  # noqa: E402
+import network_core  # noqa: E402
+
+
+def legacy_discovery():
+    """Reproduce the old per-interface 'ip' scraping."""
+    result = {}
+    for line in network_core.run_cmd(["ip", "-br", "addr"]).splitlines():
+        parts = line.split()
+        if not parts or parts[0] == "lo":
+            continue
+        name = parts[0].split("@", 1)[0]
+        output = network_core.run_cmd(["ip", "-4", "addr", "show", "dev", name])
+        result[name] = [l.split()[1] for l in output.splitlines()
+                        if l.strip().startswith("inet ")]
+    return result
+
+
+def time_it(func, rounds):
+    """Return (total_seconds, per_call_ms) for calling func rounds times."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    total = time.perf_counter() - start
+    return total, total / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interface discovery benchmark")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    count = len(discovery.discover_interfaces())
+    print(f"Interfaces on this host: {count}, rounds: {args.rounds}\n")
+
+    rows = [
+        ("subprocess (ip -br + ip -4 per iface)", legacy_discovery),
+        ("rtnetlink", discovery._discover_netlink),
+        ("sysfs + ip -j", discovery._discover_sysfs),
+    ]
+    for label, func in rows:
+        try:
+            total, per_call = time_it(func, args.rounds)
+        except Exception as e:
+            print(f"{label:40s}  failed: {e}")
+            continue
+        print(f"{label:40s}  {per_call:9.3f} ms/call  ({total:.2f}s total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark Fixtures
+
+Builds a fake system in a scratch directory so the benchmarks run
+without root, real NICs or a kernel ruleset:
+
+    <root>/sys/class/net/<iface>/{ifindex,mtu,operstate,address,flags}
+    <root>/sys/class/net/<iface>/{device,speed,queues/rx-N,queues/tx-N}
+    <root>/sys/devices/system/cpu/online, <root>/sys/devices/system/node/nodeN/cpulist
+    <root>/proc/{cpuinfo,meminfo,interrupts}, <root>/proc/irq/N/smp_affinity_list
+    <root>/bin/{ip,netplan,networkctl,nft,sysctl,systemctl}   stub commands
+    <root>/fixtures/commands.json                   command line -> output file
+    <root>/fixtures/*.out                           recorded outputs
+
+The stubs print the recorded output for a known command line, swallow
+stdin for '-f -' / '-batch -' style input, and succeed silently for
+anything else (an apply that changes nothing).
+
+Everything is generated deterministically from the requested sizes, so
+two runs on the same machine measure the same work. Outputs recorded on
+a real host with 'run_benchmarks.py --record DIR' can be used instead.
+
+References:
+    - sysfs-class-net: https://www.kernel.org/doc/Documentation/ABI/testing/sysfs-class-net
+    - ip(8) JSON output: https://man7.org/linux/man-pages/man8/ip.8.html
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+
+FAKE_COMMANDS = ("ip", "netplan", "networkctl", "nft", "sysctl", "systemctl")
+
+_STUB = '''#!{python}
+import json, os, sys
+name = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+if "-" in args:
+    sys.stdin.buffer.read()
+fixtures = os.environ.get("FAKE_FIXTURES", {fixtures!r})
+with open(os.path.join(fixtures, "commands.json")) as f:
+    commands = json.load(f)
+out = commands.get(" ".join([name] + args))
+if out:
+    with open(os.path.join(fixtures, out), "rb") as f:
+        sys.stdout.buffer.write(f.read())
+'''
+
+
+def interface_names(count):
+    """Return `count` interface names: lo, then eth0.., then VLANs on eth0."""
+    names = ["lo"]
+    eths = max(1, min(count - 1, (count - 1) // 2 or 1))
+    names += [f"eth{i}" for i in range(eths)]
+    names += [f"eth0.{vid}" for vid in range(1, count - len(names) + 1)]
+    return names[:count]
+
+
+def make_interfaces(count):
+    """Return fake discovery records for `count` links (lo included)."""
+    records = []
+    for index, name in enumerate(interface_names(count), start=1):
+        loopback = name == "lo"
+        records.append({
+            "index": index,
+            "name": name,
+            "state": "UNKNOWN" if loopback else "UP",
+            "mtu": 65536 if loopback else 1500,
+            "mac": "00:00:00:00:00:00" if loopback else f"02:00:00:{index >> 16 & 255:02x}:"
+                                                        f"{index >> 8 & 255:02x}:{index & 255:02x}",
+            "loopback": loopback,
+            "up": True,
+            "ipv4": ["127.0.0.1/8"] if loopback else [f"10.{index >> 8 & 255}.{index & 255}.1/24"],
+            "ipv6": ["::1/128"] if loopback else [],
+        })
+    return records
+
+
+def write_sysfs(root, records):
+    """Write a /sys/class/net tree for the records; returns its path."""
+    base = os.path.join(root, "sys", "class", "net")
+    for rec in records:
+        path = os.path.join(base, rec["name"])
+        os.makedirs(path, exist_ok=True)
+        flags = 0x1 | (0x8 if rec["loopback"] else 0x1000)
+        for attr, value in (("ifindex", rec["index"]), ("mtu", rec["mtu"]),
+                            ("operstate", rec["state"].lower()), ("address", rec["mac"]),
+                            ("flags", hex(flags))):
+            with open(os.path.join(path, attr), "w") as f:
+                f.write(f"{value}\n")
+    return base
+
+
+def write_hardware(root, records, cpus=8, mem_kb=16 * 1024 * 1024, queues=4, speed=10000, nodes=1):
+    """
+    Write the CPU, memory, NUMA, interrupt and NIC queue files the router
+    profile and the IRQ balancer read. Every ethN link gets a 'device'
+    directory (so it counts as physical) on NUMA node N % nodes, `queues`
+    rx and tx queues with one IRQ each ('ethN-TxRx-Q', all on CPU0) and a
+    link speed in Mbit/s.
+    """
+    cpu_dir = os.path.join(root, "sys", "devices", "system", "cpu")
+    proc = os.path.join(root, "proc")
+    os.makedirs(cpu_dir, exist_ok=True)
+    os.makedirs(proc, exist_ok=True)
+    with open(os.path.join(cpu_dir, "online"), "w") as f:
+        f.write(f"0-{cpus - 1}\n" if cpus > 1 else "0\n")
+    with open(os.path.join(proc, "cpuinfo"), "w") as f:
+        f.write("".join(f"processor\t: {i}\n\n" for i in range(cpus)))
+    with open(os.path.join(proc, "meminfo"), "w") as f:
+        f.write(f"MemTotal:       {mem_kb} kB\nMemFree:        {mem_kb // 2} kB\n")
+    per_node = max(1, cpus // nodes)
+    for node in range(nodes):
+        path = os.path.join(root, "sys", "devices", "system", "node", f"node{node}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "cpulist"), "w") as f:
+            f.write(f"{node * per_node}-{min(cpus, (node + 1) * per_node) - 1}\n")
+
+    lines = ["    " + "".join(f"{f'CPU{c}':>11s}" for c in range(cpus))]
+    irq = 40
+    nics = [rec for rec in records if not rec["loopback"] and "." not in rec["name"]]
+    for i, rec in enumerate(nics):
+        path = os.path.join(root, "sys", "class", "net", rec["name"])
+        os.makedirs(os.path.join(path, "device"), exist_ok=True)
+        with open(os.path.join(path, "device", "numa_node"), "w") as f:
+            f.write(f"{i % nodes}\n")
+        for q in range(queues):
+            for kind in ("rx", "tx"):
+                os.makedirs(os.path.join(path, "queues", f"{kind}-{q}"), exist_ok=True)
+            counts = "".join(f"{(1000 * (q + 1) if c == 0 else 0):11d}" for c in range(cpus))
+            lines.append(f"{irq:3d}:{counts}  PCI-MSIX-0000:00:{i:02x}.0 {q}-edge      {rec['name']}-TxRx-{q}")
+            irq_dir = os.path.join(proc, "irq", str(irq))
+            os.makedirs(irq_dir, exist_ok=True)
+            with open(os.path.join(irq_dir, "smp_affinity_list"), "w") as f:
+                f.write("0\n")
+            irq += 1
+        with open(os.path.join(path, "speed"), "w") as f:
+            f.write(f"{speed}\n")
+    lines.append("NMI:" + "".join(f"{0:11d}" for c in range(cpus)) + "   Non-maskable interrupts")
+    with open(os.path.join(proc, "interrupts"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def ip_addr_json(records):
+    """Render the records the way 'ip -j addr show' prints them."""
+    out = []
+    for rec in records:
+        addr_info = []
+        for family, key in (("inet", "ipv4"), ("inet6", "ipv6")):
+            for cidr in rec[key]:
+                local, prefix = cidr.split("/")
+                addr_info.append({"family": family, "local": local, "prefixlen": int(prefix)})
+        out.append({"ifindex": rec["index"], "ifname": rec["name"], "mtu": rec["mtu"],
+                    "operstate": rec["state"], "address": rec["mac"], "addr_info": addr_info})
+    return json.dumps(out)
+
+
+def desired_state(count):
+    """Return a valid desired-state mapping with `count` interfaces."""
+    names = [n for n in interface_names(count + 1) if n != "lo"]
+    state = {"renderer": "networkd", "ethernets": {}, "vlans": {}}
+    for i, name in enumerate(names):
+        conf = {"addresses": [f"10.{i >> 8 & 255}.{i & 255}.1/24"], "mtu": 1500}
+        if "." in name:
+            conf.update(id=int(name.split(".")[1]), link="eth0")
+            state["vlans"][name] = conf
+        else:
+            if i == 0:
+                conf.update(gateway="10.0.0.254", nameservers=["1.1.1.1", "9.9.9.9"])
+            state["ethernets"][name] = conf
+    return state
+
+
+INVENTORY_TEMPLATE = """table inet filter {
+\tchain input {
+\t\ttype filter hook input priority filter; policy drop;
+\t\tct state established,related accept
+\t\tiif "lo" accept
+\t\tip saddr $allowed tcp dport $ssh_port accept
+\t\tmeta l4proto icmp accept
+\t}
+}
+"""
+
+
+def write_inventory(directory, hosts, interfaces=4):
+    """
+    Write an inventory of `hosts` hosts with `interfaces` ethernets each
+    (see inventory_render.py) and its rule template; returns its path.
+    """
+    os.makedirs(os.path.join(directory, "templates"), exist_ok=True)
+    with open(os.path.join(directory, "templates", "base.nft"), "w") as f:
+        f.write(INVENTORY_TEMPLATE)
+    inventory = {"defaults": {"renderer": "networkd", "rules": "base", "vars": {"ssh_port": 22}},
+                 "templates": {"base": "templates/base.nft"}, "hosts": {}}
+    for h in range(hosts):
+        ethernets = {}
+        for i in range(interfaces):
+            ethernets[f"eth{i}"] = {"addresses": [f"10.{i}.{h >> 8 & 255}.{h & 255 or 1}/16"],
+                                    "mtu": 1500}
+        ethernets["eth0"].update(gateway="10.0.255.254", nameservers=["1.1.1.1"])
+        inventory["hosts"][f"host{h:05d}"] = {
+            "network": {"ethernets": ethernets},
+            "vars": {"allowed": [f"10.{h >> 8 & 255}.0.0/16", "192.168.0.0/24"]},
+        }
+    path = os.path.join(directory, "inventory.json")
+    with open(path, "w") as f:
+        json.dump(inventory, f)
+    return path
+
+
+def ruleset_lines(lines, handles=False, change_every=0):
+    """
+    Yield a ruleset of roughly `lines` lines: one inet table whose input
+    chain jumps to block chains of 1000 rules each.
+
+    Args:
+        handles (bool): append '# handle N' like 'nft -a list ruleset'
+        change_every (int): alter every n-th rule (a "live" copy that
+            differs from the file); 0 keeps them identical
+    """
+    handle = [0]
+
+    def h():
+        handle[0] += 1
+        return f" # handle {handle[0]}" if handles else ""
+
+    blocks = max(1, lines // 1000)
+    per_block = max(1, (lines - 8 - 3 * blocks) // blocks)
+    yield "table inet filter {" + h()
+    yield "\tchain input {" + h()
+    yield "\t\ttype filter hook input priority filter; policy drop;"
+    yield "\t\tct state established,related accept" + h()
+    for b in range(blocks):
+        yield f"\t\tjump blk{b}" + h()
+    yield "\t}"
+    n = 0
+    for b in range(blocks):
+        yield f"\tchain blk{b} {{" + h()
+        for r in range(per_block):
+            n += 1
+            port = 1024 + n % 50000
+            verdict = "drop" if change_every and n % change_every == 0 else "accept"
+            yield (f"\t\tip saddr 10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255} "
+                   f"tcp dport {port} {verdict}" + h())
+        yield "\t}"
+    yield "}"
+
+
+def write_ruleset_json(path, lines):
+    """
+    Write the ruleset_lines() ruleset the way 'nft -j list ruleset' prints
+    it (handles included, one line), plus a named set of blocked networks
+    matched from the input chain. Returns the number of rules.
+    """
+    objects = [{"metainfo": {"version": "1.0.9", "json_schema_version": 1}},
+               {"table": {"family": "inet", "name": "filter", "handle": 1}}]
+    handle = [1]
+
+    def h():
+        handle[0] += 1
+        return handle[0]
+
+    def rule(chain, *exprs):
+        objects.append({"rule": {"family": "inet", "table": "filter", "chain": chain,
+                                 "handle": h(), "expr": list(exprs)}})
+
+    def match(proto, field, right):
+        return {"match": {"op": "==", "left": {"payload": {"protocol": proto, "field": field}},
+                          "right": right}}
+
+    blocks = max(1, lines // 1000)
+    per_block = max(1, (lines - 8 - 3 * blocks) // blocks)
+    objects.append({"set": {"family": "inet", "table": "filter", "name": "blocked",
+                            "type": "ipv4_addr", "flags": ["interval"], "handle": h(),
+                            "elem": [{"prefix": {"addr": f"192.0.{i}.0", "len": 24}}
+                                     for i in range(64)]}})
+    objects.append({"chain": {"family": "inet", "table": "filter", "name": "input", "handle": h(),
+                              "type": "filter", "hook": "input", "prio": 0, "policy": "drop"}})
+    rule("input", {"match": {"op": "in", "left": {"ct": {"key": "state"}},
+                             "right": ["established", "related"]}}, {"accept": None})
+    rule("input", match("ip", "saddr", "@blocked"), {"counter": {"packets": 0, "bytes": 0}},
+         {"drop": None})
+    for b in range(blocks):
+        rule("input", {"jump": {"target": f"blk{b}"}})
+    n = 0
+    for b in range(blocks):
+        objects.append({"chain": {"family": "inet", "table": "filter", "name": f"blk{b}",
+                                  "handle": h()}})
+        for _ in range(per_block):
+            n += 1
+            rule(f"blk{b}", match("ip", "saddr", f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"),
+                 match("tcp", "dport", 1024 + n % 50000), {"accept": None})
+    with open(path, "w") as f:
+        json.dump({"nftables": objects}, f, separators=(",", ":"))
+    return n + 2 + blocks
+
+
+def write_ruleset(path, lines, **kwargs):
+    """Write ruleset_lines() to a file; returns the number of lines written."""
+    count = 0
+    with open(path, "w") as f:
+        for line in ruleset_lines(lines, **kwargs):
+            f.write(line + "\n")
+            count += 1
+    return count
+
+
+class FakeSystem:
+    """
+    A scratch root with a fake /sys/class/net, recorded command outputs and
+    stub commands on PATH.
+
+        fake = FakeSystem(tmpdir)
+        fake.set_interfaces(make_interfaces(256))
+        with fake.active():
+            ...
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.bin = os.path.join(root, "bin")
+        self.fixtures = os.path.join(root, "fixtures")
+        self.commands = {}
+        os.makedirs(self.bin, exist_ok=True)
+        os.makedirs(self.fixtures, exist_ok=True)
+        for name in FAKE_COMMANDS:
+            path = os.path.join(self.bin, name)
+            with open(path, "w") as f:
+                f.write(_STUB.format(python=sys.executable, fixtures=self.fixtures))
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        self._save()
+        self.sys_class_net = os.path.join(root, "sys", "class", "net")
+
+    def _save(self):
+        with open(os.path.join(self.fixtures, "commands.json"), "w") as f:
+            json.dump(self.commands, f, indent=1)
+
+    def record(self, command, output):
+        """Make the stub for `command` (a string) print `output`."""
+        name = f"{len(self.commands)}.out"
+        with open(os.path.join(self.fixtures, name), "w") as f:
+            f.write(output)
+        self.commands[command] = name
+        self._save()
+
+    def record_file(self, command, path):
+        """Make the stub for `command` print the contents of an existing file."""
+        self.commands[command] = os.path.abspath(path)
+        self._save()
+
+    def set_interfaces(self, records):
+        """Replace the fake links and the 'ip -j addr show' output."""
+        shutil.rmtree(self.sys_class_net, ignore_errors=True)
+        write_sysfs(self.root, records)
+        self.record("ip -j addr show", ip_addr_json(records))
+
+    def load_recorded(self, directory):
+        """Use outputs recorded on a real host (see run_benchmarks.py --record)."""
+        with open(os.path.join(directory, "commands.json")) as f:
+            for command, name in json.load(f).items():
+                self.record_file(command, os.path.join(directory, name))
+
+    def active(self):
+        """Context manager that puts the stubs first on PATH."""
+        return _Env({"PATH": self.bin + os.pathsep + os.environ.get("PATH", ""),
+                     "FAKE_FIXTURES": self.fixtures})
+
+
+class _Env:
+    def __init__(self, values):
+        self.values = values
+        self.saved = {}
+
+    def __enter__(self):
+        for key, value in self.values.items():
+            self.saved[key] = os.environ.get(key)
+            os.environ[key] = value
+        return self
+
+    def __exit__(self, *exc):
+        for key, value in self.saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark Suite
+
+Measures the tool's hot paths against a fake system (see fixtures.py),
+so it runs without root and gives the same numbers on every run:
+
+    discovery      /sys/class/net walk + stubbed 'ip -j addr show'
+    generate       desired state -> netplan YAML (model + serializer)
+    validate       desired-state validation (structure, addresses, subnets, gateways)
+    plan           parse old/new netplan YAML and pick the targeted interfaces
+    router_profile read CPUs, memory and NIC queues, compute the sysctl profile
+    fastpath       render the flowtable fast path over every link, parse and diff it
+    nft_check      include expansion + syntax check of a rules file
+    nft_stream     streaming a rules file into a stubbed 'nft -c -f -'
+    nft_delta      parse file + stubbed live ruleset, diff, render the delta
+    nft_query      index a stubbed 'nft -j list ruleset', answer an address query
+    render         render an inventory (netplan + nft per host) in one process, no cache
+    fleet          roll a rendered inventory out to local stand-in hosts (payload
+                   packing, unpacking and scheduling; the host command is a no-op)
+
+Interface counts go from 2 to 4096, rulesets from 1k to 1M lines and
+inventories from 16 to 2048 hosts.
+Every case runs --repeat times and keeps the fastest run. Results are
+compared with a stored baseline (benchmarks/baseline.json); a case whose
+throughput drops by more than --threshold is reported as a regression.
+
+Usage:
+    python3 benchmarks/run_benchmarks.py                 # full suite, compare
+    python3 benchmarks/run_benchmarks.py --quick         # small sizes only
+    python3 benchmarks/run_benchmarks.py --only nft_     # cases by prefix
+    python3 benchmarks/run_benchmarks.py --save-baseline
+    python3 benchmarks/run_benchmarks.py --check         # exit 1 on regression
+    python3 benchmarks/run_benchmarks.py --record DIR    # capture real outputs (root)
+    python3 benchmarks/run_benchmarks.py --fixtures DIR  # use captured outputs
+
+References:
+    - Python time.perf_counter: https://docs.python.org/3/library/time.html#time.perf_counter
+    - pyperf, on benchmark noise: https://pyperf.readthedocs.io/en/latest/system.html
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import desired_state  # noqa: E402
+import discovery  # noqa: E402
+import fleet  # noqa: E402
+import inventory_render  # noqa: E402
+import netplan_apply  # noqa: E402
+import netplan_model  # noqa: E402
+import netplan_utils  # noqa: E402
+import nft_flowtable  # noqa: E402
+import nft_loader  # noqa: E402
+import nft_query  # noqa: E402
+import nft_ruleset  # noqa: E402
+import sysctl_profile  # noqa: E402
+from fixtures import (FakeSystem, desired_state as make_state, make_interfaces,  # noqa: E402
+                      write_hardware, write_inventory, write_ruleset, write_ruleset_json)
+
+BASELINE_FILE = os.path.join(HERE, "baseline.json")
+INTERFACE_COUNTS = (2, 16, 256, 1024, 4096)
+RULESET_LINES = (1000, 10000, 100000, 1000000)
+QUICK_INTERFACES = (2, 16, 256)
+QUICK_LINES = (1000, 10000)
+HOST_COUNTS = (16, 256, 2048)
+QUICK_HOSTS = (16, 256)
+
+# Commands captured by --record, with the fixture key the stubs answer to
+RECORD_COMMANDS = (
+    "ip -j addr show",
+    "nft -a list ruleset",
+    "nft list ruleset",
+    "sysctl -a",
+)
+
+
+def best_of(func, repeat):
+    """Run func repeat times; return (fastest seconds, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def interface_cases(fake, counts, repeat):
+    for count in counts:
+        records = make_interfaces(count)
+        fake.set_interfaces(records)
+        discovery.SYS_CLASS_NET = fake.sys_class_net
+        seconds, found = best_of(discovery._discover_sysfs, repeat)
+        assert len(found) == count, f"discovered {len(found)} of {count}"
+        yield "discovery", count, seconds, count, "ifaces"
+
+        state = make_state(count)
+        seconds, yaml_text = best_of(lambda: netplan_utils.build_netplan_document(state), repeat)
+        yield "generate", count, seconds, count, "ifaces"
+
+        seconds, _ = best_of(lambda: desired_state.validate(state), repeat)
+        yield "validate", count, seconds, count, "ifaces"
+
+        changed = make_state(count)
+        first = next(iter(changed["ethernets"]))
+        changed["ethernets"][first]["mtu"] = 9000
+        new_text = netplan_utils.build_netplan_document(changed)
+
+        def plan():
+            old = netplan_model.parse(yaml_text)
+            new = netplan_model.parse(new_text)
+            return netplan_apply.plan(old, new)
+        seconds, (targets, _reason) = best_of(plan, repeat)
+        assert targets == [first], targets
+        yield "plan", count, seconds, count, "ifaces"
+
+        write_hardware(fake.root, records)
+        proc, sys_root = os.path.join(fake.root, "proc"), os.path.join(fake.root, "sys")
+        seconds, _ = best_of(lambda: sysctl_profile.compute_profile(
+            sysctl_profile.read_hardware(proc, sys_root)), repeat)
+        yield "router_profile", count, seconds, count, "ifaces"
+
+        devices = [rec["name"] for rec in records if not rec["loopback"]]
+
+        def fastpath():
+            desired = nft_ruleset.parse_text(nft_flowtable.render(devices))
+            return nft_ruleset.diff_rulesets(nft_ruleset.Ruleset(), desired).script()
+        seconds, _ = best_of(fastpath, repeat)
+        yield "fastpath", count, seconds, count, "ifaces"
+
+
+def ruleset_cases(fake, sizes, repeat, workdir):
+    for size in sizes:
+        path = os.path.join(workdir, f"rules-{size}.nft")
+        lines = write_ruleset(path, size)
+        live = os.path.join(workdir, f"live-{size}.nft")
+        write_ruleset(live, size, handles=True, change_every=100)
+        fake.record_file("nft -a list ruleset", live)
+
+        seconds, _ = best_of(lambda: nft_loader.check_file(path), repeat)
+        yield "nft_check", size, seconds, lines, "lines"
+
+        def stream():
+            result = nft_loader.stream_load(path, check_only=True)
+            assert result["ok"], result["error"]
+        seconds, _ = best_of(stream, repeat)
+        yield "nft_stream", size, seconds, lines, "lines"
+
+        def delta():
+            desired = nft_ruleset.load_ruleset(path)
+            delta = nft_ruleset.diff_rulesets(nft_ruleset.load_live_ruleset(), desired)
+            return delta.script()
+        # the two largest parses are slow; one run is enough to spot a regression
+        seconds, _ = best_of(delta, repeat if size <= 100000 else 1)
+        yield "nft_delta", size, seconds, lines, "lines"
+
+        live_json = os.path.join(workdir, f"live-{size}.json")
+        rules = write_ruleset_json(live_json, size)
+        fake.record_file("nft -j list ruleset", live_json)
+
+        def query():
+            index, _cached = nft_query.load_index(use_cache=False)
+            return nft_query.run_query(index, "10.0.0.1:22")
+        seconds, _ = best_of(query, repeat if size <= 100000 else 1)
+        yield "nft_query", size, seconds, rules, "rules"
+
+
+def inventory_cases(hosts, repeat, workdir):
+    for count in hosts:
+        directory = os.path.join(workdir, f"inventory-{count}")
+        path = write_inventory(directory, count)
+        output = os.path.join(directory, "out")
+
+        def render():
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = inventory_render.render(path, output, jobs=1, force=True)
+            assert result["failed"] == 0, result
+        seconds, _ = best_of(render, repeat)
+        yield "render", count, seconds, count, "hosts"
+
+        transport = fleet.LocalTransport(os.path.join(directory, "hosts"))
+
+        def rollout():
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = fleet.deploy(path, output, transport, wave_size=0, canary=0,
+                                      command="exit 3")
+            assert result["counts"]["unchanged"] == count, result["counts"]
+        seconds, _ = best_of(rollout, repeat)
+        yield "fleet", count, seconds, count, "hosts"
+
+
+def record(directory):
+    """Capture real command outputs into a fixture directory (needs root)."""
+    os.makedirs(directory, exist_ok=True)
+    commands = {}
+    for i, command in enumerate(RECORD_COMMANDS):
+        try:
+            output = subprocess.check_output(command.split(), text=True, timeout=60)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"skipped '{command}': {e}")
+            continue
+        name = f"{i}.out"
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(output)
+        commands[command] = name
+        print(f"recorded '{command}' ({len(output)} bytes)")
+    with open(os.path.join(directory, "commands.json"), "w") as f:
+        json.dump(commands, f, indent=1)
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark suite with fake system fixtures")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--only", metavar="PREFIX", help="run only cases whose name starts with PREFIX")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, fastest kept (default: 3)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="throughput drop that counts as a regression (default: 0.25)")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on any regression")
+    parser.add_argument("--record", metavar="DIR", help="record real command outputs and exit")
+    parser.add_argument("--fixtures", metavar="DIR", help="use outputs recorded with --record")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.record:
+        record(args.record)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    results, regressions = {}, []
+    print(f"Python {platform.python_version()} on {platform.machine()}, "
+          f"best of {args.repeat}\n")
+    print(f"{'case':14s} {'size':>8s} {'time':>12s} {'throughput':>18s}  {'vs baseline':>11s}")
+
+    with tempfile.TemporaryDirectory(prefix="a2-bench-") as workdir:
+        fake = FakeSystem(workdir)
+        if args.fixtures:
+            fake.load_recorded(args.fixtures)
+        counts = QUICK_INTERFACES if args.quick else INTERFACE_COUNTS
+        sizes = QUICK_LINES if args.quick else RULESET_LINES
+        hosts = QUICK_HOSTS if args.quick else HOST_COUNTS
+        with fake.active():
+            for case, size, seconds, units, unit in _all_cases(fake, counts, sizes, hosts, args,
+                                                                workdir):
+                key = f"{case}/{size}"
+                rate = units / seconds if seconds else float("inf")
+                results[key] = {"seconds": round(seconds, 6), "per_second": round(rate, 1)}
+                note = ""
+                if key in baseline:
+                    change = rate / baseline[key]["per_second"] - 1
+                    note = f"{change:+10.1%}"
+                    if change < -args.threshold:
+                        note += "  REGRESSION"
+                        regressions.append(key)
+                print(f"{case:14s} {size:8d} {seconds * 1000:9.2f} ms {rate:13,.0f} {unit}/s  {note}")
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(sorted(merged.items())), f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+
+def _all_cases(fake, counts, sizes, hosts, args, workdir):
+    for item in interface_cases(fake, counts, args.repeat):
+        if not args.only or item[0].startswith(args.only):
+            yield item
+    for item in ruleset_cases(fake, sizes, args.repeat, workdir):
+        if not args.only or item[0].startswith(args.only):
+            yield item
+    for item in inventory_cases(hosts, args.repeat, workdir):
+        if not args.only or item[0].startswith(args.only):
+            yield item
+
+
+if __name__ == "__main__":
+    sys.exit(main())
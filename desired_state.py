@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+Desired-State Module
+
+Loads and validates a desired-state file that describes every ethernet,
+VLAN, bond and bridge of a host, so that the whole network can be
+configured in one pass. The file is JSON (YAML is accepted too when
+PyYAML is installed) and mirrors the netplan layout:
+
+    {
+      "renderer": "networkd",
+      "ethernets": {
+        "eth0": {"dhcp4": true},
+        "eth1": {"addresses": ["10.0.0.2/24"], "gateway": "10.0.0.1",
+                 "nameservers": ["1.1.1.1"], "mtu": 9000}
+      },
+      "vlans":   {"vlan10": {"id": 10, "link": "eth1", "addresses": ["10.10.0.2/24"]}},
+      "bonds":   {"bond0": {"interfaces": ["eth2", "eth3"],
+                            "parameters": {"mode": "802.3ad"}}},
+      "bridges": {"br0": {"interfaces": ["bond0"], "dhcp4": true}}
+    }
+
+References:
+    - Netplan Reference: https://netplan.io/reference/
+    - Python json: https://docs.python.org/3/library/json.html
+    - Python ipaddress: https://docs.python.org/3/library/ipaddress.html
+"""
+
+import json
+import re
+
+import address_check
+import netplan_model
+
+try:
+    import yaml  # optional: lets the desired-state file be YAML
+except ImportError:
+    yaml = None
+
+SECTIONS = ("ethernets", "vlans", "bonds", "bridges")
+RENDERERS = ("networkd", "NetworkManager")
+COMMON_KEYS = {"dhcp4", "dhcp6", "addresses", "gateway", "gateway6", "nameservers",
+               "search", "mtu", "routes", "optional", "macaddress"}
+SECTION_KEYS = {
+    "ethernets": COMMON_KEYS | {"match", "set-name", "wakeonlan"},
+    "vlans": COMMON_KEYS | {"id", "link"},
+    "bonds": COMMON_KEYS | {"interfaces", "parameters"},
+    "bridges": COMMON_KEYS | {"interfaces", "parameters"},
+}
+IFNAME_RE = re.compile(r"^[A-Za-z0-9_.:@-]{1,15}$")
+MAC_RE = re.compile(r"^[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}$")
+
+
+class DesiredStateError(ValueError):
+    """Raised when a desired-state file is invalid; lists every problem."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def load_file(path):
+    """
+    Read a desired-state file (JSON, or YAML if PyYAML is available).
+
+    Raises:
+        OSError: if the file cannot be read
+        DesiredStateError: if it cannot be decoded
+    """
+    with open(path) as f:
+        text = f.read()
+    try:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise DesiredStateError([f"{path}: YAML input needs PyYAML; use JSON instead"])
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+    except ValueError as e:
+        raise DesiredStateError([f"{path}: {e}"]) from None
+    if not isinstance(data, dict):
+        raise DesiredStateError([f"{path}: top level must be a mapping"])
+    # accept both a bare state and one wrapped in netplan's "network" key
+    return data.get("network", data)
+
+
+def _check_address(errors, where, value, with_prefix):
+    try:
+        address_check.validate_address(value, with_prefix)
+    except ValueError as e:
+        errors.append(f"{where}: invalid address {value!r} ({e})")
+
+
+def _check_interface(errors, section, name, conf):
+    where = f"{section}.{name}"
+    if not IFNAME_RE.match(name):
+        errors.append(f"{where}: invalid interface name")
+    if not isinstance(conf, dict):
+        errors.append(f"{where}: must be a mapping")
+        return
+    for key in conf:
+        if key not in SECTION_KEYS[section]:
+            errors.append(f"{where}: unknown key '{key}'")
+    for key in ("dhcp4", "dhcp6", "optional", "wakeonlan"):
+        if key in conf and not isinstance(conf[key], bool):
+            errors.append(f"{where}.{key}: must be true or false")
+    for key in ("match", "parameters"):
+        if key in conf and not isinstance(conf[key], dict):
+            errors.append(f"{where}.{key}: must be a mapping")
+    for key in ("set-name", "link"):
+        if key in conf and not (isinstance(conf[key], str) and IFNAME_RE.match(conf[key])):
+            errors.append(f"{where}.{key}: must be an interface name")
+    if "macaddress" in conf and not (isinstance(conf["macaddress"], str)
+                                     and MAC_RE.match(conf["macaddress"])):
+        errors.append(f"{where}.macaddress: must be a MAC address like 00:11:22:33:44:55")
+    addresses = conf.get("addresses", [])
+    if not isinstance(addresses, list):
+        errors.append(f"{where}.addresses: must be a list")
+        addresses = []
+    for addr in addresses:
+        _check_address(errors, f"{where}.addresses", addr, with_prefix=True)
+    for key in ("gateway", "gateway6"):
+        if key in conf:
+            _check_address(errors, f"{where}.{key}", conf[key], with_prefix=False)
+            if not addresses:
+                errors.append(f"{where}.{key}: gateway without static addresses")
+    routes = conf.get("routes", [])
+    if not isinstance(routes, list) or \
+            not all(isinstance(r, dict) and "to" in r for r in routes):
+        errors.append(f"{where}.routes: must be a list of mappings with a 'to' key")
+    nameservers = conf.get("nameservers", [])
+    if not isinstance(nameservers, list):
+        errors.append(f"{where}.nameservers: must be a list")
+        nameservers = []
+    for ns in nameservers:
+        _check_address(errors, f"{where}.nameservers", ns, with_prefix=False)
+    search = conf.get("search", [])
+    if not isinstance(search, list) or not all(isinstance(d, str) and d for d in search):
+        errors.append(f"{where}.search: must be a list of domain names")
+    if "mtu" in conf and not (isinstance(conf["mtu"], int) and 68 <= conf["mtu"] <= 65535):
+        errors.append(f"{where}.mtu: must be an integer between 68 and 65535")
+
+
+def validate(state):
+    """
+    Validate a desired-state mapping as a whole.
+
+    Returns:
+        state (dict) with every section present
+
+    Raises:
+        DesiredStateError: listing every problem found
+    """
+    errors = []
+    state = dict(state)
+    renderer = state.setdefault("renderer", "networkd")
+    if renderer not in RENDERERS:
+        errors.append(f"renderer: must be one of {', '.join(RENDERERS)}")
+    for key in state:
+        if key not in SECTIONS + ("renderer", "version"):
+            errors.append(f"unknown top-level key '{key}'")
+
+    owner = {}
+    for section in SECTIONS:
+        entries = state.setdefault(section, {}) or {}
+        if not isinstance(entries, dict):
+            errors.append(f"{section}: must be a mapping of interface name to settings")
+            state[section] = {}
+            continue
+        state[section] = entries
+        for name, conf in entries.items():
+            if name in owner:
+                errors.append(f"{section}.{name}: already defined in {owner[name]}")
+            owner[name] = section
+            _check_interface(errors, section, name, conf)
+
+    if not owner:
+        errors.append("no interfaces defined")
+
+    for name, conf in state["vlans"].items():
+        if not isinstance(conf, dict):
+            continue
+        vid = conf.get("id")
+        if not (isinstance(vid, int) and 1 <= vid <= 4094):
+            errors.append(f"vlans.{name}.id: must be an integer between 1 and 4094")
+        link = conf.get("link")
+        if not isinstance(link, (str, type(None))):
+            continue  # reported by _check_interface
+        if link not in owner or owner[link] == "vlans":
+            errors.append(f"vlans.{name}.link: '{link}' is not a defined ethernet, bond or bridge")
+
+    member_of = {}
+    for section in ("bonds", "bridges"):
+        for name, conf in state[section].items():
+            if not isinstance(conf, dict):
+                continue
+            members = conf.get("interfaces", [])
+            if not isinstance(members, list) or (section == "bonds" and not members):
+                errors.append(f"{section}.{name}.interfaces: must be a non-empty list")
+                continue
+            for member in members:
+                if member not in owner:
+                    errors.append(f"{section}.{name}.interfaces: '{member}' is not defined")
+                elif member == name:
+                    errors.append(f"{section}.{name}.interfaces: cannot contain itself")
+                elif member in member_of:
+                    errors.append(f"{section}.{name}.interfaces: '{member}' is already "
+                                  f"a member of {member_of[member]}")
+                else:
+                    member_of[member] = name
+                    mconf = state[owner[member]].get(member)
+                    if isinstance(mconf, dict) and (mconf.get("addresses") or mconf.get("dhcp4")):
+                        errors.append(f"{section}.{name}.interfaces: member '{member}' must not "
+                                      f"carry its own addresses or DHCP")
+
+    if not errors:
+        # cross-interface checks: duplicate/overlapping subnets, gateways
+        # outside their interface's prefix (warnings are left to preflight)
+        address_errors, _warnings = address_check.check_document(netplan_model.from_dict(state))
+        errors.extend(address_errors)
+
+    if errors:
+        raise DesiredStateError(errors)
+    return state
+
+
+def load(path):
+    """Load and validate a desired-state file."""
+    return validate(load_file(path))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+"""
+Interface Discovery Module
+
+Reads every link and its IPv4/IPv6 addresses in one pass without spawning
+a process per query. The primary backend talks rtnetlink directly over an
+AF_NETLINK socket (RTM_GETLINK / RTM_GETADDR dumps). If netlink is not
+available, it falls back to /sys/class/net for link facts plus a single
+'ip -j addr' call for the addresses.
+
+References:
+    - rtnetlink(7): https://man7.org/linux/man-pages/man7/rtnetlink.7.html
+    - netlink(7): https://man7.org/linux/man-pages/man7/netlink.7.html
+    - sysfs-class-net: https://www.kernel.org/doc/Documentation/ABI/testing/sysfs-class-net
+    - Python socket: https://docs.python.org/3/library/socket.html
+    - Python struct: https://docs.python.org/3/library/struct.html
+"""
+
+import json
+import os
+import socket
+import struct
+import subprocess
+
+import executor
+
+SYS_CLASS_NET = "/sys/class/net"
+
+# netlink / rtnetlink constants (linux/netlink.h, linux/rtnetlink.h)
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_OPERSTATE = 16
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+
+NLMSG_HDR = struct.Struct("=LHHLL")     # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct("=BxHiII")    # family, type, index, flags, change
+IFADDRMSG = struct.Struct("=BBBBi")     # family, prefixlen, flags, scope, index
+RTATTR = struct.Struct("=HH")           # len, type
+
+OPERSTATES = {
+    0: "UNKNOWN",
+    1: "NOTPRESENT",
+    2: "DOWN",
+    3: "LOWERLAYERDOWN",
+    4: "TESTING",
+    5: "DORMANT",
+    6: "UP",
+}
+
+
+def _align(length):
+    """Round a netlink length up to the 4-byte boundary."""
+    return (length + 3) & ~3
+
+
+def _parse_attrs(data, offset, end):
+    """
+    Parse a run of rtattr TLVs.
+
+    Returns:
+        dict of attr_type -> raw bytes payload
+    """
+    attrs = {}
+    while offset + RTATTR.size <= end:
+        rta_len, rta_type = RTATTR.unpack_from(data, offset)
+        if rta_len < RTATTR.size:
+            break
+        attrs[rta_type] = data[offset + RTATTR.size:offset + rta_len]
+        offset += _align(rta_len)
+    return attrs
+
+
+def _cstr(raw):
+    """Decode a NUL-terminated netlink string attribute."""
+    return raw.split(b"\0", 1)[0].decode()
+
+
+def netlink_dump(msg_type, payload, sock=None):
+    """
+    Send one rtnetlink dump request and yield (type, data, offset, end)
+    for every message in the reply.
+
+    Args:
+        msg_type (int): RTM_GETLINK or RTM_GETADDR
+        payload (bytes): family header (ifinfomsg / ifaddrmsg)
+        sock (socket or None): reuse an existing NETLINK_ROUTE socket
+
+    Raises:
+        OSError: if the socket cannot be opened or the kernel returns an error
+    """
+    own = sock is None
+    if own:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        seq = 1
+        header = NLMSG_HDR.pack(NLMSG_HDR.size + len(payload), msg_type,
+                                NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.sendto(header + payload, (0, 0))
+        while True:
+            data = sock.recv(1 << 20)
+            offset = 0
+            while offset + NLMSG_HDR.size <= len(data):
+                length, ntype, _flags, _seq, _pid = NLMSG_HDR.unpack_from(data, offset)
+                if length < NLMSG_HDR.size:
+                    return
+                if ntype == NLMSG_DONE:
+                    return
+                if ntype == NLMSG_ERROR:
+                    errno = -struct.unpack_from("=i", data, offset + NLMSG_HDR.size)[0]
+                    if errno:
+                        raise OSError(errno, os.strerror(errno))
+                    return
+                yield ntype, data, offset + NLMSG_HDR.size, offset + length
+                offset += _align(length)
+    finally:
+        if own:
+            sock.close()
+
+
+def _new_record(index, name):
+    """Return an empty interface record."""
+    return {
+        "index": index,
+        "name": name,
+        "state": "UNKNOWN",
+        "mtu": None,
+        "mac": None,
+        "loopback": False,
+        "up": False,
+        "ipv4": [],
+        "ipv6": [],
+    }
+
+
+def _discover_netlink():
+    """
+    Discover links and addresses through rtnetlink.
+
+    Returns:
+        dict of name -> interface record
+    """
+    by_index = {}
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        link_req = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        for ntype, data, offset, end in netlink_dump(RTM_GETLINK, link_req, sock):
+            if ntype != RTM_NEWLINK:
+                continue
+            _family, _type, index, flags, _change = IFINFOMSG.unpack_from(data, offset)
+            attrs = _parse_attrs(data, offset + IFINFOMSG.size, end)
+            if IFLA_IFNAME not in attrs:
+                continue
+            rec = _new_record(index, _cstr(attrs[IFLA_IFNAME]))
+            rec["loopback"] = bool(flags & IFF_LOOPBACK)
+            rec["up"] = bool(flags & IFF_UP)
+            if IFLA_MTU in attrs:
+                rec["mtu"] = struct.unpack("=I", attrs[IFLA_MTU][:4])[0]
+            if IFLA_OPERSTATE in attrs:
+                rec["state"] = OPERSTATES.get(attrs[IFLA_OPERSTATE][0], "UNKNOWN")
+            if IFLA_ADDRESS in attrs:
+                rec["mac"] = ":".join(f"{b:02x}" for b in attrs[IFLA_ADDRESS])
+            by_index[index] = rec
+
+        addr_req = IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        for ntype, data, offset, end in netlink_dump(RTM_GETADDR, addr_req, sock):
+            if ntype != RTM_NEWADDR:
+                continue
+            family, prefixlen, _flags, _scope, index = IFADDRMSG.unpack_from(data, offset)
+            rec = by_index.get(index)
+            if rec is None:
+                continue
+            attrs = _parse_attrs(data, offset + IFADDRMSG.size, end)
+            raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            if raw is None:
+                continue
+            if family == socket.AF_INET:
+                rec["ipv4"].append(f"{socket.inet_ntop(socket.AF_INET, raw)}/{prefixlen}")
+            elif family == socket.AF_INET6:
+                rec["ipv6"].append(f"{socket.inet_ntop(socket.AF_INET6, raw)}/{prefixlen}")
+
+    return {rec["name"]: rec for rec in sorted(by_index.values(), key=lambda r: r["index"])}
+
+
+def _read_sys(name, attr):
+    """Read one /sys/class/net/<name>/<attr> value, or None."""
+    try:
+        with open(os.path.join(SYS_CLASS_NET, name, attr)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _discover_sysfs():
+    """
+    Discover links from /sys/class/net and addresses from one 'ip -j addr'.
+
+    Returns:
+        dict of name -> interface record
+    """
+    records = []
+    for name in os.listdir(SYS_CLASS_NET):
+        index = _read_sys(name, "ifindex")
+        rec = _new_record(int(index) if index else 0, name)
+        mtu = _read_sys(name, "mtu")
+        rec["mtu"] = int(mtu) if mtu else None
+        rec["state"] = (_read_sys(name, "operstate") or "unknown").upper()
+        rec["mac"] = _read_sys(name, "address")
+        flags = int(_read_sys(name, "flags") or "0", 16)
+        rec["loopback"] = bool(flags & IFF_LOOPBACK)
+        rec["up"] = bool(flags & IFF_UP)
+        records.append(rec)
+    by_name = {rec["name"]: rec for rec in sorted(records, key=lambda r: r["index"])}
+
+    try:
+        output = executor.check_output(["ip", "-j", "addr", "show"])
+        entries = json.loads(output or "[]")
+    except (OSError, subprocess.SubprocessError, ValueError):
+        entries = []
+    for entry in entries:
+        rec = by_name.get(entry.get("ifname"))
+        if rec is None:
+            continue
+        for info in entry.get("addr_info", []):
+            cidr = f"{info['local']}/{info['prefixlen']}"
+            if info.get("family") == "inet":
+                rec["ipv4"].append(cidr)
+            elif info.get("family") == "inet6":
+                rec["ipv6"].append(cidr)
+    return by_name
+
+
+def discover_interfaces():
+    """
+    Return every interface with its IPv4/IPv6 addresses in one pass.
+
+    Tries rtnetlink first and falls back to /sys/class/net + 'ip -j addr'.
+
+    Returns:
+        dict of name -> record, ordered by ifindex. Each record has the keys
+        index, name, state, mtu, mac, loopback, up, ipv4 (list), ipv6 (list).
+    """
+    try:
+        return _discover_netlink()
+    except OSError:
+        return _discover_sysfs()
+
+
+def read_driver(name):
+    """Return the kernel driver bound to an interface, or None for virtual links."""
+    link = os.path.join(SYS_CLASS_NET, name, "device", "driver")
+    try:
+        return os.path.basename(os.readlink(link))
+    except OSError:
+        return None
+
+
+class InterfaceInventory:
+    """
+    Memoized view of the system's interfaces for a whole run.
+
+    The first lookup scans the system once; later lookups are served from
+    the cache until invalidate() is called (e.g. after writing or applying
+    a new configuration).
+    """
+
+    def __init__(self, loader=discover_interfaces):
+        self._loader = loader
+        self._records = None
+        self._drivers = {}
+        self.scans = 0
+
+    def _load(self):
+        if self._records is None:
+            self._records = self._loader()
+            self._drivers = {}
+            self.scans += 1
+        return self._records
+
+    def invalidate(self):
+        """Drop cached facts so the next lookup rescans the system."""
+        self._records = None
+        self._drivers = {}
+
+    def records(self):
+        """Return dict of name -> interface record (see discover_interfaces)."""
+        return self._load()
+
+    def get(self, name):
+        """Return the record for one interface, or None."""
+        return self._load().get(name)
+
+    def non_loopback(self):
+        """
+        Return non-loopback interfaces in ifindex order.
+
+        Returns:
+            list of (name, ip_str) e.g. [("enp0s3", "192.168.1.10/24"), ...]
+        """
+        return [
+            (rec["name"], rec["ipv4"][0] if rec["ipv4"] else "N/A")
+            for rec in self._load().values()
+            if not rec["loopback"]
+        ]
+
+    def ipv4(self, name):
+        """Return the first IPv4 address with CIDR on an interface, or None."""
+        rec = self.get(name)
+        return rec["ipv4"][0] if rec and rec["ipv4"] else None
+
+    def mtu(self, name):
+        rec = self.get(name)
+        return rec["mtu"] if rec else None
+
+    def state(self, name):
+        rec = self.get(name)
+        return rec["state"] if rec else None
+
+    def driver(self, name):
+        """Return the interface's driver (read lazily from sysfs and cached)."""
+        if name not in self._drivers:
+            self._drivers[name] = read_driver(name) if self.get(name) else None
+        return self._drivers[name]
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+"""
+Drift Watch
+
+Watch mode ('assignment2.py --watch'): keeps what the tool last applied
+(see apply_state.py) in place when someone changes it by hand.
+
+Nothing is polled. The loop sleeps in select() on two event sources:
+
+    rtnetlink   a multicast socket on the link and address groups, so any
+                link or address change wakes it up (netplan side)
+    nftables    an 'nft monitor' child, which prints a line for every
+                ruleset change (firewall side)
+
+Events come in bursts (one 'ip addr flush' is one event per address, one
+'nft -f' can be thousands), so they are debounced: the check runs once
+the source has been quiet for DEBOUNCE seconds, or MAX_DELAY seconds
+after the first event of a burst at the latest. Only the side that had
+events is checked:
+
+    netplan     the netplan file is compared with its recorded hash (a
+                hand edit is reverted from the backup store), then every
+                interface of it with the live inventory: missing link,
+                link down, missing static address, MTU. Only the
+                interfaces that drifted are reconfigured (networkd), or
+                'netplan apply' runs on other renderers.
+    nftables    the live ruleset hash (counters ignored) is compared with
+                the one recorded after the last apply. On drift the rules
+                files of that run are re-applied incrementally, in order,
+                so only the missing or changed tables, chains, sets and
+                rules are sent to nft.
+
+Every drift and correction is logged with a timestamp. A target that
+drifts again within COOLDOWN seconds of its last correction is left
+alone until the cooldown ends, so the loop never fights another tool
+in a tight loop. A full check also runs every RESYNC seconds, in case
+events were lost. With --dry-run drift is only reported.
+
+References:
+    - rtnetlink(7) multicast groups: https://man7.org/linux/man-pages/man7/rtnetlink.7.html
+    - nft(8) monitor: https://www.netfilter.org/projects/nftables/manpage.html
+    - Python selectors: https://docs.python.org/3/library/selectors.html
+    - networkctl(1) reconfigure: https://www.freedesktop.org/software/systemd/man/latest/networkctl.html
+"""
+
+import contextlib
+import errno
+import io
+import ipaddress
+import os
+import selectors
+import socket
+import subprocess
+import time
+
+import agent
+import apply_state
+import backup_store
+import discovery
+import executor
+import firewall
+import netplan_apply
+import netplan_model
+
+KINDS = ("netplan", "nftables")
+DEBOUNCE = 2.0      # seconds without events before a burst is checked
+MAX_DELAY = 10.0    # a continuous burst is still checked after this long
+COOLDOWN = 30.0     # minimum time between two corrections of one target
+RESYNC = 600.0      # full check even without events (0: never)
+
+
+def log(message):
+    print(f"[watch {time.strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def live_name(iface):
+    """The kernel name of a netplan interface, or None if it cannot be known."""
+    set_name = getattr(iface, "set_name", None)
+    if set_name:
+        return set_name
+    if getattr(iface, "match", None):
+        return None    # matched by MAC or driver, named by the kernel
+    return iface.name
+
+
+def netplan_drift(doc, records):
+    """
+    Compare a netplan document with the live interfaces.
+
+    Args:
+        doc (NetplanDocument): what was applied
+        records (dict): name -> discovery record
+
+    Returns:
+        dict: netplan interface name -> list of reasons, for the interfaces
+        that differ (DHCP leases are not compared)
+    """
+    drift = {}
+    for iface in doc.interfaces():
+        name = live_name(iface)
+        if name is None:
+            continue
+        rec = records.get(name)
+        if rec is None:
+            if not iface.optional:
+                drift[iface.name] = ["link is missing"]
+            continue
+        reasons = []
+        if not rec["up"]:
+            reasons.append("link is down")
+        present = {ipaddress.ip_interface(a) for a in rec["ipv4"] + rec["ipv6"]}
+        for value in iface.addresses:
+            try:
+                wanted = ipaddress.ip_interface(value)
+            except ValueError:
+                continue
+            if wanted not in present:
+                reasons.append(f"address {value} is missing")
+        if iface.mtu is not None and rec["mtu"] != iface.mtu:
+            reasons.append(f"MTU is {rec['mtu']}, not {iface.mtu}")
+        if reasons:
+            drift[iface.name] = reasons
+    return drift
+
+
+class Watcher:
+    """Drift checks and corrections, with per-target cooldowns."""
+    __slots__ = ("dry_run", "loader", "checks", "corrections", "last_fix", "deferred")
+
+    def __init__(self, dry_run=False, loader=discovery.discover_interfaces):
+        self.dry_run = dry_run
+        self.loader = loader
+        self.checks = 0
+        self.corrections = 0
+        self.last_fix = {}     # target -> monotonic time of its last correction
+        self.deferred = {}     # kind -> monotonic time to check it again
+
+    def check(self, kinds):
+        """Check (and correct) the given kinds ("netplan", "nftables")."""
+        for kind in kinds:
+            self.deferred.pop(kind, None)
+            self.checks += 1
+            try:
+                getattr(self, f"_check_{kind}")()
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                log(f"{kind}: check failed: {executor.describe(e)}")
+
+    def _cooling(self, kind, targets):
+        """Split off the targets corrected less than COOLDOWN ago and defer them."""
+        now = time.monotonic()
+        ready, waiting = [], []
+        for target in targets:
+            last = self.last_fix.get(target)
+            (waiting if last is not None and now - last < COOLDOWN else ready).append(target)
+        if waiting:
+            until = max(self.last_fix[t] for t in waiting) + COOLDOWN
+            self.deferred[kind] = min(self.deferred.get(kind, until), until)
+            log(f"{', '.join(waiting)} drifted again within {COOLDOWN:.0f}s of the last "
+                f"correction; retrying in {until - now:.0f}s")
+        return ready
+
+    def _fixed(self, targets):
+        now = time.monotonic()
+        for target in targets:
+            self.last_fix[target] = now
+        self.corrections += len(targets)
+
+    # -- netplan -------------------------------------------------------------
+    def _restore_netplan_file(self, path, sha):
+        if not os.path.exists(backup_store.object_path(sha)):
+            log(f"{path} was edited since it was applied and the applied version is not in "
+                f"the backup store; leaving it (apply it again to resume watching)")
+            return False
+        if self.dry_run:
+            log(f"{path} was edited since it was applied (dry run: not restored)")
+            return False
+        with open(backup_store.object_path(sha), "rb") as f:
+            data = f.read()
+        backup_store.save_file("netplan", path)    # keep the hand-edited version
+        with open(path, "wb") as f:
+            f.write(data)
+        log(f"{path} was edited since it was applied; restored the applied version "
+            f"({sha[:12]}), the edited one is in the backup store")
+        return True
+
+    def _check_netplan(self):
+        saved = apply_state.load_state().get("netplan")
+        if not saved:
+            return
+        path, sha = saved["path"], saved["sha256"]
+        current = apply_state.file_hash(path)
+        if current != sha:
+            if not self._restore_netplan_file(path, sha):
+                return
+        elif not os.path.exists(backup_store.object_path(sha)):
+            backup_store.save_file("netplan", path)    # so a later hand edit can be reverted
+        doc = netplan_model.load(path)
+        drift = netplan_drift(doc, self.loader())
+        for name, reasons in drift.items():
+            log(f"netplan: {name}: {'; '.join(reasons)}")
+        targets = self._cooling("netplan", sorted(drift))
+        if not targets:
+            return
+        if self.dry_run:
+            log(f"netplan: dry run, not reconfiguring {', '.join(targets)}")
+            return
+        self._fixed(targets)
+        if doc.renderer == "networkd":
+            downtime = netplan_apply.apply_targeted(targets, doc, self.loader)
+            how = "networkctl reconfigure"
+        else:
+            downtime = netplan_apply.apply_full(doc, self.loader)
+            how = "netplan apply"
+        for name in targets:
+            ms = downtime.get(name)
+            result = f"ready after {ms:.0f} ms" if ms is not None else "NOT ready yet"
+            log(f"netplan: corrected {name} with {how}: {result}")
+
+    # -- nftables ------------------------------------------------------------
+    def _check_nftables(self):
+        saved = apply_state.nftables_record()
+        if not saved["files"] or not saved["live_sha256"]:
+            return
+        live = apply_state.live_ruleset_hash()
+        if live == saved["live_sha256"]:
+            return
+        files = _current_files(saved["files"])
+        paths = [f["path"] for f in files]
+        log(f"nftables: live ruleset differs from the one applied from {', '.join(paths)}")
+        for entry in files:
+            path = entry["path"]
+            if not os.path.isfile(path) or apply_state.rules_hash(path) != entry["sha256"]:
+                log(f"nftables: {path} has changed since it was applied; not re-applying "
+                    f"(apply it explicitly to resume watching)")
+                return
+        if not self._cooling("nftables", ["ruleset"]):
+            return
+        if self.dry_run:
+            log("nftables: dry run, not re-applying")
+            return
+        self._fixed(["ruleset"])
+        for entry in files:
+            path = entry["path"]
+            out = io.StringIO()
+            start = time.monotonic()
+            with contextlib.redirect_stdout(out):
+                result = firewall.apply_rules(path, incremental=True, file_sha=entry["sha256"])
+            elapsed = (time.monotonic() - start) * 1000
+            if result == apply_state.FAILED:
+                log(f"nftables: re-applying {path} FAILED:")
+                print("  " + out.getvalue().strip().replace("\n", "\n  "), flush=True)
+                return
+            if result == apply_state.UNCHANGED:
+                log(f"nftables: {path}: no delta ({elapsed:.0f} ms)")
+            else:
+                log(f"nftables: corrected, re-applied {path} incrementally ({elapsed:.0f} ms)")
+
+
+def _current_files(files):
+    """
+    The recorded files that make up the live ruleset: everything from the
+    last one with 'flush ruleset' on (a record written before such files
+    reset it may still list files that were flushed away since).
+    """
+    for i in range(len(files) - 1, 0, -1):
+        try:
+            if apply_state.flushes_ruleset(files[i]["path"]):
+                return files[i:]
+        except (OSError, ValueError):
+            continue
+    return files
+
+
+# -- event sources -----------------------------------------------------------
+def open_link_events():
+    """Return a non-blocking rtnetlink socket on the link/address groups, or None."""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, discovery.NETLINK_ROUTE)
+        sock.bind((0, agent.RTMGRP_LINK | agent.RTMGRP_IPV4_IFADDR | agent.RTMGRP_IPV6_IFADDR))
+    except OSError as e:
+        log(f"link events unavailable ({e})")
+        return None
+    sock.setblocking(False)
+    return sock
+
+
+def open_nft_monitor():
+    """Start 'nft monitor' with a non-blocking stdout, or return None."""
+    try:
+        monitor = subprocess.Popen(["nft", "monitor"], stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+    except OSError as e:
+        log(f"nftables events unavailable ({e})")
+        return None
+    os.set_blocking(monitor.stdout.fileno(), False)
+    return monitor
+
+
+def _drain(fileobj):
+    """
+    Read everything pending on an event source.
+
+    Returns:
+        bool: False if the source is gone (EOF or a fatal error)
+    """
+    while True:
+        try:
+            if isinstance(fileobj, socket.socket):
+                fileobj.recv(65536)
+            elif not os.read(fileobj.fileno(), 65536):
+                return False
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            if e.errno != errno.ENOBUFS:    # ENOBUFS: events were dropped, still a change
+                return False
+
+
+def run(dry_run=False, debounce=DEBOUNCE, resync=RESYNC):
+    """
+    Watch for drift until Ctrl+C.
+
+    Args:
+        dry_run (bool): only report drift
+        debounce (float): quiet time before a burst of events is checked
+        resync (float): seconds between full checks without events (0: never)
+    """
+    watcher = Watcher(dry_run)
+    selector = selectors.DefaultSelector()
+    link = open_link_events()
+    monitor = open_nft_monitor()
+    if link is not None:
+        selector.register(link, selectors.EVENT_READ, "netplan")
+    if monitor is not None:
+        selector.register(monitor.stdout, selectors.EVENT_READ, "nftables")
+
+    state = apply_state.load_state()
+    watched = [kind for kind in KINDS if kind in state]
+    log(f"watching {', '.join(watched) or 'nothing applied yet'} "
+        f"(debounce {debounce:g}s, resync {'off' if not resync else f'{resync:g}s'}"
+        f"{', dry run' if dry_run else ''})")
+    watcher.check(KINDS)
+
+    pending = set()
+    first = last = None
+    next_resync = time.monotonic() + resync if resync else None
+    try:
+        while True:
+            deadlines = list(watcher.deferred.values())
+            if next_resync is not None:
+                deadlines.append(next_resync)
+            if pending:
+                deadlines.append(min(last + debounce, first + MAX_DELAY))
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for key, _mask in selector.select(timeout):
+                if not _drain(key.fileobj):
+                    selector.unregister(key.fileobj)
+                    log(f"{key.data} events stopped; relying on the resync")
+                now = time.monotonic()
+                pending.add(key.data)
+                first = first if first is not None else now
+                last = now
+
+            now = time.monotonic()
+            due = {kind for kind, at in watcher.deferred.items() if at <= now}
+            if pending and (now - last >= debounce or now - first >= MAX_DELAY):
+                due |= pending
+                pending.clear()
+                first = last = None
+            if next_resync is not None and now >= next_resync:
+                due |= set(KINDS)
+                next_resync = now + resync
+            if due:
+                watcher.check(sorted(due))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        selector.close()
+        if link is not None:
+            link.close()
+        if monitor is not None:
+            monitor.terminate()
+            monitor.wait()
+        log(f"stopped after {watcher.checks} check(s), {watcher.corrections} correction(s)")
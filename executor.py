@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+Command Executor Module
+
+One place to run external commands (ip, netplan, networkctl, nft, sysctl)
+with a timeout on every call, bounded concurrency and cancellation,
+built on asyncio subprocesses. Needs Python 3.8 or later: run() is called
+from worker threads (concurrently(), the agent's request handlers), which
+asyncio subprocesses only support from 3.8 on.
+
+    run(cmd)                 blocking call with a per-command timeout
+    run_async(cmd)           the same as a coroutine, for use inside a loop
+    iter_lines(cmd)          stdout line by line, for outputs too large to hold
+    concurrently(f, g, ...)  independent blocking steps in parallel threads,
+                             at most MAX_CONCURRENCY at a time
+
+A command that runs past its timeout is killed and raises
+subprocess.TimeoutExpired; a non-zero exit raises
+subprocess.CalledProcessError with the captured stderr. 'nft -f' loads get
+a timeout that grows with the size of the ruleset.
+
+References:
+    - Python asyncio subprocesses: https://docs.python.org/3/library/asyncio-subprocess.html
+    - Subprocesses and threads: https://docs.python.org/3/library/asyncio-subprocess.html#subprocess-and-threads
+    - Python concurrent.futures: https://docs.python.org/3/library/concurrent.futures.html
+    - nft(8): https://www.netfilter.org/projects/nftables/manpage.html
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import signal
+import subprocess
+import threading
+
+DEFAULT_TIMEOUT = 60.0
+# Per-program timeouts in seconds; 'netplan apply' may wait for DHCP
+TIMEOUTS = {
+    "ip": 10.0,
+    "sysctl": 10.0,
+    "networkctl": 30.0,
+    "nft": 60.0,
+    "netplan": 120.0,
+}
+# Extra seconds per MiB of ruleset for 'nft -f' / 'nft -c -f': a large
+# ruleset (hundreds of MB, sets with millions of elements) takes far longer
+# to load than any fixed timeout would allow
+NFT_SECONDS_PER_MB = 10.0
+MAX_CONCURRENCY = 4    # threads used by concurrently()
+
+
+def timeout_for(cmd, input=None):
+    """
+    Return the default timeout for a command, by program name.
+
+    Args:
+        cmd (list): program and arguments
+        input (str/bytes or None): data for stdin, if any
+
+    Returns:
+        float: seconds; for 'nft -f FILE' or 'nft -f -' the base timeout plus
+        NFT_SECONDS_PER_MB for each MiB of the file or of the input
+    """
+    program = cmd[0].rsplit("/", 1)[-1]
+    timeout = TIMEOUTS.get(program, DEFAULT_TIMEOUT)
+    if program == "nft" and "-f" in cmd[:-1]:
+        source = cmd[cmd.index("-f") + 1]
+        if source == "-":
+            size = len(input) if input is not None else 0
+        else:
+            try:
+                size = os.path.getsize(source)
+            except OSError:
+                size = 0
+        timeout += NFT_SECONDS_PER_MB * size / (1024 * 1024)
+    return timeout
+
+
+async def run_async(cmd, input=None, timeout=None, check=True, text=True, new_session=False):
+    """
+    Run one command and wait for it, killing it on timeout or cancellation.
+
+    Args:
+        cmd (list): program and arguments
+        input (str/bytes or None): data for stdin
+        timeout (float or None): seconds; None uses timeout_for(cmd, input)
+        check (bool): raise CalledProcessError on a non-zero exit
+        text (bool): decode stdout/stderr (and encode input) as text
+        new_session (bool): start the command in its own session and kill
+            its whole process group, so children of a shell that still hold
+            the output pipes do not keep a timed-out call waiting
+
+    Returns:
+        subprocess.CompletedProcess with stdout and stderr captured
+    """
+    timeout = timeout_for(cmd, input) if timeout is None else timeout
+    if text and isinstance(input, str):
+        input = input.encode()
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=new_session,
+    )
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(input), timeout)
+    except asyncio.TimeoutError:
+        await _kill(proc, new_session)
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    except asyncio.CancelledError:
+        await _kill(proc, new_session)
+        raise
+    if text:
+        out, err = out.decode(errors="replace"), err.decode(errors="replace")
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, out, err)
+    return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+
+
+async def _kill(proc, group):
+    try:
+        if group:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+def run(cmd, input=None, timeout=None, check=True, text=True):
+    """
+    Blocking wrapper around run_async() (must not be called from inside a
+    running event loop).
+    """
+    return asyncio.run(run_async(cmd, input, timeout, check, text))
+
+
+def check_output(cmd, timeout=None, text=True):
+    """Run a command and return its stdout, like subprocess.check_output."""
+    return run(cmd, timeout=timeout, text=text).stdout
+
+
+def iter_lines(cmd, timeout=None, text=True):
+    """
+    Run a command and yield its stdout one line at a time, so that a large
+    output ('nft list ruleset' of a huge ruleset) is never held in memory
+    as a whole. Stopping early kills the command.
+
+    Raises:
+        subprocess.TimeoutExpired: if it ran past its timeout (it is killed)
+        subprocess.CalledProcessError: on a non-zero exit, once the output
+            has been read
+    """
+    timeout = timeout_for(cmd) if timeout is None else timeout
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    expired, stderr = [], []
+
+    def kill():
+        expired.append(True)
+        proc.kill()
+    timer = threading.Timer(timeout, kill)
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+    timer.start()
+    drain.start()
+    done = False
+    try:
+        for line in proc.stdout:
+            yield line.decode(errors="replace") if text else line
+        done = True
+    finally:
+        timer.cancel()
+        if not done:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        drain.join()
+        proc.stderr.close()
+    if expired:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if proc.returncode != 0:
+        err = b"".join(stderr)
+        raise subprocess.CalledProcessError(proc.returncode, cmd, None,
+                                            err.decode(errors="replace") if text else err)
+
+
+def describe(error):
+    """Return an error message that includes the command's stderr, if any."""
+    stderr = getattr(error, "stderr", None)
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors="replace")
+    if stderr and stderr.strip():
+        return f"{error}\n{stderr.strip()}"
+    return str(error)
+
+
+def concurrently(*funcs, limit=MAX_CONCURRENCY):
+    """
+    Run independent blocking steps (each a no-argument callable) in
+    parallel threads, at most `limit` at a time, and return their results
+    in order. The first exception raised by any step is re-raised once
+    all have finished.
+
+    The steps run in plain worker threads, not inside an event loop, so
+    they may call run() themselves (each call gets its own loop; the
+    child watcher that allows this outside the main thread is the default
+    since Python 3.8).
+    """
+    if not funcs:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(limit, len(funcs))) as pool:
+        futures = [pool.submit(f) for f in funcs]
+        concurrent.futures.wait(futures)
+    return [future.result() for future in futures]
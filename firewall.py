@@ -10,60 +10,631 @@ References:
     - Python os module: https://docs.python.org/3/library/os.html
 """
 
-import os import subprocess
+import os
+import subprocess
+import tempfile
+import time
 
-def configure_firewall(rules_path_arg=None): """ High-level firewall configuration flow.
+import apply_state
+import backup_store
+import executor
+import metrics
+import nft_compile
+import nft_flowtable
+import nft_loader
+import nft_optimize
+import nft_profile
+import nft_query
+import nft_ruleset
+import preflight
 
-Args:
-    rules_path_arg (str or None):
-        If provided, use this as nftables rules file path without asking.
-        If None, ask user interactively.
-"""
-print("\n==== Firewall (nftables) Configuration ====\n")
-
-# 1) Get rules file path
-if rules_path_arg:
-    rules_path = rules_path_arg
-    print(f"Using nftables rules file path from CLI argument: {rules_path}")
-else:
-    while True:
-        rules_path = input(
-            "Enter full path to nftables rules file (e.g. /home/admin/rules.nft): "
-        ).strip()
-        if rules_path:
-            break
-        print("Please enter a path.")
-
-# 2) Check file exists
-if not os.path.isfile(rules_path):
-    print(f"File '{rules_path}' not found. Aborting firewall configuration.")
-    return
-
-print(f"\nYou entered rules file: {rules_path}")
-confirm = input(
-    f"Do you want to apply nftables rules from this file using 'nft -f {rules_path}'? (y/n): "
-).strip().lower()
-if confirm != "y":
-    print("Aborting firewall configuration by user choice.")
-    return
-
-# 3) Apply rules
-try:
-    print(f"\nApplying nftables rules from {rules_path}...\n")
-    subprocess.check_call(["nft", "-f", rules_path])
-    print("nftables rules applied successfully.\n")
-except subprocess.CalledProcessError as e:
-    print(f"Error applying nftables rules: {e}")
-    return
-except Exception as e:
-    print(f"Unexpected error while running nft: {e}")
-    return
-
-# 4) Optional: show ruleset
-show = input("Do you want to display the current nftables ruleset? (y/n): ").strip().lower()
-if show == "y":
+REPORT_LIMIT = 20  # detail lines shown in the change report
+DISPLAY_RULES_LIMIT = 500  # larger rulesets are summarized instead of printed
+COMPILED_RULES_FILE = "/etc/nftables-lists.nft"
+FASTPATH_RULES_FILE = "/etc/nftables-fastpath.nft"
+
+
+def compile_lists(allow_paths, deny_paths, output_path=COMPILED_RULES_FILE, hook="input"):
+    """
+    Compile allow/deny list files into a set/verdict-map ruleset file.
+
+    Args:
+        allow_paths (list of str): list files whose entries are accepted
+        deny_paths (list of str): list files whose entries are dropped
+        output_path (str): where to write the generated rules file
+        hook (str): "input" or "forward"
+
+    Returns:
+        output_path (str), or None if the lists could not be compiled
+    """
+    print("\n==== Compiling allow/deny lists ====\n")
+    try:
+        with metrics.span("firewall.compile"):
+            result = nft_compile.compile_lists(allow_paths, deny_paths, hook=hook)
+    except (OSError, ValueError) as e:
+        print(f"Could not compile lists: {e}")
+        return None
+
+    print(f"List entries read:        {result.entries}")
+    print(f"Rules without sets:       {result.naive_rules}")
+    print(f"Rules after compiling:    {result.rules} ({result.elements} set/map elements)")
+    print(f"Rules collapsed:          {result.collapsed}")
+    metrics.set_value("nft_list_entries", result.entries)
+    metrics.set_value("nft_compiled_rules", result.rules)
+    metrics.set_value("nft_set_elements", result.elements)
+
+    print(f"Writing compiled ruleset to {output_path}...")
+    with open(output_path, "w") as f:
+        f.write(result.text)
+    print("File written successfully.")
+    return output_path
+
+
+def print_delta_report(delta, limit=REPORT_LIMIT):
+    """Print a summary of an incremental ruleset delta."""
+    counts = delta.counts()
+    print("Changes against the live ruleset:")
+    for category in ("table", "chain", "set", "flowtable", "object", "rule", "element"):
+        row = [f"{action} {counts[(category, action)]}"
+               for action in ("add", "remove", "change") if (category, action) in counts]
+        if row:
+            print(f"  {category + 's':11s} {', '.join(row)}")
+    for category, action, description in delta.changes[:limit]:
+        sign = {"add": "+", "remove": "-", "change": "~"}[action]
+        print(f"    {sign} {category} {description}")
+    if len(delta.changes) > limit:
+        print(f"    ... and {len(delta.changes) - limit} more")
+
+
+def apply_incremental(rules_path, live=None):
+    """
+    Apply only the difference between a rules file and the live ruleset.
+
+    The delta is sent to 'nft -f -' as one script, so nft applies it as a
+    single atomic transaction.
+
+    Args:
+        rules_path (str): nftables rules file
+        live (Ruleset or None): the parsed live ruleset, if the caller
+            already holds an up-to-date copy; read from nft otherwise
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED or apply_state.FAILED
+    """
+    try:
+        with metrics.span("parse"):
+            if live is None:
+                # parse the file while nft lists the live ruleset
+                desired, live = executor.concurrently(
+                    lambda: nft_ruleset.load_ruleset(rules_path), nft_ruleset.load_live_ruleset
+                )
+            else:
+                desired = nft_ruleset.load_ruleset(rules_path)
+        with metrics.span("diff"):
+            delta = nft_ruleset.diff_rulesets(live, desired)
+        metrics.set_value("nft_rules", desired.rule_count())
+        metrics.set_value("nft_changes", len(delta.changes))
+    except nft_ruleset.NftParseError as e:
+        print(f"Could not parse ruleset: {e}")
+        return apply_state.FAILED
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not read the live ruleset: {e}")
+        return apply_state.FAILED
+
+    if delta.is_empty():
+        print("No changes: the live ruleset already matches the rules file.")
+        return apply_state.UNCHANGED
+
+    print_delta_report(delta)
+    start = time.monotonic()
+    try:
+        with metrics.span("nft"):
+            executor.run(["nft", "-f", "-"], input=delta.script())
+    except subprocess.SubprocessError as e:
+        print(f"Error applying ruleset delta (nothing was changed): {executor.describe(e)}")
+        return apply_state.FAILED
+    elapsed = (time.monotonic() - start) * 1000
+    print(f"Delta applied in one transaction: {len(delta.changes)} changes in {elapsed:.1f} ms.\n")
+    return apply_state.CHANGED
+
+
+def optimized_path(rules_path):
+    """Default location of the optimized copy of a rules file."""
+    root, ext = os.path.splitext(rules_path)
+    return f"{root}.optimized{ext or '.nft'}"
+
+
+def print_analysis_report(analysis, limit=REPORT_LIMIT):
+    """Print the findings of a rules analysis and the cost estimate."""
+    merges = [f for f in analysis.findings if f.kind == "merge"]
+    print(f"Duplicate rules:          {analysis.count('duplicate')}")
+    print(f"Shadowed rules:           {analysis.count('shadowed')}")
+    print(f"Unreachable rules:        {analysis.count('unreachable')} "
+          f"(shadowed by a rule with a different verdict)")
+    print(f"Mergeable runs:           {len(merges)} "
+          f"({sum(int(f.detail.split()[0]) for f in merges)} rules -> {len(merges)})")
+    for f in analysis.findings[:limit]:
+        where = f"{f.chain} #{f.index}"
+        if f.kind == "duplicate":
+            print(f"    - {where}: duplicate of #{f.other}: {f.rule}")
+        elif f.kind in ("shadowed", "unreachable"):
+            print(f"    - {where}: {f.kind}, #{f.other} ({f.detail}) matches first: {f.rule}")
+        else:
+            print(f"    ~ {where}-#{f.other}: {f.detail} merged into: {f.rule}")
+    if len(analysis.findings) > limit:
+        print(f"    ... and {len(analysis.findings) - limit} more")
+
+    chains = nft_optimize.base_chains(analysis.optimized) or list(analysis.before)
+    print("\nEstimated worst-case cost per packet (match expressions evaluated):")
+    print(f"  {'chain':36s} {'rules':>15s} {'expressions':>15s}")
+    totals = [0, 0, 0, 0]
+    for chain in chains:
+        rules_before, cost_before = analysis.before[chain]
+        rules_after, cost_after = analysis.after[chain]
+        totals = [a + b for a, b in zip(totals, (rules_before, rules_after, cost_before, cost_after))]
+        print(f"  {chain:36s} {rules_before:>6d} -> {rules_after:<6d} {cost_before:>6d} -> {cost_after:<6d}")
+    if len(chains) > 1:
+        print(f"  {'total':36s} {totals[0]:>6d} -> {totals[1]:<6d} {totals[2]:>6d} -> {totals[3]:<6d}")
+    if totals[2]:
+        print(f"  Estimated evaluation cost change: {(totals[3] - totals[2]) / totals[2]:+.1%}")
+
+
+def optimize_rules(rules_path, output_path=None, apply=False):
+    """
+    Analyze a rules file for duplicate, shadowed and mergeable rules and
+    produce an equivalent optimized ruleset.
+
+    Args:
+        rules_path (str): nftables rules file
+        output_path (str or None): where to write the optimized ruleset;
+            if None it is printed (or, with apply, written next to the file)
+        apply (bool): apply the optimized ruleset through the normal
+            firewall flow (confirmation, backup, incremental apply)
+
+    Returns:
+        apply_state.CHANGED / UNCHANGED / FAILED when applying, None for
+        analysis only (or if the user aborted)
+    """
+    print(f"\n==== Rules analysis: {rules_path} ====\n")
+    try:
+        with metrics.span("firewall.analyze"):
+            ruleset = nft_ruleset.load_ruleset(rules_path)
+            analysis = nft_optimize.analyze(ruleset)
+    except (OSError, nft_ruleset.NftParseError) as e:
+        print(f"Could not analyze rules file: {e}")
+        return apply_state.FAILED
+    print_analysis_report(analysis)
+    metrics.set_value("nft_rules_removed", sum(analysis.count(kind) for kind in
+                                               ("duplicate", "shadowed", "unreachable")))
+    metrics.set_value("nft_runs_merged", analysis.count("merge"))
+    if analysis.is_optimal():
+        print("\nNo redundant or mergeable rules found.")
+
+    text = nft_ruleset.format_ruleset(analysis.optimized)
+    if apply and output_path is None:
+        output_path = optimized_path(rules_path)
+    if output_path is None:
+        print("\n==== Optimized ruleset ====\n")
+        print(text)
+        return None
+    print(f"\nWriting optimized ruleset to {output_path}...")
+    with open(output_path, "w") as f:
+        f.write(text)
+    print("File written successfully.")
+    if not apply:
+        return None
+    # Incremental, so the rules dropped by the optimizer are also removed
+    # from the live ruleset instead of the new rules being added next to them
+    return configure_firewall(rules_path_arg=output_path, incremental=True)
+
+
+def profile_firewall(duration, interval=nft_profile.DEFAULT_INTERVAL, output_path=None,
+                     keep_counters=False):
+    """
+    Profile the live ruleset: per-rule and per-chain hit rates, rules that
+    never match, and a safe reordering that puts hot accept rules first.
+
+    Args:
+        duration (float): seconds to sample for
+        interval (float): seconds between counter reads
+        output_path (str or None): write the reordered ruleset here, to be
+            applied with --rules PATH --incremental
+        keep_counters (bool): keep the counters added for profiling
+
+    Returns:
+        bool: True if the profile was taken
+    """
+    print(f"\n==== Profiling the live ruleset for {duration:g} s ====\n")
+    try:
+        with metrics.span("firewall.profile"):
+            prof = nft_profile.profile(duration, interval, keep_counters)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f"Could not profile the live ruleset: {executor.describe(e)}")
+        return False
+    print()
+    nft_profile.print_report(prof)
+    ruleset, suggestions = nft_profile.reordered_ruleset(prof)
+    nft_profile.print_suggestions(prof, suggestions)
+    metrics.set_value("nft_dead_rules", len(prof.dead()))
+
+    if output_path and suggestions:
+        print(f"\nWriting reordered ruleset to {output_path}...")
+        with open(output_path, "w") as f:
+            f.write(nft_ruleset.format_ruleset(ruleset))
+        print(f"File written. Apply it with: --mode firewall --rules {output_path} --incremental")
+    return True
+
+
+def apply_fastpath(path):
+    """
+    Load a fast-path rules file by replacing the fast-path table in one
+    transaction, unless the live table already matches it.
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED or apply_state.FAILED
+    """
+    key = (nft_flowtable.TABLE_FAMILY, nft_flowtable.TABLE_NAME)
+    try:
+        with open(path) as f:
+            text = f.read()
+        desired = nft_ruleset.parse_text(text, source=path)
+        live = nft_ruleset.load_live_ruleset()
+    except nft_ruleset.NftParseError as e:
+        print(f"Could not parse ruleset: {e}")
+        return apply_state.FAILED
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not read the fast path or the live ruleset: {executor.describe(e)}")
+        return apply_state.FAILED
+
+    current = nft_ruleset.Ruleset()
+    if key in live.tables:
+        current.tables[key] = live.tables[key]
+    if nft_ruleset.diff_rulesets(current, desired).is_empty():
+        print("No changes: the live fast path table already matches.")
+        return apply_state.UNCHANGED
+    try:
+        with metrics.span("nft"):
+            executor.run(["nft", "-f", "-"], input=nft_flowtable.replace_script(text))
+    except subprocess.SubprocessError as e:
+        print(f"Error replacing the fast path table (nothing was changed): {executor.describe(e)}")
+        return apply_state.FAILED
+    print(f"Table {' '.join(key)} replaced in one transaction.")
+    return apply_state.CHANGED
+
+
+def configure_fastpath(devices, output_path=FASTPATH_RULES_FILE, dry_run=False, check=False,
+                       rules_path=None):
+    """
+    Generate the flowtable fast path for established forwarded connections
+    (see nft_flowtable.py) and apply it as its own table.
+
+    Args:
+        devices (list of str): interfaces in the flowtable
+        output_path (str): where the generated rules file is written
+        dry_run (bool): print the generated table and a summary line only
+        check (bool): validate, including 'nft -c', without writing or
+            applying anything
+        rules_path (str or None): the main rules file, checked for clashes
+
+    Returns:
+        apply_state.CHANGED / UNCHANGED / FAILED, or None for a dry run,
+        a passed check, or if the user aborted
+    """
+    print("\n==== Flowtable fast path ====\n")
+    with metrics.span("firewall.fastpath"):
+        text = nft_flowtable.render(devices)
+    if dry_run:
+        print(text)
+        print(nft_flowtable.summary(devices, text))
+        return None
+
+    ruleset = None
+    if rules_path:
+        try:
+            ruleset = nft_ruleset.load_ruleset(rules_path)
+        except (OSError, nft_ruleset.NftParseError):
+            pass  # the firewall step reports a broken rules file
+    errors, warnings = nft_flowtable.validate(devices, ruleset)
+    for warning in warnings:
+        print(f"  warning: {warning}")
+    for error in errors:
+        print(f"  error: {error}")
+    if errors:
+        print("The fast path is not valid on this host; nothing was written.")
+        return apply_state.FAILED
+
+    if check:
+        with tempfile.NamedTemporaryFile("w", prefix="a2-fastpath-", suffix=".nft") as f:
+            f.write(text)
+            f.flush()
+            with metrics.span("firewall.preflight"):
+                result = preflight.check_nft(f.name)
+        for error in result.errors:
+            print(f"  error: {error}")
+        if not result.ok:
+            print("Check failed: nft rejected the fast path.")
+            return apply_state.FAILED
+        print(f"Check passed: nft accepts the fast path for {', '.join(devices)} "
+              f"(nothing was written).")
+        return None
+
+    print(f"Writing fast path rules to {output_path}...")
+    with open(output_path, "w") as f:
+        f.write(text)
+    with metrics.span("firewall.preflight"):
+        passed = preflight.run(rules_paths=[output_path])
+    if not passed:
+        return apply_state.FAILED
+    confirm = input(f"Offload established forwarded flows on {', '.join(devices)}? (y/n): ").strip().lower()
+    if confirm != "y":
+        print("Aborting: the fast path was written but not applied.")
+        return None
+
+    with metrics.span("firewall.backup"):
+        backup_store.save_live_ruleset()
+    try:
+        before = apply_state.live_ruleset_hash()
+    except (OSError, subprocess.SubprocessError):
+        before = None
+    with metrics.span("firewall.apply"):
+        result = apply_fastpath(output_path)
+    if result != apply_state.FAILED:
+        apply_state.record("fastpath", path=os.path.abspath(output_path),
+                           sha256=apply_state.rules_hash(output_path), devices=list(devices))
+        apply_state.rebase_nftables(before)
+        print(f"Established TCP/UDP flows between {', '.join(devices)} now take the fast path.")
+    return result
+
+
+def remove_fastpath():
+    """
+    Delete the fast-path table and forget it.
+
+    Returns:
+        apply_state.CHANGED, UNCHANGED (there was none) or FAILED
+    """
+    saved = apply_state.load_state().get("fastpath")
+    where = f"{nft_flowtable.TABLE_FAMILY} {nft_flowtable.TABLE_NAME}"
     try:
-        print("\n==== Current nftables ruleset ====\n")
-        subprocess.check_call(["nft", "list", "ruleset"])
+        live = nft_ruleset.load_live_ruleset()
+    except (OSError, subprocess.SubprocessError, nft_ruleset.NftParseError) as e:
+        print(f"Could not read the live ruleset: {executor.describe(e)}")
+        return apply_state.FAILED
+    if (nft_flowtable.TABLE_FAMILY, nft_flowtable.TABLE_NAME) not in live.tables:
+        print(f"No fast path table ({where}) is loaded.")
+        apply_state.forget("fastpath")
+        return apply_state.UNCHANGED
+    backup_store.save_live_ruleset()
+    try:
+        before = apply_state.live_ruleset_hash()
+        executor.run(["nft", "delete", "table", *where.split()])
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not delete table {where}: {executor.describe(e)}")
+        return apply_state.FAILED
+    apply_state.forget("fastpath")
+    apply_state.rebase_nftables(before)
+    print(f"Fast path removed ({where} deleted{', ' + saved['path'] + ' kept' if saved else ''}).")
+    return apply_state.CHANGED
+
+
+def restore_fastpath():
+    """
+    Put the fast path back after applying a rules file: a file starting
+    with 'flush ruleset' removes every table, the fast path's included.
+    """
+    saved = apply_state.load_state().get("fastpath")
+    if not saved or not os.path.isfile(saved["path"]):
+        return
+    print("Keeping the flowtable fast path:")
+    with metrics.span("firewall.fastpath"):
+        apply_fastpath(saved["path"])
+
+
+def _load_query_index():
+    start = time.perf_counter()
+    with metrics.span("firewall.query_index"):
+        index, cached = nft_query.load_index()
+    elapsed = (time.perf_counter() - start) * 1000
+    source = "loaded from cache" if cached else "built"
+    print(f"(index of {len(index.rules)} rules {source} in {elapsed:.1f} ms)")
+    return index
+
+
+def query_ruleset(query, page=1, page_size=nft_query.PAGE_SIZE):
+    """
+    Answer a query about the live ruleset from its index (see nft_query.py):
+    'ADDRESS[:PORT]', 'chain [FAMILY] [TABLE] CHAIN', 'set ...',
+    'handle [FAMILY] TABLE HANDLE' or 'summary'.
+
+    Returns:
+        bool: True if the query was answered
+    """
+    try:
+        index = _load_query_index()
+        start = time.perf_counter()
+        lines = nft_query.run_query(index, query, page, page_size)
+    except nft_query.QueryError as e:
+        print(f"Query error: {e}")
+        return False
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        print(f"Could not read the live ruleset: {executor.describe(e)}")
+        return False
+    elapsed = (time.perf_counter() - start) * 1000
+    print("\n".join(lines))
+    print(f"(query answered in {elapsed:.2f} ms)")
+    return True
+
+
+def show_ruleset():
+    """
+    Print the live ruleset, or a summary and how to query it when it has
+    more than DISPLAY_RULES_LIMIT rules.
+    """
+    print("\n==== Current nftables ruleset ====\n")
+    try:
+        index = _load_query_index()
+        if len(index.rules) <= DISPLAY_RULES_LIMIT:
+            print(executor.check_output(["nft", "list", "ruleset"]))
+            return
     except Exception as e:
         print(f"Error listing nftables ruleset: {e}")
+        return
+    lines = nft_query.run_query(index, "summary")
+    print("\n".join(lines[:REPORT_LIMIT + 1]))
+    if len(lines) > REPORT_LIMIT + 1:
+        print(f"  ... {len(lines) - REPORT_LIMIT - 1} more")
+    print("\nToo large to print. Look at parts of it with, for example:\n"
+          "  --query 'chain inet filter input' --page 2\n"
+          "  --query 10.1.2.3:443")
+
+
+def apply_streaming(rules_path):
+    """
+    Load a (possibly very large) rules file by streaming it into 'nft -f -'.
+
+    Returns:
+        bool: True if nft accepted the whole file
+    """
+    start = time.monotonic()
+    with metrics.span("nft"):
+        result = nft_loader.stream_load(rules_path)
+    elapsed = (time.monotonic() - start) * 1000
+    metrics.set_value("nft_lines", result["lines"])
+    if not result["ok"]:
+        print(f"Error applying nftables rules: {result['error']}")
+        return False
+    print(f"nftables rules applied successfully in {elapsed:.1f} ms "
+          f"({result['lines']} lines, {result['bytes'] / 1e6:.1f} MB streamed, "
+          f"peak RSS {result['peak_rss_kb'] / 1024:.1f} MB).\n")
+    return True
+
+
+def apply_rules(rules_path, incremental=False, stream=False, file_sha=None, live=None):
+    """
+    Non-interactive part of the firewall flow: back up the live ruleset,
+    apply the file and record what was applied.
+
+    Args:
+        rules_path (str): nftables rules file
+        incremental / stream (bool): as for configure_firewall()
+        file_sha (str or None): hash of the rules file, if already computed
+        live (Ruleset or None): already-parsed live ruleset for --incremental
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED or apply_state.FAILED
+    """
+    # Keep the current ruleset so it can be restored with --rollback
+    with metrics.span("firewall.backup"):
+        backup_store.save_live_ruleset()
+
+    if incremental:
+        print(f"\nApplying changes from {rules_path} incrementally...\n")
+        with metrics.span("firewall.apply"):
+            result = apply_incremental(rules_path, live)
+        if result == apply_state.FAILED:
+            return result
+    elif stream:
+        print(f"\nStreaming nftables rules from {rules_path}...\n")
+        with metrics.span("firewall.apply"):
+            ok = apply_streaming(rules_path)
+        if not ok:
+            return apply_state.FAILED
+        result = apply_state.CHANGED
+    else:
+        try:
+            print(f"\nApplying nftables rules from {rules_path}...\n")
+            start = time.monotonic()
+            with metrics.span("firewall.apply"), metrics.span("nft"):
+                executor.run(["nft", "-f", rules_path])
+            elapsed = (time.monotonic() - start) * 1000
+            print(f"nftables rules applied successfully in {elapsed:.1f} ms.\n")
+            result = apply_state.CHANGED
+        except subprocess.SubprocessError as e:
+            print(f"Error applying nftables rules: {executor.describe(e)}")
+            return apply_state.FAILED
+        except Exception as e:
+            print(f"Unexpected error while running nft: {e}")
+            return apply_state.FAILED
+    restore_fastpath()
+    with metrics.span("firewall.record"):
+        apply_state.record_nftables(rules_path, file_sha)
+    return result
+
+
+def configure_firewall(rules_path_arg=None, incremental=False, stream=False):
+    """
+    High-level firewall configuration flow.
+
+    Args:
+        rules_path_arg (str or None):
+            If provided, use this as nftables rules file path without asking.
+            If None, ask user interactively.
+        incremental (bool):
+            If True, diff the file against the live ruleset and apply only
+            the delta instead of reloading the whole file.
+        stream (bool):
+            If True, expand includes and check syntax while streaming the
+            file into nft, keeping memory flat for very large files.
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED, apply_state.FAILED,
+        or None if the user aborted
+    """
+    print("\n==== Firewall (nftables) Configuration ====\n")
+
+    # 1) Get rules file path
+    if rules_path_arg:
+        rules_path = rules_path_arg
+        print(f"Using nftables rules file path from CLI argument: {rules_path}")
+    else:
+        while True:
+            rules_path = input(
+                "Enter full path to nftables rules file (e.g. /home/admin/rules.nft): "
+            ).strip()
+            if rules_path:
+                break
+            print("Please enter a path.")
+
+    # 2) Check file exists
+    if not os.path.isfile(rules_path):
+        print(f"File '{rules_path}' not found. Aborting firewall configuration.")
+        return apply_state.FAILED
+
+    print(f"\nYou entered rules file: {rules_path}")
+    try:
+        with metrics.span("firewall.check"):
+            unchanged, file_sha, _live = apply_state.nftables_unchanged(rules_path)
+    except (OSError, nft_ruleset.NftParseError) as e:
+        print(f"Could not read rules file: {e}")
+        return apply_state.FAILED
+    if unchanged:
+        print("No changes: this rules file was already applied and the live ruleset "
+              "has not changed since. Skipping apply.")
+        return apply_state.UNCHANGED
+
+    # Check the file with 'nft -c' before anything is backed up or applied
+    with metrics.span("firewall.preflight"):
+        passed = preflight.run(rules_paths=[rules_path])
+    if not passed:
+        print("Pre-flight checks failed; the live ruleset was not touched.")
+        return apply_state.FAILED
+
+    if incremental:
+        prompt = f"Do you want to apply only the changes in {rules_path} to the live ruleset? (y/n): "
+    else:
+        prompt = f"Do you want to apply nftables rules from this file using 'nft -f {rules_path}'? (y/n): "
+    confirm = input(prompt).strip().lower()
+    if confirm != "y":
+        print("Aborting firewall configuration by user choice.")
+        return None
+
+    # 3) Back up, apply and record
+    result = apply_rules(rules_path, incremental=incremental, stream=stream, file_sha=file_sha)
+    if result == apply_state.FAILED:
+        return result
+
+    # 4) Optional: show ruleset
+    show = input("Do you want to display the current nftables ruleset? (y/n): ").strip().lower()
+    if show == "y":
+        show_ruleset()
+    return result
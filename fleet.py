@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+"""
+Fleet Apply
+
+Pushes the desired network and firewall state of every host of an
+inventory (see inventory_render.py) to the hosts themselves and applies
+it there ('assignment2.py --fleet'):
+
+    1. render      the whole inventory is rendered and validated first;
+                   if any host fails, nothing is pushed
+    2. push+apply  per host, one transport call streams a tar payload
+                   (the host's rendered files, its desired state, the
+                   tool's own modules and a sha256sum MANIFEST) into
+                   REMOTE_DIR and runs the apply command there
+    3. report      per-host results are printed, written to
+                   <output>/fleet-report.json, and each host's output to
+                   <output>/<host>/fleet.log
+
+Rollout goes canary first, then waves: the hosts marked "canary": true
+in the inventory (or the first --canary hosts by name) form the first
+wave, the others follow in waves of --wave-size. Within a wave at most
+--parallel hosts are in flight at once. A failed canary stops the
+rollout, and so does a wave that brings the failures past
+--max-failures; the hosts not reached are reported as skipped.
+
+The transport is pluggable. Both run the same shell script (unpack the
+payload, then run the command) and differ only in where:
+
+    ssh     'ssh <address> <script>' with BatchMode, so a host that wants
+            a password fails instead of hanging; address is the host's
+            "address" in the inventory, or its name
+    local   a stand-in for testing the scheduler on one box: every host
+            is a directory under --fleet-root, and the script runs there
+            as a local 'sh -c' subprocess
+
+On the host, 'python3 fleet.py DIR' (this module, from the payload)
+checks the MANIFEST and applies the state without prompting: the
+desired state like --config, then the rules file incrementally. The
+local stand-in runs 'fleet.py --check DIR' instead, which checks the
+payload without touching the machine. --fleet-command replaces the
+command; its exit status decides the host's result:
+
+    0 changed   3 unchanged   4 checked   255 unreachable (ssh)
+    anything else failed, and a command past --fleet-timeout is killed
+
+so '--transport local --fleet-command "exit 1"' (or "sleep 600", or
+'test {host} != web3') exercises failure handling and timeouts without
+a network.
+
+References:
+    - Python asyncio subprocesses: https://docs.python.org/3/library/asyncio-subprocess.html
+    - Python tarfile: https://docs.python.org/3/library/tarfile.html
+    - ssh(1), BatchMode and ConnectTimeout: https://man.openbsd.org/ssh_config
+    - sha256sum(1) --check: https://man7.org/linux/man-pages/man1/sha256sum.1.html
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tarfile
+import time
+
+import apply_state
+import desired_state
+import executor
+import firewall
+import inventory_render
+import netplan_utils
+import nft_ruleset
+import preflight
+
+REMOTE_DIR = ".assignment2-fleet"      # relative to the login directory (or --fleet-root/<host>)
+MANIFEST_NAME = "MANIFEST"
+STATE_NAME = "state.json"
+TOOL_DIR = "tool"
+LOG_NAME = "fleet.log"
+REPORT_NAME = "fleet-report.json"
+PARALLEL = 10
+CANARY = 1
+WAVE_SIZE = 20
+TIMEOUT = 300.0
+OUTPUT_LINES = 15    # output lines printed for each failed host
+
+SSH_OPTIONS = ("-o", "BatchMode=yes", "-o", "ConnectTimeout=10")
+APPLY_COMMAND = "sudo -n {python} {dir}/tool/fleet.py {dir}"
+CHECK_COMMAND = "{python} {dir}/tool/fleet.py --check {dir}"
+
+EXIT_NO_CHANGES = 3
+EXIT_CHECKED = 4
+EXIT_UNREACHABLE = 255                 # what ssh exits with when it cannot connect
+
+CHECKED = "checked"
+UNREACHABLE = "unreachable"
+TIMED_OUT = "timeout"
+SKIPPED = "skipped"
+STATUSES = (apply_state.CHANGED, apply_state.UNCHANGED, CHECKED,
+            apply_state.FAILED, UNREACHABLE, TIMED_OUT, SKIPPED)
+_EXIT_STATUS = {0: apply_state.CHANGED, EXIT_NO_CHANGES: apply_state.UNCHANGED,
+                EXIT_CHECKED: CHECKED, EXIT_UNREACHABLE: UNREACHABLE}
+OK = (apply_state.CHANGED, apply_state.UNCHANGED, CHECKED)
+
+
+class SshTransport:
+    """Runs the script on the host over ssh."""
+    __slots__ = ("options",)
+    name = "ssh"
+    python = "python3"
+    default_command = APPLY_COMMAND
+
+    def __init__(self, options=()):
+        self.options = tuple(options)
+
+    def argv(self, name, address, script):
+        return ["ssh", *SSH_OPTIONS, *self.options, address, script]
+
+
+class LocalTransport:
+    """Stand-in: each host is a directory under `root`, the script a local subprocess."""
+    __slots__ = ("root",)
+    name = "local"
+    python = sys.executable or "python3"
+    default_command = CHECK_COMMAND
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def argv(self, name, address, script):
+        home = shlex.quote(os.path.join(self.root, name))
+        return ["sh", "-c", f"mkdir -p {home} && cd {home} && {script}"]
+
+
+TRANSPORTS = {"ssh": SshTransport, "local": LocalTransport}
+
+
+class HostResult:
+    """The outcome of one host."""
+    __slots__ = ("name", "wave", "status", "returncode", "seconds", "output")
+
+    def __init__(self, name, wave, status, returncode=None, seconds=0.0, output=""):
+        self.name = name
+        self.wave = wave
+        self.status = status
+        self.returncode = returncode
+        self.seconds = seconds
+        self.output = output
+
+    @property
+    def ok(self):
+        return self.status in OK
+
+    def as_dict(self):
+        return {"host": self.name, "wave": self.wave, "status": self.status,
+                "returncode": self.returncode, "seconds": round(self.seconds, 3)}
+
+
+def plan_waves(hosts, canary=CANARY, wave_size=WAVE_SIZE):
+    """
+    Split hosts into rollout waves: the canaries, then groups of wave_size.
+
+    Args:
+        hosts (dict): name -> inventory entry; entries with "canary": true
+            are the canaries, otherwise the first `canary` names
+        canary (int): canary count when none are marked
+        wave_size (int): hosts per later wave; 0 puts them all in one
+
+    Returns:
+        list of (label, host names), the label being "canary" or "wave N"
+    """
+    names = sorted(hosts)
+    first = [n for n in names if hosts[n].get("canary") is True] or names[:canary]
+    rest = [n for n in names if n not in first]
+    size = wave_size or len(rest) or 1
+    waves = [("canary", first)] if first else []
+    return waves + [(f"wave {i // size + 1}", rest[i:i + size]) for i in range(0, len(rest), size)]
+
+
+def _file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def tool_files():
+    """The tool's modules, as (archive name, path) pairs, shipped to every host."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [(f"{TOOL_DIR}/{name}", os.path.join(here, name))
+            for name in sorted(os.listdir(here)) if name.endswith(".py")]
+
+
+def build_payload(name, state, rendered_dir, tools):
+    """
+    Pack one host's payload into an uncompressed tar.
+
+    Args:
+        name (str): host name
+        state (dict): its desired state, shipped as state.json
+        rendered_dir (str): its directory in the render output
+        tools (list): (archive name, bytes) pairs from tool_files()
+
+    Returns:
+        bytes
+    """
+    members = [(STATE_NAME, json.dumps(state, indent=2, sort_keys=True).encode())]
+    for file_name in (inventory_render.NETPLAN_NAME, inventory_render.RULES_NAME):
+        path = os.path.join(rendered_dir, file_name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                members.append((file_name, f.read()))
+    members.extend(tools)
+    manifest = "".join(f"{hashlib.sha256(data).hexdigest()}  {arcname}\n"
+                       for arcname, data in members)
+    members.append((MANIFEST_NAME, manifest.encode()))
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for arcname, data in members:
+            info = tarfile.TarInfo(arcname)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def host_script(command, remote_dir=REMOTE_DIR):
+    """
+    The shell script every transport runs on a host: unpack the payload
+    from stdin next to the previous one, swap it in, run the command.
+    """
+    new = shlex.quote(remote_dir + ".new")
+    target = shlex.quote(remote_dir)
+    return (f"rm -rf {new} && mkdir -p {new} && tar -xf - -C {new} && "
+            f"rm -rf {target} && mv {new} {target} && {command}")
+
+
+async def _push(transport, name, address, payload, script, timeout, semaphore, wave):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            proc = await executor.run_async(transport.argv(name, address, script), input=payload,
+                                            timeout=timeout, check=False, text=False,
+                                            new_session=True)
+        except subprocess.TimeoutExpired:
+            return HostResult(name, wave, TIMED_OUT, None, time.perf_counter() - start,
+                              f"killed after {timeout:g} s\n")
+        except OSError as e:
+            return HostResult(name, wave, apply_state.FAILED, None,
+                              time.perf_counter() - start, f"{e}\n")
+        output = (proc.stdout + proc.stderr).decode(errors="replace")
+        status = _EXIT_STATUS.get(proc.returncode, apply_state.FAILED)
+        return HostResult(name, wave, status, proc.returncode, time.perf_counter() - start, output)
+
+
+async def _run_wave(jobs, transport, script_for, timeout, parallel, wave):
+    """Push to every (name, address, payload) of a wave, printing results as they finish."""
+    semaphore = asyncio.Semaphore(parallel)
+    tasks = [asyncio.ensure_future(_push(transport, name, address, payload, script_for(name),
+                                         timeout, semaphore, wave))
+             for name, address, payload in jobs]
+    results = []
+    try:
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            print(f"  {result.name:24s} {result.status:11s} {result.seconds:7.2f} s")
+            results.append(result)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+def _write_logs(output, results):
+    for result in results:
+        if result.status == SKIPPED:
+            continue
+        directory = os.path.join(output, result.name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, LOG_NAME), "w") as f:
+            f.write(result.output)
+
+
+def deploy(inventory_path, output, transport, parallel=PARALLEL, canary=CANARY,
+           wave_size=WAVE_SIZE, max_failures=0, command=None, timeout=TIMEOUT, jobs=None):
+    """
+    Render an inventory and roll it out, canary first, then in waves.
+
+    Args:
+        inventory_path (str): the inventory file
+        output (str): render output directory (also gets the logs and report)
+        transport (SshTransport or LocalTransport): where hosts are reached
+        parallel (int): hosts in flight at once
+        canary (int): canary count when no host is marked "canary"
+        wave_size (int): hosts per wave after the canaries; 0 for one wave
+        max_failures (int): failures tolerated before the rollout stops
+        command (str or None): command run on each host, with {python},
+            {dir} and {host} filled in; the transport's default if None
+        timeout (float): seconds per host, push included
+        jobs (int or None): render worker processes
+
+    Returns:
+        dict with keys counts (status -> hosts), results (list of
+        HostResult), seconds and stopped (why the rollout stopped early,
+        or None); None if the inventory did not render
+
+    Raises:
+        OSError / InventoryError: if the inventory cannot be used
+    """
+    start = time.perf_counter()
+    rendered = inventory_render.render(inventory_path, output, jobs)
+    if rendered["failed"]:
+        print(f"\n{rendered['failed']} host(s) failed to render; nothing was pushed.")
+        return None
+    hosts, defaults, _templates = inventory_render.load_inventory(inventory_path)
+    tools = []
+    for arcname, path in tool_files():
+        with open(path, "rb") as f:
+            tools.append((arcname, f.read()))
+    template = command or transport.default_command
+
+    def script_for(name):
+        fields = {"python": shlex.quote(transport.python), "dir": shlex.quote(REMOTE_DIR),
+                  "host": shlex.quote(name)}
+        return host_script(template.format(**fields))
+
+    waves = plan_waves(hosts, canary, wave_size)
+    results, failures, stopped = [], 0, None
+    print(f"\nRolling out to {len(hosts)} host(s) over {transport.name}: {len(waves)} wave(s), "
+          f"at most {parallel} at once")
+    for number, (label, wave) in enumerate(waves):
+        if stopped:
+            results.extend(HostResult(name, number, SKIPPED) for name in wave)
+            continue
+        print(f"\n-- {label}: {len(wave)} host(s) --")
+        pushes = [(name, str(hosts[name].get("address", name)),
+                  build_payload(name, inventory_render.host_state(hosts[name], defaults),
+                                os.path.join(output, name), tools))
+                 for name in wave]
+        done = asyncio.run(_run_wave(pushes, transport, script_for, timeout, parallel, number))
+        done.sort(key=lambda r: r.name)
+        results.extend(done)
+        failed = sum(not r.ok for r in done)
+        failures += failed
+        if failed and label == "canary":
+            stopped = f"{failed} canary host(s) failed"
+        elif failures > max_failures:
+            stopped = f"{failures} failure(s), more than --max-failures {max_failures}"
+
+    seconds = time.perf_counter() - start
+    counts = {status: 0 for status in STATUSES}
+    for result in results:
+        counts[result.status] += 1
+    _write_logs(output, results)
+    report = {"inventory": inventory_path, "transport": transport.name, "seconds": round(seconds, 3),
+              "stopped": stopped, "counts": counts, "hosts": [r.as_dict() for r in results]}
+    with open(os.path.join(output, REPORT_NAME), "w") as f:
+        json.dump(report, f, indent=1)
+
+    bad = [r for r in results if not r.ok and r.status != SKIPPED]
+    for result in bad[:inventory_render.ERROR_LIMIT]:
+        lines = result.output.rstrip().splitlines()[-OUTPUT_LINES:]
+        print(f"\n{result.name}: {result.status.upper()}"
+              + (f" (exit {result.returncode})" if result.returncode is not None else ""))
+        for line in lines:
+            print(f"    {line}")
+    if len(bad) > inventory_render.ERROR_LIMIT:
+        print(f"\n... {len(bad) - inventory_render.ERROR_LIMIT} more; see {output}/<host>/{LOG_NAME}")
+    if stopped:
+        print(f"\nRollout stopped: {stopped}.")
+    summary = ", ".join(f"{n} {status}" for status, n in counts.items() if n)
+    print(f"\nFleet: {summary} in {seconds:.1f} s (report: {os.path.join(output, REPORT_NAME)})")
+    return {"counts": counts, "results": results, "seconds": seconds, "stopped": stopped}
+
+
+# ----------------------------------------------------------------------------
+# Host side: run from the unpacked payload as 'python3 tool/fleet.py DIR'
+# ----------------------------------------------------------------------------
+
+def verify_manifest(directory):
+    """Return the MANIFEST entries of a payload that are missing or altered."""
+    problems = []
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        for line in f:
+            digest, _, name = line.rstrip("\n").partition("  ")
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                problems.append(f"{name}: missing")
+            elif _file_sha256(path) != digest:
+                problems.append(f"{name}: checksum mismatch")
+    return problems
+
+
+def _apply_rules(rules_path):
+    """Non-interactive firewall step: skip if already applied, check, apply incrementally."""
+    unchanged, file_sha, _live = apply_state.nftables_unchanged(rules_path)
+    if unchanged:
+        print("No changes: this rules file was already applied and the live ruleset "
+              "has not changed since. Skipping apply.")
+        return apply_state.UNCHANGED
+    if not preflight.run(rules_paths=[rules_path]):
+        print("Pre-flight checks failed; the live ruleset was not touched.")
+        return apply_state.FAILED
+    return firewall.apply_rules(rules_path, incremental=True, file_sha=file_sha)
+
+
+def apply_payload(directory, check=False):
+    """
+    Apply (or with `check`, only validate) an unpacked payload.
+
+    Returns:
+        int: the exit status (0, EXIT_NO_CHANGES, EXIT_CHECKED or 1)
+    """
+    try:
+        problems = verify_manifest(directory)
+    except OSError as e:
+        print(f"Cannot read the payload manifest: {e}")
+        return 1
+    if problems:
+        print("Payload is incomplete or altered, nothing was applied:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    state_path = os.path.join(directory, STATE_NAME)
+    rules_path = os.path.join(directory, inventory_render.RULES_NAME)
+    has_rules = os.path.isfile(rules_path)
+
+    if check:
+        try:
+            desired_state.load(state_path)
+            if has_rules:
+                nft_ruleset.load_ruleset(rules_path)
+        except (OSError, desired_state.DesiredStateError, nft_ruleset.NftParseError) as e:
+            print(f"Payload check failed: {e}")
+            return 1
+        print(f"Payload checked: {STATE_NAME}" + (f", {inventory_render.RULES_NAME}" if has_rules else ""))
+        return EXIT_CHECKED
+
+    if os.geteuid() != 0:
+        print("Applying needs root (run the fleet command through sudo).")
+        return 1
+    results = [netplan_utils.configure_network_from_file(state_path)]
+    if results[0] != apply_state.FAILED and has_rules:
+        results.append(_apply_rules(rules_path))
+    if apply_state.FAILED in results:
+        return 1
+    if all(r == apply_state.UNCHANGED for r in results):
+        return EXIT_NO_CHANGES
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a fleet payload on this host.")
+    parser.add_argument("directory", help="the unpacked payload")
+    parser.add_argument("--check", action="store_true",
+                        help="verify and validate the payload without applying it")
+    args = parser.parse_args(argv)
+    return apply_payload(args.directory, args.check)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+"""
+Inventory Rendering
+
+Renders the netplan YAML and the nftables ruleset of every host of an
+inventory into an output directory, offline ('assignment2.py --render'),
+for CI jobs that pre-generate configuration for a whole fleet:
+
+    {
+      "defaults":  {"renderer": "networkd", "rules": "base",
+                    "vars": {"ssh_port": 22}},
+      "templates": {"base": "templates/base.nft",
+                    "edge": "templates/edge.nft"},
+      "hosts": {
+        "web1": {"network": {"ethernets": {"eth0": {"addresses": ["10.0.0.11/24"],
+                                                    "gateway": "10.0.0.1"}}},
+                 "vars": {"allowed": ["10.0.0.0/8", "192.168.0.0/16"]}},
+        "gw1":  {"network": {...}, "rules": "edge"}
+      }
+    }
+
+Each host's "network" is a desired state (see desired_state.py) and is
+validated like --config does, address checks included. A host's rules
+are its template (paths are relative to the inventory, includes are
+expanded into the output) preceded by one nft 'define' per variable
+(defaults.vars, then the host's vars, plus $hostname), so templates use
+nft's own '$name' syntax; list values become anonymous sets. The result
+is parsed before it is written, so an undefined variable or a broken
+template fails the host instead of reaching a router.
+
+    <output>/<host>/99-config.yaml
+    <output>/<host>/nftables.nft      (hosts with rules only)
+
+Hosts are rendered by a process pool, in chunks so that inter-process
+traffic stays small next to the work. Every host's inputs (its entry,
+the defaults, the expanded template and the code that renders them) are
+hashed; hosts whose hash matches the one in <output>/.render-cache.json
+and whose files are still there are skipped.
+
+References:
+    - Python concurrent.futures: https://docs.python.org/3/library/concurrent.futures.html
+    - nft(8) variables (define): https://www.netfilter.org/projects/nftables/manpage.html
+    - Netplan Reference: https://netplan.io/reference/
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import time
+
+import address_check
+import desired_state
+import netplan_model
+import netplan_utils
+import nft_ruleset
+
+try:
+    import yaml  # optional: lets the inventory be YAML
+except ImportError:
+    yaml = None
+
+CACHE_NAME = ".render-cache.json"
+NETPLAN_NAME = os.path.basename(netplan_utils.NETPLAN_FILE)
+RULES_NAME = "nftables.nft"
+INLINE_HOSTS = 16    # fewer hosts than this are not worth starting a pool
+ERROR_LIMIT = 10     # failed hosts printed in full
+
+_VAR_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_HOST_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+_context = {}        # set in each worker by _init_worker()
+
+
+class InventoryError(ValueError):
+    """Raised when an inventory cannot be used at all; lists every problem."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def load_inventory(path):
+    """
+    Read and check the shape of an inventory file (JSON, or YAML if PyYAML
+    is available), and expand its templates.
+
+    Returns:
+        (hosts, defaults, templates): hosts is name -> entry, templates is
+        name -> expanded template text
+
+    Raises:
+        OSError: if the file cannot be read
+        InventoryError: listing every problem found
+    """
+    with open(path) as f:
+        text = f.read()
+    try:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise InventoryError([f"{path}: YAML input needs PyYAML; use JSON instead"])
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+    except ValueError as e:
+        raise InventoryError([f"{path}: {e}"]) from None
+    if not isinstance(data, dict) or not isinstance(data.get("hosts"), dict):
+        raise InventoryError([f"{path}: expected a mapping with a 'hosts' mapping"])
+
+    errors = []
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict):
+        errors.append("defaults: must be a mapping")
+        defaults = {}
+    base = os.path.dirname(os.path.abspath(path))
+    templates = {}
+    for name, rel in (data.get("templates") or {}).items():
+        template_path = os.path.join(base, str(rel))
+        try:
+            templates[name] = "".join(text for text, _source, _lineno in
+                                      nft_ruleset.iter_source_lines(template_path))
+        except (OSError, nft_ruleset.NftParseError) as e:
+            errors.append(f"templates.{name}: {e}")
+
+    hosts = data["hosts"]
+    for name, entry in hosts.items():
+        if not _HOST_RE.match(str(name)):
+            errors.append(f"hosts.{name}: invalid host name (used as a directory name)")
+            continue
+        if not isinstance(entry, dict) or not isinstance(entry.get("network"), dict):
+            errors.append(f"hosts.{name}: needs a 'network' mapping")
+            continue
+        rules = entry.get("rules", defaults.get("rules"))
+        if rules is not None and rules not in templates:
+            errors.append(f"hosts.{name}.rules: unknown template {rules!r}")
+        for scope in (defaults, entry):
+            for var in (scope.get("vars") or {}):
+                if not _VAR_RE.match(str(var)):
+                    errors.append(f"hosts.{name}: invalid variable name {var!r}")
+    if errors:
+        raise InventoryError(errors)
+    return hosts, defaults, templates
+
+
+def _code_hash():
+    """Hash of the modules that shape the output, so new code re-renders everything."""
+    digest = hashlib.sha256()
+    for module in (netplan_model, netplan_utils, nft_ruleset, desired_state, address_check):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    with open(__file__, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def input_hash(name, entry, defaults, template_text, code_hash):
+    """Hash everything a host's output depends on."""
+    data = json.dumps([name, entry, defaults, code_hash], sort_keys=True, default=str)
+    digest = hashlib.sha256(data.encode())
+    digest.update((template_text or "").encode())
+    return digest.hexdigest()
+
+
+def host_state(entry, defaults):
+    """A host's desired state: its "network", with the default renderer filled in."""
+    state = dict(entry["network"])
+    if "renderer" in defaults:
+        state.setdefault("renderer", defaults["renderer"])
+    return state
+
+
+def _nft_value(value):
+    if isinstance(value, (list, tuple)):
+        return "{ " + ", ".join(str(v) for v in value) + " }"
+    if isinstance(value, bool):
+        raise ValueError("true/false is not an nft value")
+    return str(value)
+
+
+def render_rules(name, template_name, template_text, variables):
+    """
+    Render a host's ruleset: a header, one define per variable, then the
+    expanded template.
+
+    Raises:
+        ValueError: for a value nft cannot take
+    """
+    lines = ["#!/usr/sbin/nft -f",
+             f"# Rendered by assignment2.py --render for {name} from template {template_name}",
+             f'define hostname = "{name}"']
+    for var in sorted(variables):
+        try:
+            lines.append(f"define {var} = {_nft_value(variables[var])}")
+        except ValueError as e:
+            raise ValueError(f"variable {var}: {e}") from None
+    return "\n".join(lines) + "\n\n" + template_text
+
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _init_worker(context):
+    _context.clear()
+    _context.update(context)
+
+
+def render_host(item):
+    """
+    Validate and render one host into the output directory (runs in a
+    worker; the shared inputs come from _init_worker()).
+
+    Args:
+        item: (name, entry, digest)
+
+    Returns:
+        (name, digest, files, errors)
+    """
+    name, entry, digest = item
+    defaults, templates = _context["defaults"], _context["templates"]
+    errors = []
+    try:
+        netplan_text = netplan_utils.build_netplan_document(
+            desired_state.validate(host_state(entry, defaults)))
+    except desired_state.DesiredStateError as e:
+        errors.extend(f"network: {error}" for error in e.errors)
+        netplan_text = None
+
+    rules_text = None
+    template_name = entry.get("rules", defaults.get("rules"))
+    if template_name is not None:
+        variables = dict(defaults.get("vars") or {})
+        variables.update(entry.get("vars") or {})
+        try:
+            rules_text = render_rules(name, template_name, templates[template_name], variables)
+            nft_ruleset.parse_text(rules_text, source=f"{name}/{RULES_NAME}")
+        except (ValueError, nft_ruleset.NftParseError) as e:
+            errors.append(f"rules: {e}")
+    if errors:
+        return name, digest, [], errors
+
+    directory = os.path.join(_context["output"], name)
+    os.makedirs(directory, exist_ok=True)
+    files = [NETPLAN_NAME]
+    _write_atomic(os.path.join(directory, NETPLAN_NAME), netplan_text)
+    if rules_text is not None:
+        _write_atomic(os.path.join(directory, RULES_NAME), rules_text)
+        files.append(RULES_NAME)
+    return name, digest, files, []
+
+
+def _load_cache(output):
+    try:
+        with open(os.path.join(output, CACHE_NAME)) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _cached(cache, output, name, digest):
+    entry = cache.get(name)
+    return (isinstance(entry, dict) and entry.get("sha256") == digest and
+            all(os.path.exists(os.path.join(output, name, f)) for f in entry.get("files", ())))
+
+
+def render(inventory_path, output, jobs=None, force=False):
+    """
+    Render every host of an inventory and print a summary.
+
+    Args:
+        inventory_path (str): the inventory file
+        output (str): output directory
+        jobs (int or None): worker processes (default: one per CPU)
+        force (bool): ignore the input-hash cache
+
+    Returns:
+        dict with keys rendered, unchanged, failed, seconds, hosts_per_second
+
+    Raises:
+        OSError / InventoryError: if the inventory cannot be used
+    """
+    start = time.perf_counter()
+    hosts, defaults, templates = load_inventory(inventory_path)
+    jobs = jobs or os.cpu_count() or 1
+    code = _code_hash()
+    os.makedirs(output, exist_ok=True)
+    cache = {} if force else _load_cache(output)
+
+    todo, unchanged, new_cache = [], 0, {}
+    for name in sorted(hosts):
+        entry = hosts[name]
+        template_name = entry.get("rules", defaults.get("rules"))
+        digest = input_hash(name, entry, defaults, templates.get(template_name), code)
+        if _cached(cache, output, name, digest):
+            unchanged += 1
+            new_cache[name] = cache[name]
+        else:
+            todo.append((name, entry, digest))
+
+    context = {"defaults": defaults, "templates": templates, "output": os.path.abspath(output)}
+    if jobs == 1 or len(todo) < INLINE_HOSTS:
+        workers = 1
+        _init_worker(context)
+        results = map(render_host, todo)
+    else:
+        workers = min(jobs, len(todo))
+        pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                      initargs=(context,))
+        results = pool.map(render_host, todo, chunksize=max(1, len(todo) // (workers * 8)))
+
+    failed = []
+    try:
+        for name, digest, files, errors in results:
+            if errors:
+                failed.append((name, errors))
+            else:
+                new_cache[name] = {"sha256": digest, "files": files}
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    _write_atomic(os.path.join(output, CACHE_NAME), json.dumps(new_cache, indent=1, sort_keys=True))
+
+    seconds = time.perf_counter() - start
+    rendered = len(todo) - len(failed)
+    for name, errors in failed[:ERROR_LIMIT]:
+        print(f"  {name}: FAILED")
+        for error in errors:
+            print(f"      {error}")
+    if len(failed) > ERROR_LIMIT:
+        print(f"  ... {len(failed) - ERROR_LIMIT} more failed host(s)")
+    rate = len(hosts) / seconds if seconds else 0.0
+    print(f"Rendered {rendered} host(s), {unchanged} unchanged (cache), {len(failed)} failed "
+          f"into {output} in {seconds:.2f} s: {rate:,.0f} hosts/s ({workers} worker(s))")
+    return {"rendered": rendered, "unchanged": unchanged, "failed": len(failed),
+            "seconds": seconds, "hosts_per_second": rate}
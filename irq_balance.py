@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+"""
+IRQ Affinity and Queue Balancing
+
+Spreads one interface's interrupts and packet queues across cores,
+instead of leaving every IRQ on CPU0:
+
+    find        the interface's IRQs: the device's msi_irqs in sysfs, plus
+                /proc/interrupts lines named after the interface or device
+    place       CPUs of the NIC's NUMA node first (device/numa_node and
+                /sys/devices/system/node/nodeN/cpulist), all online CPUs
+                when sysfs exposes no node; IRQ i goes to CPU i round-robin
+    queues      tx queue i transmits from the CPU that takes IRQ i (XPS);
+                when there are fewer rx queues than CPUs, RPS spreads the
+                receive work over the node's CPUs
+    persist     a systemd oneshot unit that re-plans and applies at boot
+                ('python3 irq_balance.py IFACE'): MSI IRQ numbers change
+                across reboots and driver reloads, so they are looked up
+                again rather than stored
+
+Before and after, the per-CPU interrupt rate of the interface is sampled
+from /proc/interrupts; a dry run shows the projected distribution. All
+readers take the /proc and /sys roots as arguments (fixture trees).
+
+References:
+    - IRQ affinity: https://docs.kernel.org/core-api/irq/irq-affinity.html
+    - Scaling in the Linux networking stack: https://docs.kernel.org/networking/scaling.html
+    - sysfs NUMA nodes: https://www.kernel.org/doc/Documentation/ABI/stable/sysfs-devices-node
+    - systemd.service(5): https://www.freedesktop.org/software/systemd/man/systemd.service.html
+"""
+
+import argparse
+import glob
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+import executor
+import sysctl_profile
+from sysctl_profile import PROC_ROOT, SYS_ROOT
+
+UNIT_DIR = "/etc/systemd/system"
+UNIT_NAME = "assignment2-irq-{iface}.service"
+SAMPLE_SECONDS = 1.0
+
+
+class Irq:
+    __slots__ = ("number", "counts", "name")
+
+    def __init__(self, number, counts, name):
+        self.number = number
+        self.counts = counts        # {cpu id: interrupts since boot}
+        self.name = name            # chip / type / action columns
+
+
+class Plan:
+    __slots__ = ("iface", "node", "cpus", "irqs", "queues")
+
+    def __init__(self, iface, node, cpus):
+        self.iface = iface
+        self.node = node            # NUMA node of the NIC, or None
+        self.cpus = cpus            # CPUs used, in placement order
+        self.irqs = {}              # IRQ number -> CPU id
+        self.queues = []            # (sysfs path relative to the /sys root, value)
+
+
+def read_interrupts(proc_root=PROC_ROOT):
+    """
+    Parse /proc/interrupts.
+
+    Returns:
+        dict: IRQ number -> Irq (numbered IRQs only; NMI, LOC... are skipped)
+    """
+    irqs = {}
+    with open(os.path.join(proc_root, "interrupts")) as f:
+        header = f.readline().split()
+        cpus = [int(col[3:]) for col in header if col.startswith("CPU")]
+        for line in f:
+            label, _, rest = line.partition(":")
+            if not label.strip().isdigit():
+                continue
+            fields = rest.split()
+            counts = {}
+            for cpu, value in zip(cpus, fields):
+                if not value.isdigit():
+                    break
+                counts[cpu] = int(value)
+            name = " ".join(fields[len(counts):])
+            irqs[int(label)] = Irq(int(label), counts, name)
+    return irqs
+
+
+def _device_names(iface, sys_root):
+    """Names the interface's IRQs may carry: the interface and its device."""
+    names = {iface}
+    device = os.path.join(sys_root, "class/net", iface, "device")
+    if os.path.exists(device):
+        names.add(os.path.basename(os.path.realpath(device)))
+    return names
+
+
+def interface_irqs(iface, irqs, sys_root=SYS_ROOT):
+    """
+    Return the sorted IRQ numbers that belong to the interface.
+
+    Args:
+        irqs (dict): read_interrupts() output
+    """
+    found = set()
+    device = os.path.join(sys_root, "class/net", iface, "device")
+    # virtio NICs keep msi_irqs on the parent PCI device
+    for path in (device, os.path.join(device, "..")):
+        for entry in glob.glob(os.path.join(path, "msi_irqs", "*")):
+            name = os.path.basename(entry)
+            if name.isdigit() and int(name) in irqs:
+                found.add(int(name))
+    names = "|".join(re.escape(n) for n in sorted(_device_names(iface, sys_root)))
+    pattern = re.compile(rf"(^|[\s,@])({names})([-_.@:\s,]|$)")
+    for number, irq in irqs.items():
+        if pattern.search(irq.name):
+            found.add(number)
+    # the device's config/link-state vector carries no packets
+    return sorted(n for n in found if not irqs[n].name.endswith("-config"))
+
+
+def numa_node(iface, sys_root=SYS_ROOT):
+    """Return the NIC's NUMA node, or None if sysfs does not expose one."""
+    value = sysctl_profile.read_value(os.path.join(sys_root, "class/net", iface, "device", "numa_node"))
+    try:
+        node = int(value)
+    except (TypeError, ValueError):
+        return None
+    return node if node >= 0 else None
+
+
+def node_cpus(node, sys_root=SYS_ROOT):
+    """Return the CPU ids of a NUMA node ([] if unknown)."""
+    value = sysctl_profile.read_value(os.path.join(sys_root, "devices/system/node", f"node{node}", "cpulist"))
+    return sysctl_profile.parse_cpu_list(value) if value else []
+
+
+def read_affinity(irq, proc_root=PROC_ROOT):
+    """Return the CPUs an IRQ may run on ([] if unreadable)."""
+    value = sysctl_profile.read_value(os.path.join(proc_root, "irq", str(irq), "smp_affinity_list"))
+    return sysctl_profile.parse_cpu_list(value) if value else []
+
+
+def make_plan(iface, irqs, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    Place the interface's IRQs and queues.
+
+    Args:
+        iface (str): interface name
+        irqs (dict): read_interrupts() output
+
+    Returns:
+        Plan
+    """
+    online = sysctl_profile.read_cpus(proc_root, sys_root)
+    node = numa_node(iface, sys_root)
+    local = [cpu for cpu in node_cpus(node, sys_root) if cpu in online] if node is not None else []
+    cpus = local or online
+    numbers = interface_irqs(iface, irqs, sys_root)
+    # with CPUs to spare, leave CPU0 (timers, housekeeping) for last
+    if len(cpus) > len(numbers) and cpus[0] == 0:
+        cpus = cpus[1:] + cpus[:1]
+    plan = Plan(iface, node if local else None, cpus)
+    for i, number in enumerate(numbers):
+        plan.irqs[number] = cpus[i % len(cpus)]
+
+    base = os.path.join(sys_root, "class/net", iface, "queues")
+    rx = len(glob.glob(os.path.join(base, "rx-*")))
+    tx = len(glob.glob(os.path.join(base, "tx-*")))
+    rel = f"class/net/{iface}/queues"
+    if len(cpus) > 1:
+        rps = sysctl_profile.cpu_mask(cpus) if 0 < rx < len(cpus) else "0"
+        for q in range(rx):
+            plan.queues.append((f"{rel}/rx-{q}/rps_cpus", rps))
+        for q in range(tx):
+            plan.queues.append((f"{rel}/tx-{q}/xps_cpus", sysctl_profile.cpu_mask([cpus[q % len(cpus)]])))
+    return plan
+
+
+def sample_rates(numbers, seconds, proc_root=PROC_ROOT):
+    """
+    Interrupts per second of the given IRQs, per IRQ and CPU, measured
+    over `seconds`. With seconds == 0 the counts since boot are returned.
+
+    Returns:
+        dict: IRQ number -> {cpu id: rate}
+    """
+    first = read_interrupts(proc_root)
+    if seconds <= 0:
+        return {n: dict(first[n].counts) for n in numbers if n in first}
+    time.sleep(seconds)
+    second = read_interrupts(proc_root)
+    rates = {}
+    for n in numbers:
+        if n in first and n in second:
+            rates[n] = {cpu: (count - first[n].counts.get(cpu, 0)) / seconds
+                        for cpu, count in second[n].counts.items()}
+    return rates
+
+
+def per_cpu(rates):
+    """Sum per-IRQ rates into {cpu id: rate}."""
+    totals = {}
+    for by_cpu in rates.values():
+        for cpu, rate in by_cpu.items():
+            totals[cpu] = totals.get(cpu, 0) + rate
+    return totals
+
+
+def projected(rates, plan):
+    """Move each IRQ's total rate to its planned CPU."""
+    return {n: {plan.irqs[n]: sum(by_cpu.values())} for n, by_cpu in rates.items() if n in plan.irqs}
+
+
+def print_distribution(plan, before, after, affinity, unit, after_label):
+    """Print the before/after per-CPU table for the interface's IRQs."""
+    cpus = sorted(set(plan.cpus) | set(before) | set(after))
+    owned_before = {}
+    for n, allowed in affinity.items():
+        for cpu in allowed:
+            owned_before[cpu] = owned_before.get(cpu, 0) + 1
+    owned_after = {}
+    for cpu in plan.irqs.values():
+        owned_after[cpu] = owned_after.get(cpu, 0) + 1
+    print(f"\n  {'CPU':>5s} {'IRQs':>6s} {'before ' + unit:>16s}   {'IRQs':>6s} {after_label + ' ' + unit:>18s}")
+    for cpu in cpus:
+        print(f"  {cpu:5d} {owned_before.get(cpu, 0):6d} {before.get(cpu, 0):16,.0f}   "
+              f"{owned_after.get(cpu, 0):6d} {after.get(cpu, 0):18,.0f}")
+
+
+def irqbalance_running(proc_root=PROC_ROOT):
+    """True if an irqbalance daemon is running (it would move the IRQs back)."""
+    for path in glob.glob(os.path.join(proc_root, "[0-9]*", "comm")):
+        if sysctl_profile.read_value(path) == "irqbalance":
+            return True
+    return False
+
+
+def apply_plan(plan, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    Write the IRQ affinities and queue masks.
+
+    Returns:
+        list of str: settings that could not be written (kernel-managed
+        IRQs refuse affinity changes with EIO)
+    """
+    failed = []
+    writes = [(os.path.join(proc_root, "irq", str(n), "smp_affinity_list"), cpu)
+              for n, cpu in plan.irqs.items()]
+    writes += [(os.path.join(sys_root, rel), value) for rel, value in plan.queues]
+    for path, value in writes:
+        try:
+            with open(path, "w") as f:
+                f.write(f"{value}\n")
+        except OSError as e:
+            failed.append(f"{path}: {e.strerror}")
+    return failed
+
+
+def render_unit(plan, python=sys.executable, script=os.path.abspath(__file__)):
+    """
+    Render the systemd unit that re-applies the plan at boot. It runs this
+    module, which finds the interface's IRQs again, so the unit never
+    names IRQ numbers that may belong to another device after a reboot.
+    """
+    command = " ".join(shlex.quote(arg) for arg in (python, script, plan.iface))
+    return "\n".join([
+        "# Generated by assignment2.py --balance-irqs; re-run it to update",
+        "[Unit]",
+        f"Description=IRQ affinity and RPS/XPS for {plan.iface}",
+        f"After=sys-subsystem-net-devices-{plan.iface}.device",
+        f"BindsTo=sys-subsystem-net-devices-{plan.iface}.device",
+        "",
+        "[Service]",
+        "Type=oneshot",
+        "RemainAfterExit=yes",
+        f"ExecStart={command}",
+        "",
+        "[Install]",
+        f"WantedBy=sys-subsystem-net-devices-{plan.iface}.device",
+        "",
+    ])
+
+
+def persist(plan, unit_dir=UNIT_DIR):
+    """Write and enable the boot-time unit; returns its path."""
+    name = UNIT_NAME.format(iface=plan.iface)
+    path = os.path.join(unit_dir, name)
+    with open(path, "w") as f:
+        f.write(render_unit(plan))
+    executor.run(["systemctl", "daemon-reload"])
+    executor.run(["systemctl", "enable", name])
+    return path
+
+
+def run(iface, dry_run=False, sample_seconds=SAMPLE_SECONDS, proc_root=PROC_ROOT,
+        sys_root=SYS_ROOT, unit_dir=UNIT_DIR):
+    """
+    Balance an interface's IRQs and queues and show the distribution.
+
+    Args:
+        iface (str): interface name
+        dry_run (bool): only show the plan and the projected distribution
+        sample_seconds (float): rate sampling window (0: counts since boot)
+
+    Returns:
+        bool: True on success (also when the interface has no IRQs to move)
+    """
+    irqs = read_interrupts(proc_root)
+    plan = make_plan(iface, irqs, proc_root, sys_root)
+    if not plan.irqs:
+        print(f"No IRQs found for {iface} (virtual interface?); nothing to balance.")
+        return True
+    where = f"NUMA node {plan.node}" if plan.node is not None else "all online CPUs"
+    print(f"\n{iface}: {len(plan.irqs)} IRQ(s) over {where} "
+          f"({sysctl_profile.cpu_mask(plan.cpus)}), {len(plan.queues)} queue mask(s)")
+    for n, cpu in plan.irqs.items():
+        current = ",".join(map(str, read_affinity(n, proc_root))) or "?"
+        print(f"  IRQ {n:<5d} {irqs[n].name.split()[-1]:24s} CPU {current} -> {cpu}")
+
+    unit = "irq/s" if sample_seconds > 0 else "total"
+    affinity = {n: read_affinity(n, proc_root) for n in plan.irqs}
+    before = sample_rates(list(plan.irqs), sample_seconds, proc_root)
+    if dry_run:
+        print_distribution(plan, per_cpu(before), per_cpu(projected(before, plan)),
+                           affinity, unit, "projected")
+        print(f"\nDry run: nothing written (would also write {UNIT_NAME.format(iface=iface)}).")
+        return True
+
+    if irqbalance_running(proc_root):
+        print("[WARNING] irqbalance is running and may move these IRQs again; "
+              "ban them there or stop it (systemctl disable --now irqbalance).")
+    failed = apply_plan(plan, proc_root, sys_root)
+    for line in failed:
+        print(f"  [WARNING] not applied: {line}")
+    if sample_seconds > 0:
+        after, label = per_cpu(sample_rates(list(plan.irqs), sample_seconds, proc_root)), "after"
+    else:
+        after, label = per_cpu(projected(before, plan)), "projected"
+    print_distribution(plan, per_cpu(before), after, affinity, unit, label)
+    try:
+        path = persist(plan, unit_dir)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Balanced, but the boot-time unit could not be installed: {executor.describe(e)}")
+        return False
+    print(f"\nPersisted in {path} (enabled).")
+    return len(failed) < len(plan.irqs) + len(plan.queues)
+
+
+# ----------------------------------------------------------------------------
+# Boot time: run by the unit as 'python3 irq_balance.py IFACE'
+# ----------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-plan and apply an interface's IRQ "
+                                                 "and queue placement (run at boot).")
+    parser.add_argument("iface", help="the interface to balance")
+    args = parser.parse_args(argv)
+    plan = make_plan(args.iface, read_interrupts())
+    failed = apply_plan(plan)
+    for line in failed:
+        print(f"not applied: {line}")
+    print(f"{args.iface}: {len(plan.irqs)} IRQ(s) and {len(plan.queues)} queue mask(s) placed")
+    # kernel-managed IRQs refuse affinity changes; only fail if nothing took
+    return 1 if plan.irqs and len(failed) == len(plan.irqs) + len(plan.queues) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
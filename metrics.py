@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+Metrics Module
+
+Lightweight stage timing for one run of the tool. Stages are wrapped in
+spans:
+
+    with metrics.span("network.backup"):
+        backup_existing_netplan()
+
+Spans nest ("network.apply" inside "network" is reported as
+"network/network.apply"), repeated spans are summed, and time spent
+waiting at a prompt is never inside a span. Alongside durations the run
+keeps a few values (rule counts, interfaces applied) and the outcome of
+every apply.
+
+At the end of a run the breakdown can be printed (--trace) or written as
+JSON or as a Prometheus textfile-collector file for node_exporter. Both
+files are written atomically, as the textfile collector requires.
+
+References:
+    - Python time.perf_counter: https://docs.python.org/3/library/time.html#time.perf_counter
+    - Prometheus exposition format: https://prometheus.io/docs/instrumenting/exposition_formats/
+    - node_exporter textfile collector: https://github.com/prometheus/node_exporter#textfile-collector
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+PROM_PREFIX = "assignment2"
+DEFAULT_PROM_FILE = "/var/lib/node_exporter/textfile_collector/assignment2.prom"
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}      # path -> [seconds, calls], in first-seen order
+_values = {}      # name -> number
+_outcomes = {}    # kind -> status
+_started = time.time()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time a stage; nested spans are recorded under their parent's path."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    path = "/".join(stack)
+    with _lock:
+        entry = _stages.setdefault(path, [0.0, 0])  # parents listed before children
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+def set_value(name, value):
+    """Record a number for this run (e.g. 'nft_rules', 'interfaces_applied')."""
+    with _lock:
+        _values[name] = value
+
+
+def outcome(kind, status):
+    """Record the result of an apply ('netplan', 'nftables', 'fastpath': changed/unchanged/failed)."""
+    if status is not None:
+        with _lock:
+            _outcomes[kind] = status
+
+
+def reset():
+    """Forget everything recorded so far (e.g. between runs in one process)."""
+    global _started
+    with _lock:
+        _stages.clear()
+        _values.clear()
+        _outcomes.clear()
+        _started = time.time()
+
+
+def snapshot():
+    """Return everything recorded in this run as a JSON-friendly dict."""
+    with _lock:
+        return {
+            "started_at": _started,
+            "total_seconds": round(time.time() - _started, 6),
+            "stages": [{"stage": path, "seconds": round(total, 6), "calls": calls}
+                       for path, (total, calls) in _stages.items()],
+            "values": dict(_values),
+            "outcomes": dict(_outcomes),
+        }
+
+
+def print_trace():
+    """Print the timing breakdown, indented by nesting."""
+    data = snapshot()
+    print("\n==== Timing breakdown ====\n")
+    if not data["stages"]:
+        print("No stages were timed.")
+    for stage in data["stages"]:
+        depth = stage["stage"].count("/")
+        label = "  " * depth + stage["stage"].rsplit("/", 1)[-1]
+        calls = f"  x{stage['calls']}" if stage["calls"] > 1 else ""
+        print(f"{label:40s} {stage['seconds'] * 1000:10.1f} ms{calls}")
+    for name, value in sorted(data["values"].items()):
+        print(f"{name:40s} {value:>10}")
+    for kind, status in sorted(data["outcomes"].items()):
+        print(f"{kind + ' outcome':40s} {status:>10}")
+    print(f"{'total (wall clock, incl. prompts)':40s} {data['total_seconds'] * 1000:10.1f} ms\n")
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json(path):
+    """Write the run's metrics as JSON."""
+    _write_atomic(path, json.dumps(snapshot(), indent=2) + "\n")
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Render the run's metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    p = PROM_PREFIX
+    lines = [
+        f"# HELP {p}_stage_duration_seconds Time spent in each stage during the last run.",
+        f"# TYPE {p}_stage_duration_seconds gauge",
+    ]
+    for stage in data["stages"]:
+        lines.append(f'{p}_stage_duration_seconds{{stage="{_label(stage["stage"])}"}} {stage["seconds"]}')
+    lines += [
+        f"# HELP {p}_stage_calls Number of times each stage ran during the last run.",
+        f"# TYPE {p}_stage_calls gauge",
+    ]
+    for stage in data["stages"]:
+        lines.append(f'{p}_stage_calls{{stage="{_label(stage["stage"])}"}} {stage["calls"]}')
+    for name, value in sorted(data["values"].items()):
+        metric = f"{p}_{name}"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    lines += [
+        f"# HELP {p}_apply_outcome Result of the last apply (1 for the status that occurred).",
+        f"# TYPE {p}_apply_outcome gauge",
+    ]
+    for kind, status in sorted(data["outcomes"].items()):
+        lines.append(f'{p}_apply_outcome{{kind="{_label(kind)}",status="{_label(status)}"}} 1')
+    lines += [
+        f"# HELP {p}_run_duration_seconds Wall-clock length of the last run.",
+        f"# TYPE {p}_run_duration_seconds gauge",
+        f"{p}_run_duration_seconds {data['total_seconds']}",
+        f"# HELP {p}_last_run_timestamp_seconds Unix time the last run started.",
+        f"# TYPE {p}_last_run_timestamp_seconds gauge",
+        f"{p}_last_run_timestamp_seconds {data['started_at']:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=DEFAULT_PROM_FILE):
+    """Write the run's metrics for the node_exporter textfile collector."""
+    _write_atomic(path, prometheus_text())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+Targeted Netplan Apply
+
+'netplan apply' restarts networking for every interface, even when only
+one of them changed. On the networkd renderer the same result can be had
+for just the changed interfaces:
+
+    netplan generate                 # rewrite /run/systemd/network
+    networkctl reload                # networkd re-reads its .network/.netdev files
+    networkctl reconfigure <iface>   # re-applies one link, others are untouched
+
+Whether that is safe is decided from the structural diff between the
+netplan document on disk before the write and the one just written. A
+full 'netplan apply' is still used when the renderer is not networkd,
+when an interface was removed, or when a virtual device changed in a way
+networkd cannot change on a live link (VLAN id, bond/bridge members...).
+
+Every applied interface is polled while it is reconfigured and the time
+it spent down or without its addresses is reported.
+
+References:
+    - netplan generate: https://netplan.readthedocs.io/en/stable/netplan-generate/
+    - networkctl(1): https://www.freedesktop.org/software/systemd/man/latest/networkctl.html
+    - systemd.netdev(5): https://www.freedesktop.org/software/systemd/man/latest/systemd.netdev.html
+"""
+
+import asyncio
+import ipaddress
+import time
+
+import discovery
+import executor
+import netplan_model
+
+POLL_INTERVAL = 0.02   # seconds between link polls
+READY_TIMEOUT = 15.0   # give up waiting for an interface after this long
+SETTLE_TIME = 0.5      # minimum watch time, to catch links that drop late
+GRACE_TIME = 3.0       # after the command, wait this long for links still down
+
+# Keys of virtual devices that live in the .netdev file: networkd only
+# creates netdevs, it never changes an existing one, so these need a full
+# apply (as do renames, which udev only performs when a link appears)
+NETDEV_KEYS = {"ethernets": {"match", "set-name"}, "vlans": {"id", "link"},
+               "bonds": {"parameters", "interfaces"}, "bridges": {"parameters", "interfaces"}}
+
+
+def plan(old, new):
+    """
+    Decide how a change from one document to another should be applied.
+
+    Args:
+        old (NetplanDocument or None): what was on disk before (None if
+            there was no file or it could not be parsed)
+        new (NetplanDocument): what was just written
+
+    Returns:
+        (targets, reason): targets is a sorted list of interface names to
+        reconfigure, or None when a full 'netplan apply' is required, in
+        which case reason says why.
+    """
+    if old is None:
+        return None, "no previous configuration to compare with"
+    if new.renderer != "networkd" or old.renderer != "networkd":
+        return None, f"renderer is {new.renderer}, targeted apply needs networkd"
+
+    targets = set()
+    for section, name, key, _before, after in netplan_model.diff(old, new):
+        if name is None:
+            return None, f"document-level '{key}' changed"
+        if key is None and after is None:
+            return None, f"{section}.{name} was removed"
+        if key in NETDEV_KEYS.get(section, ()):
+            return None, f"{section}.{name}: '{key}' cannot be changed on a live device"
+        targets.add(name)
+        if section in ("bonds", "bridges") and key is None:
+            # a new bond/bridge takes its members away from their old setup
+            targets.update(new.get(name).interfaces or [])
+    return sorted(targets), None
+
+
+def _ready(rec, iface):
+    """True if a discovered link is up and carries what the document asks for."""
+    if rec is None or not rec["up"] or rec["state"] not in ("UP", "UNKNOWN"):
+        return False
+    if iface is None:
+        return True
+    present = {ipaddress.ip_interface(a) for a in rec["ipv4"] + rec["ipv6"]}
+    for addr in iface.addresses:
+        if ipaddress.ip_interface(addr) not in present:
+            return False
+    if iface.dhcp4 and not iface.addresses and not rec["ipv4"]:
+        return False
+    return True
+
+
+async def _watch(names, doc, cmd, loader, timeout):
+    down_since, downtime = {}, {name: 0.0 for name in names}
+    start, finished = time.monotonic(), None
+    task = asyncio.ensure_future(executor.run_async(cmd, timeout=timeout))
+    try:
+        while True:
+            now = time.monotonic()
+            records = loader()
+            for name in names:
+                ok = _ready(records.get(name), doc.get(name))
+                if not ok and name not in down_since:
+                    down_since[name] = now
+                elif ok and name in down_since:
+                    downtime[name] += (now - down_since.pop(name)) * 1000
+            # after the command, keep watching briefly for late flaps; links
+            # still down after the grace period (unplugged, optional, slow
+            # DHCP) are reported as not ready instead of stalling the run
+            settled = not down_since and now - start >= SETTLE_TIME
+            if task.done():
+                finished = now if finished is None else finished
+                if task.exception() or settled or now - finished >= GRACE_TIME:
+                    break
+            if now - start >= timeout:
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+        await task  # raises if the command failed or timed out
+    finally:
+        task.cancel()
+    for name in down_since:
+        downtime[name] = None
+    return downtime
+
+
+def watch_downtime(names, doc, cmd, loader=discovery.discover_interfaces,
+                   timeout=READY_TIMEOUT):
+    """
+    Run a command while polling the given interfaces, and measure how long
+    each one was not ready (down, or missing an address it should have).
+
+    Returns:
+        {name: downtime in ms, or None if it was not ready at the end}
+
+    Raises:
+        subprocess.CalledProcessError / subprocess.TimeoutExpired: if the
+        command failed or did not finish within the timeout
+    """
+    return asyncio.run(_watch(names, doc, cmd, loader, max(timeout, executor.timeout_for(cmd))))
+
+
+def apply_targeted(targets, doc, loader=discovery.discover_interfaces):
+    """
+    Regenerate the backend files and reconfigure only the given interfaces,
+    one at a time so that each downtime is measured on its own.
+
+    Returns:
+        {name: downtime ms or None}
+
+    Raises:
+        OSError / subprocess.SubprocessError: if a step failed
+    """
+    executor.run(["netplan", "generate"])
+    executor.run(["networkctl", "reload"])
+    downtime = {}
+    for name in targets:
+        downtime.update(watch_downtime([name], doc, ["networkctl", "reconfigure", name], loader))
+    return downtime
+
+
+def apply_full(doc, loader=discovery.discover_interfaces):
+    """
+    Run a global 'netplan apply' and measure every interface in the document.
+
+    Returns:
+        {name: downtime ms or None}
+
+    Raises:
+        OSError / subprocess.SubprocessError
+    """
+    names = [iface.name for iface in doc.interfaces()]
+    return watch_downtime(names, doc, ["netplan", "apply"], loader)
+
+
+def print_downtime(downtime):
+    """Print the per-interface downtime table."""
+    if not downtime:
+        print("No interfaces needed to be reconfigured.")
+        return
+    print(f"{'Interface':16s} {'Downtime':>12s}")
+    for name in sorted(downtime):
+        ms = downtime[name]
+        shown = "not ready" if ms is None else f"{ms:9.1f} ms"
+        print(f"{name:16s} {shown:>12s}")
@@ -0,0 +1,674 @@
+#!/usr/bin/env python3
+
+"""
+Netplan Document Model
+
+A compact, typed in-memory model of netplan documents (ethernets, VLANs,
+bonds, bridges, routes, nameservers), with a deterministic serializer, a
+parser for the YAML subset netplan files use, and a structural diff.
+
+The classes use __slots__ so that documents with thousands of VLAN
+subinterfaces stay small, and the serializer always emits interfaces in
+name order and keys in a fixed order, so the same document always
+produces the same bytes.
+
+References:
+    - Netplan Reference: https://netplan.io/reference/
+    - Netplan default routes (gateway4 deprecation): https://netplan.io/reference/#default-routes
+    - YAML 1.2 block collections: https://yaml.org/spec/1.2.2/#chapter-8-block-style-productions
+    - Python __slots__: https://docs.python.org/3/reference/datamodel.html#slots
+"""
+
+import json
+import re
+
+SECTIONS = ("ethernets", "vlans", "bonds", "bridges")
+DEFAULT_RENDERER = "networkd"
+HEADER = "# This file was generated by assignment2 tool"
+
+_INT_RE = re.compile(r"^-?\d+$")
+_KEY_RE = re.compile(r"^([^\s:][^:]*?(?::[^\s:][^:]*?)*)\s*:(?:\s+(.+))?$")
+_PLAIN_RE = re.compile(r"^[A-Za-z0-9_./@+-][A-Za-z0-9_./@+:-]*$")
+_BOOLS = {"true": True, "yes": True, "on": True, "false": False, "no": False, "off": False}
+_RESERVED = set(_BOOLS) | {"null", "~"}
+
+
+class NetplanParseError(ValueError):
+    """Raised when netplan YAML cannot be parsed; carries the line number."""
+
+    def __init__(self, message, line=None):
+        self.line = line
+        super().__init__(f"line {line}: {message}" if line else message)
+
+
+# ----------------------------------------------------------------------------
+# Model
+# ----------------------------------------------------------------------------
+class Route:
+    __slots__ = ("to", "via", "metric", "table", "on_link", "extra")
+
+    def __init__(self, to, via=None, metric=None, table=None, on_link=None, extra=None):
+        self.to = to
+        self.via = via
+        self.metric = metric
+        self.table = table
+        self.on_link = on_link
+        self.extra = extra or {}
+
+    def key(self):
+        return (self.to, self.via, self.metric, self.table, self.on_link,
+                tuple(sorted(self.extra.items())))
+
+    def to_dict(self):
+        data = {"to": self.to}
+        if self.via is not None:
+            data["via"] = self.via
+        if self.metric is not None:
+            data["metric"] = self.metric
+        if self.table is not None:
+            data["table"] = self.table
+        if self.on_link is not None:
+            data["on-link"] = self.on_link
+        for k in sorted(self.extra):
+            data[k] = self.extra[k]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        return cls(to=data.pop("to", None), via=data.pop("via", None),
+                   metric=data.pop("metric", None), table=data.pop("table", None),
+                   on_link=data.pop("on-link", None), extra=data)
+
+
+class Nameservers:
+    __slots__ = ("addresses", "search")
+
+    def __init__(self, addresses=None, search=None):
+        self.addresses = list(addresses or [])
+        self.search = list(search or [])
+
+    def key(self):
+        return (tuple(self.addresses), tuple(self.search))
+
+    def __bool__(self):
+        return bool(self.addresses or self.search)
+
+
+class Interface:
+    """Settings shared by every netplan device type."""
+
+    SECTION = None
+    FIELDS = ()  # type-specific slots, serialized before the common ones
+    __slots__ = ("name", "dhcp4", "dhcp6", "addresses", "routes", "nameservers",
+                 "mtu", "macaddress", "optional", "extra")
+
+    def __init__(self, name, dhcp4=False, dhcp6=None, addresses=None, routes=None,
+                 nameservers=None, mtu=None, macaddress=None, optional=None, extra=None):
+        self.name = name
+        self.dhcp4 = dhcp4
+        self.dhcp6 = dhcp6
+        self.addresses = list(addresses or [])
+        self.routes = list(routes or [])
+        self.nameservers = nameservers or Nameservers()
+        self.mtu = mtu
+        self.macaddress = macaddress
+        self.optional = optional
+        self.extra = extra or {}
+
+    def default_gateway(self, family=4):
+        """Return the via of the IPv4 (or IPv6) default route, or None."""
+        targets = ("default", "0.0.0.0/0") if family == 4 else ("default", "::/0")
+        for route in self.routes:
+            if route.to in targets and route.via and (":" in route.via) == (family == 6):
+                return route.via
+        return None
+
+    def to_dict(self):
+        """Return the netplan mapping for this interface, in serialization order."""
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value not in (None, [], {}):
+                data[field.replace("_", "-")] = value
+        if self.macaddress is not None:
+            data["macaddress"] = self.macaddress
+        if self.mtu is not None:
+            data["mtu"] = self.mtu
+        data["dhcp4"] = bool(self.dhcp4)
+        if self.dhcp6 is not None:
+            data["dhcp6"] = self.dhcp6
+        if self.addresses:
+            data["addresses"] = list(self.addresses)
+        if self.routes:
+            data["routes"] = [r.to_dict() for r in self.routes]
+        if self.nameservers:
+            ns = {}
+            if self.nameservers.addresses:
+                ns["addresses"] = list(self.nameservers.addresses)
+            if self.nameservers.search:
+                ns["search"] = list(self.nameservers.search)
+            data["nameservers"] = ns
+        if self.optional is not None:
+            data["optional"] = self.optional
+        for k in sorted(self.extra):
+            data[k] = self.extra[k]
+        return data
+
+    def key(self):
+        """Hashable value used for structural comparison."""
+        return (
+            self.SECTION,
+            tuple(_freeze(getattr(self, f)) for f in self.FIELDS),
+            bool(self.dhcp4), self.dhcp6, tuple(self.addresses),
+            tuple(r.key() for r in self.routes), self.nameservers.key(),
+            self.mtu, self.macaddress, self.optional, _freeze(self.extra),
+        )
+
+
+class Ethernet(Interface):
+    SECTION = "ethernets"
+    FIELDS = ("match", "set_name", "wakeonlan")
+    __slots__ = FIELDS
+
+    def __init__(self, name, match=None, set_name=None, wakeonlan=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.match = match or {}
+        self.set_name = set_name
+        self.wakeonlan = wakeonlan
+
+
+class Vlan(Interface):
+    SECTION = "vlans"
+    FIELDS = ("id", "link")
+    __slots__ = FIELDS
+
+    def __init__(self, name, id=None, link=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.id = id
+        self.link = link
+
+
+class Bond(Interface):
+    SECTION = "bonds"
+    FIELDS = ("interfaces", "parameters")
+    __slots__ = FIELDS
+
+    def __init__(self, name, interfaces=None, parameters=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.interfaces = list(interfaces or [])
+        self.parameters = parameters or {}
+
+
+class Bridge(Bond):
+    SECTION = "bridges"
+    __slots__ = ()
+
+
+CLASSES = {cls.SECTION: cls for cls in (Ethernet, Vlan, Bond, Bridge)}
+
+
+class NetplanDocument:
+    __slots__ = ("version", "renderer", "ethernets", "vlans", "bonds", "bridges")
+
+    def __init__(self, renderer=DEFAULT_RENDERER, version=2):
+        self.version = version
+        self.renderer = renderer
+        self.ethernets = {}
+        self.vlans = {}
+        self.bonds = {}
+        self.bridges = {}
+
+    def add(self, iface):
+        """Add an interface to the section that matches its type."""
+        getattr(self, iface.SECTION)[iface.name] = iface
+        return iface
+
+    def interfaces(self):
+        """Yield every interface, section by section, in name order."""
+        for section in SECTIONS:
+            entries = getattr(self, section)
+            for name in sorted(entries):
+                yield entries[name]
+
+    def get(self, name):
+        for section in SECTIONS:
+            iface = getattr(self, section).get(name)
+            if iface is not None:
+                return iface
+        return None
+
+    def __len__(self):
+        return sum(len(getattr(self, s)) for s in SECTIONS)
+
+
+def _freeze(value):
+    """Turn nested dicts/lists into hashable tuples."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# ----------------------------------------------------------------------------
+# Building from plain data
+# ----------------------------------------------------------------------------
+def interface_from_dict(section, name, conf):
+    """
+    Build an interface from a netplan (or desired-state) mapping.
+
+    Accepts the deprecated gateway4/gateway6 keys and the desired-state
+    'gateway' key and turns them into default routes; a flat nameservers
+    list is accepted as well as netplan's {addresses, search} mapping.
+    """
+    conf = dict(conf)
+    cls = CLASSES[section]
+    kwargs = {}
+    for field in cls.FIELDS:
+        key = field.replace("_", "-")
+        if key in conf:
+            kwargs[field] = conf.pop(key)
+
+    routes = [Route.from_dict(r) for r in conf.pop("routes", [])]
+    for key, default in (("gateway6", "::/0"), ("gateway", "default"), ("gateway4", "default")):
+        if key in conf:
+            routes.insert(0, Route(default, via=conf.pop(key)))
+
+    ns = conf.pop("nameservers", None)
+    search = conf.pop("search", [])
+    if isinstance(ns, dict):
+        nameservers = Nameservers(ns.get("addresses"), ns.get("search") or search)
+    else:
+        nameservers = Nameservers(ns, search)
+
+    return cls(
+        name,
+        dhcp4=bool(conf.pop("dhcp4", False)),
+        dhcp6=conf.pop("dhcp6", None),
+        addresses=conf.pop("addresses", []),
+        routes=routes,
+        nameservers=nameservers,
+        mtu=conf.pop("mtu", None),
+        macaddress=conf.pop("macaddress", None),
+        optional=conf.pop("optional", None),
+        extra=conf,
+        **kwargs,
+    )
+
+
+def from_dict(data):
+    """Build a NetplanDocument from a parsed mapping (with or without 'network')."""
+    network = data.get("network", data) if isinstance(data, dict) else {}
+    doc = NetplanDocument(renderer=network.get("renderer", DEFAULT_RENDERER),
+                          version=network.get("version", 2))
+    for section in SECTIONS:
+        for name, conf in (network.get(section) or {}).items():
+            doc.add(interface_from_dict(section, str(name), conf or {}))
+    return doc
+
+
+# ----------------------------------------------------------------------------
+# Serializer
+# ----------------------------------------------------------------------------
+def _scalar(value):
+    if value.__class__ is str:
+        if _PLAIN_RE.match(value) and value[-1] != ":" and value.lower() not in _RESERVED \
+                and not _INT_RE.match(value):
+            return value
+        return json.dumps(value)
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if value is None:
+        return "null"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return _scalar(str(value))
+
+
+def _emit(out, pad, key, value):
+    """Append 'key: value' (recursing into lists and dicts) to out."""
+    if isinstance(value, dict):
+        if not value:
+            out.append(f"{pad}{key}: {{}}")
+            return
+        out.append(f"{pad}{key}:")
+        inner = pad + "  "
+        for k, v in value.items():
+            _emit(out, inner, k, v)
+    elif isinstance(value, list):
+        if not value:
+            out.append(f"{pad}{key}: []")
+        elif all(not isinstance(v, (dict, list)) for v in value) and key != "addresses":
+            out.append(f"{pad}{key}: [{', '.join(_scalar(v) for v in value)}]")
+        else:
+            out.append(f"{pad}{key}:")
+            for item in value:
+                if isinstance(item, dict):
+                    first = True
+                    for k, v in item.items():
+                        sub = []
+                        _emit(sub, pad + "    ", k, v)
+                        if first:
+                            sub[0] = f"{pad}  - " + sub[0][len(pad) + 4:]
+                            first = False
+                        out.extend(sub)
+                else:
+                    out.append(f"{pad}  - {_scalar(item)}")
+    else:
+        out.append(f"{pad}{key}: {_scalar(value)}")
+
+
+def _interface_lines(out, iface, pad):
+    """Append one interface's settings; same key order as Interface.to_dict()."""
+    for field in iface.FIELDS:
+        value = getattr(iface, field)
+        if value not in (None, [], {}):
+            _emit(out, pad, field.replace("_", "-"), value)
+    if iface.macaddress is not None:
+        out.append(f"{pad}macaddress: {_scalar(iface.macaddress)}")
+    if iface.mtu is not None:
+        out.append(f"{pad}mtu: {iface.mtu}")
+    out.append(f"{pad}dhcp4: true" if iface.dhcp4 else f"{pad}dhcp4: false")
+    if iface.dhcp6 is not None:
+        out.append(f"{pad}dhcp6: {_scalar(iface.dhcp6)}")
+    if iface.addresses:
+        out.append(f"{pad}addresses:")
+        out.extend([f"{pad}  - {_scalar(a)}" for a in iface.addresses])
+    if iface.routes:
+        out.append(f"{pad}routes:")
+        for route in iface.routes:
+            lead = f"{pad}  - "
+            for key, value in route.to_dict().items():
+                if isinstance(value, (dict, list)):
+                    sub = []
+                    _emit(sub, pad + "    ", key, value)
+                    sub[0] = lead + sub[0][len(pad) + 4:]
+                    out.extend(sub)
+                else:
+                    out.append(f"{lead}{key}: {_scalar(value)}")
+                lead = f"{pad}    "
+    if iface.nameservers:
+        out.append(f"{pad}nameservers:")
+        if iface.nameservers.addresses:
+            out.append(f"{pad}  addresses:")
+            out.extend([f"{pad}    - {_scalar(a)}" for a in iface.nameservers.addresses])
+        if iface.nameservers.search:
+            out.append(f"{pad}  search: [{', '.join(_scalar(d) for d in iface.nameservers.search)}]")
+    if iface.optional is not None:
+        out.append(f"{pad}optional: {_scalar(iface.optional)}")
+    for key in sorted(iface.extra):
+        _emit(out, pad, key, iface.extra[key])
+
+
+def serialize(doc, header=HEADER):
+    """
+    Serialize a document to netplan YAML.
+
+    Output is deterministic: sections in netplan order, interfaces sorted
+    by name and keys in a fixed order.
+    """
+    out = [header] if header else []
+    out.append("network:")
+    out.append(f"  version: {doc.version}")
+    out.append(f"  renderer: {doc.renderer}")
+    for section in SECTIONS:
+        entries = getattr(doc, section)
+        if not entries:
+            continue
+        out.append(f"  {section}:")
+        for name in sorted(entries):
+            out.append(f"    {_scalar(name)}:")
+            _interface_lines(out, entries[name], "      ")
+    return "\n".join(out) + "\n"
+
+
+# ----------------------------------------------------------------------------
+# Parser (the YAML subset netplan files use)
+# ----------------------------------------------------------------------------
+def _strip_comment(text):
+    if "#" not in text:
+        return text
+    quote = None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "#" and (i == 0 or text[i - 1] in " \t"):
+            return text[:i]
+    return text
+
+
+def _parse_scalar(text, lineno):
+    text = text.strip()
+    if not text:
+        return None
+    if text[0] == '"':
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise NetplanParseError(f"bad quoted string {text}", lineno) from None
+    if text[0] == "'":
+        if not text.endswith("'") or len(text) < 2:
+            raise NetplanParseError(f"bad quoted string {text}", lineno)
+        return text[1:-1].replace("''", "'")
+    if text[0] == "[":
+        if not text.endswith("]"):
+            raise NetplanParseError("unterminated flow sequence", lineno)
+        inner = text[1:-1].strip()
+        return [_parse_scalar(v, lineno) for v in _split_flow(inner)] if inner else []
+    if text[0] == "{":
+        if not text.endswith("}"):
+            raise NetplanParseError("unterminated flow mapping", lineno)
+        result = {}
+        for item in _split_flow(text[1:-1].strip()):
+            key, sep, value = item.partition(":")
+            if not sep:
+                raise NetplanParseError(f"expected 'key: value' in {text}", lineno)
+            result[_parse_scalar(key, lineno)] = _parse_scalar(value, lineno)
+        return result
+    lower = text.lower()
+    if lower in _BOOLS:
+        return _BOOLS[lower]
+    if lower in ("null", "~"):
+        return None
+    if _INT_RE.match(text):
+        return int(text)
+    return text
+
+
+def _split_flow(text):
+    """Split 'a, "b, c", [d, e]' at top-level commas."""
+    items, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    if text[start:].strip():
+        items.append(text[start:])
+    return [i.strip() for i in items]
+
+
+def _split_key(text, lineno):
+    """Split 'key: value' / 'key:' into (key, value_text or None)."""
+    if text[0] in "\"'":
+        end = text.find(text[0], 1)
+        if end < 0:
+            raise NetplanParseError(f"bad quoted key {text}", lineno)
+        key, rest = _parse_scalar(text[:end + 1], lineno), text[end + 1:].lstrip()
+        if not rest.startswith(":"):
+            return None, None
+        rest = rest[1:].strip()
+        return key, (rest or None)
+    match = _KEY_RE.match(text)
+    if match is None:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+class _YamlParser:
+    def __init__(self, text):
+        self.lines = []  # [indent, text, lineno]
+        append = self.lines.append
+        for lineno, raw in enumerate(text.splitlines(), start=1):
+            body = raw.lstrip(" ")
+            if not body or body[0] == "#":
+                continue
+            indent = len(raw) - len(body)
+            if body[0] == "\t":
+                raise NetplanParseError("tabs are not allowed for indentation", lineno)
+            if "#" in body:
+                body = _strip_comment(body)
+            body = body.rstrip()
+            if not body or body in ("---", "..."):
+                continue
+            append([indent, body, lineno])
+        self.pos = 0
+
+    def parse(self):
+        if not self.lines:
+            return {}
+        value = self.block(self.lines[0][0])
+        if self.pos < len(self.lines):
+            raise NetplanParseError("unexpected indentation", self.lines[self.pos][2])
+        return value
+
+    def block(self, indent):
+        if self.lines[self.pos][1].startswith("- ") or self.lines[self.pos][1] == "-":
+            return self.sequence(indent)
+        return self.mapping(indent)
+
+    def _child(self, parent_indent, lineno, allow_same_indent_seq):
+        """Parse the nested block after 'key:' (or return None if empty)."""
+        if self.pos >= len(self.lines):
+            return None
+        indent, text, _ = self.lines[self.pos]
+        if indent > parent_indent:
+            return self.block(indent)
+        if allow_same_indent_seq and indent == parent_indent and \
+                (text.startswith("- ") or text == "-"):
+            return self.sequence(indent)
+        return None
+
+    def mapping(self, indent):
+        result = {}
+        while self.pos < len(self.lines):
+            line_indent, text, lineno = self.lines[self.pos]
+            if line_indent < indent:
+                break
+            if line_indent > indent:
+                raise NetplanParseError("unexpected indentation", lineno)
+            if text.startswith("- "):
+                break
+            key, value = _split_key(text, lineno)
+            if key is None:
+                raise NetplanParseError(f"expected 'key: value', got '{text}'", lineno)
+            self.pos += 1
+            if value is None:
+                result[key] = self._child(indent, lineno, allow_same_indent_seq=True)
+            else:
+                result[key] = _parse_scalar(value, lineno)
+        return result
+
+    def sequence(self, indent):
+        result = []
+        while self.pos < len(self.lines):
+            line_indent, text, lineno = self.lines[self.pos]
+            if line_indent != indent or not (text.startswith("- ") or text == "-"):
+                if line_indent > indent:
+                    raise NetplanParseError("unexpected indentation", lineno)
+                break
+            rest = text[1:].strip()
+            if not rest:
+                self.pos += 1
+                result.append(self._child(indent, lineno, allow_same_indent_seq=False))
+                continue
+            key, value = _split_key(rest, lineno) if rest[0] not in "[{" else (None, None)
+            if key is not None:
+                # '- key: value' starts a mapping indented past the dash
+                item_indent = indent + (len(text) - len(rest))
+                self.lines[self.pos] = [item_indent, rest, lineno]
+                result.append(self.mapping(item_indent))
+            else:
+                self.pos += 1
+                result.append(_parse_scalar(rest, lineno))
+        return result
+
+
+def parse_yaml(text):
+    """Parse netplan-style YAML text into plain dicts/lists/scalars."""
+    return _YamlParser(text).parse()
+
+
+def parse(text):
+    """Parse netplan YAML text into a NetplanDocument."""
+    return from_dict(parse_yaml(text))
+
+
+def load(path):
+    """Parse a netplan file into a NetplanDocument."""
+    with open(path) as f:
+        return parse(f.read())
+
+
+# ----------------------------------------------------------------------------
+# Structural diff
+# ----------------------------------------------------------------------------
+def diff(old, new):
+    """
+    Compare two documents structurally.
+
+    Returns:
+        list of (section, name, key, old_value, new_value). key is None when
+        a whole interface was added or removed; section and name are None
+        for document-level keys such as the renderer. Examples:
+            ("ethernets", "eth0", "mtu", 1500, 9000)
+            ("vlans", "eth0.10", None, None, {...})
+    """
+    changes = []
+    for key in ("version", "renderer"):
+        if getattr(old, key) != getattr(new, key):
+            changes.append((None, None, key, getattr(old, key), getattr(new, key)))
+    for section in SECTIONS:
+        before, after = getattr(old, section), getattr(new, section)
+        for name in sorted(set(before) | set(after)):
+            a, b = before.get(name), after.get(name)
+            if a is None:
+                changes.append((section, name, None, None, b.to_dict()))
+            elif b is None:
+                changes.append((section, name, None, a.to_dict(), None))
+            elif a.key() != b.key():
+                da, db = a.to_dict(), b.to_dict()
+                for key in list(da) + [k for k in db if k not in da]:
+                    if da.get(key) != db.get(key):
+                        changes.append((section, name, key, da.get(key), db.get(key)))
+    return changes
+
+
+def changed_interfaces(old, new):
+    """
+    Return {name: "added" | "removed" | "changed"} for every interface that
+    differs between two documents.
+    """
+    result = {}
+    for section, name, key, before, after in diff(old, new):
+        if name is None:
+            continue
+        if key is None:
+            result[name] = "added" if before is None else "removed"
+        else:
+            result.setdefault(name, "changed")
+    return result
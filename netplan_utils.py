@@ -7,21 +7,31 @@ References:
     - Netplan Documentation: https://netplan.io/
     - Netplan Reference: https://netplan.io/reference/
     - Ubuntu Network Configuration: https://ubuntu.com/server/docs/network-configuration
-    - Python shutil: https://docs.python.org/3/library/shutil.html
-    - Python datetime: https://docs.python.org/3/library/datetime.html
     - sysctl man page: https://man7.org/linux/man-pages/man8/sysctl.8.html
 """
 
 import os
-import shutil
 import subprocess
-from datetime import datetime
 
 # Import Person A's functions
+import address_check
+import apply_state
+import backup_store
+import desired_state
+import discovery
+import executor
+import firewall
+import irq_balance
+import metrics
+import netplan_apply
+import netplan_model
 import network_core
+import nft_flowtable
+import preflight
+import sysctl_profile
 
 NETPLAN_FILE = "/etc/netplan/99-config.yaml"
-DEFAULT_RENDERER = "networkd"  # change to "NetworkManager" if needed
+DEFAULT_RENDERER = netplan_model.DEFAULT_RENDERER  # change to "NetworkManager" if needed
 IP_FORWARD_CONF = "/etc/sysctl.d/99-ipforward.conf"
 
 
@@ -38,22 +48,51 @@ def ask_nameservers():
     if not ns_raw:
         return []
     tokens = ns_raw.replace(",", " ").split()
+    invalid = []
+    for token in tokens:
+        try:
+            address_check.parse_host_address(token)
+        except ValueError as e:
+            invalid.append(str(e))
+    if invalid:
+        print(f"Invalid nameserver(s): {'; '.join(invalid)}")
+        return ask_nameservers()
     return tokens
 
 
-def ask_gateway():
+def ask_gateway(address_cidr=None):
     """
     Ask user for default gateway IPv4 address.
 
+    Args:
+        address_cidr (str or None): the interface address; when given, the
+            gateway must be another host of its subnet
+
     Returns:
         gateway (str)
     """
+    try:
+        subnet = address_check.parse_host_interface(address_cidr) if address_cidr else None
+    except ValueError:
+        subnet = None    # left to the pre-flight address check
     while True:
         gw = input("Enter default gateway IPv4 address (e.g. 192.168.1.1): ").strip()
-        if "." in gw:  # TODO: optional better validation
-            return gw
-        else:
+        try:
+            gateway = address_check.parse_host_address(gw, version=4)
+        except ValueError as e:
+            print(f"Invalid gateway: {e}")
             print("Please enter a valid IPv4 address, for example 192.168.1.1.")
+            continue
+        if subnet is None:
+            return str(gateway)
+        if gateway == subnet.ip:
+            print(f"{gateway} is this interface's own address.")
+        elif gateway not in subnet.network:
+            print(f"{gateway} is not reachable on {subnet.network}; enter a gateway inside it.")
+        elif gateway == subnet.network.broadcast_address and subnet.network.prefixlen < 31:
+            print(f"{gateway} is the broadcast address of {subnet.network}.")
+        else:
+            return str(gateway)
 
 
 def build_netplan_yaml(interface, mode, address_cidr, gateway, nameservers, renderer=DEFAULT_RENDERER):
@@ -71,77 +110,162 @@ def build_netplan_yaml(interface, mode, address_cidr, gateway, nameservers, rend
     Returns:
         yaml_content (str)
     """
-    ns_str = ", ".join(nameservers) if nameservers else ""
-
+    doc = netplan_model.NetplanDocument(renderer=renderer)
     if mode == "dhcp":
-        yaml = f"""# This file was generated by assignment2 tool
-network:
-  version: 2
-  renderer: {renderer}
-  ethernets:
-    {interface}:
-      dhcp4: yes"""
-        if nameservers:
-            yaml += f"""
-      nameservers:
-        addresses: [{ns_str}]
-"""
-        else:
-            yaml += "\n"
+        iface = netplan_model.Ethernet(interface, dhcp4=True)
     else:  # static
-        yaml = f"""# This file was generated by assignment2 tool
-network:
-  version: 2
-  renderer: {renderer}
-  ethernets:
-    {interface}:
-      dhcp4: no
-      addresses:
-        - {address_cidr}
-      gateway4: {gateway}
-      nameservers:
-        addresses: [{ns_str}]
-"""
-    return yaml
+        iface = netplan_model.Ethernet(
+            interface,
+            dhcp4=False,
+            addresses=[address_cidr],
+            routes=[netplan_model.Route("default", via=gateway)] if gateway else [],
+        )
+    iface.nameservers = netplan_model.Nameservers(nameservers)
+    doc.add(iface)
+    return netplan_model.serialize(doc)
+
+
+def build_netplan_document(state):
+    """
+    Build one merged netplan YAML string for a whole desired state.
+
+    Args:
+        state (dict): validated desired state (see desired_state.py)
+
+    Returns:
+        yaml_content (str)
+    """
+    return netplan_model.serialize(netplan_model.from_dict(state))
 
 
 def backup_existing_netplan():
-    """Backup existing 99-config.yaml if it exists."""
+    """
+    Backup existing 99-config.yaml into the backup store if it exists.
+    Identical contents are stored only once, and old '.bak-<timestamp>'
+    copies left in /etc/netplan are moved into the store.
+    """
+    imported = backup_store.import_legacy_backups(NETPLAN_FILE)
+    if imported:
+        print(f"Moved {imported} old backup file(s) out of /etc/netplan into {backup_store.STORE_DIR}")
     if os.path.exists(NETPLAN_FILE):
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        backup_path = f"{NETPLAN_FILE}.bak-{timestamp}"
-        print(f"Backing up existing {NETPLAN_FILE} to {backup_path}")
-        shutil.copy2(NETPLAN_FILE, backup_path)
+        sha = backup_store.save_file("netplan", NETPLAN_FILE)
+        print(f"Backed up existing {NETPLAN_FILE} to the backup store ({sha[:12]})")
 
 
-def write_netplan_file(content):
-    """Write new content to 99-config.yaml."""
+def write_netplan_file(content, inventory=None):
+    """Write new content to 99-config.yaml and invalidate the inventory."""
     print(f"Writing new configuration to {NETPLAN_FILE}...")
     with open(NETPLAN_FILE, "w") as f:
         f.write(content)
     print("File written successfully.")
+    if inventory is not None:
+        inventory.invalidate()
+
+
+def read_current_document():
+    """
+    Parse the netplan file currently on disk, so a later apply can tell
+    which interfaces changed.
 
+    Returns:
+        NetplanDocument, or None if there is no file or it cannot be parsed
+    """
+    try:
+        return netplan_model.load(NETPLAN_FILE)
+    except (OSError, netplan_model.NetplanParseError):
+        return None
+
+
+def apply_netplan(inventory=None, previous=None):
+    """
+    Apply netplan configuration, record what was applied and invalidate
+    the inventory.
 
-def apply_netplan():
-    """Apply netplan configuration."""
+    On the networkd renderer only the interfaces that differ from the
+    previous document are reconfigured; everything else keeps running.
+    A global 'netplan apply' is used when that is not possible.
+
+    Args:
+        inventory (InterfaceInventory or None): invalidated after the apply
+        previous (NetplanDocument or None): the configuration before the
+            write, from read_current_document()
+
+    Returns:
+        bool: True if the apply succeeded
+    """
     try:
-        print("Applying netplan configuration...")
-        subprocess.check_call(["netplan", "apply"])
+        document = netplan_model.load(NETPLAN_FILE)
+    except (OSError, netplan_model.NetplanParseError) as e:
+        print(f"Could not read back {NETPLAN_FILE}: {e}")
+        return False
+
+    targets, reason = netplan_apply.plan(previous, document)
+    metrics.set_value("interfaces_applied",
+                      len(document.interfaces()) if targets is None else len(targets))
+    try:
+        if targets is not None:
+            print(f"Applying to changed interfaces only: {', '.join(targets) or 'none'}")
+            try:
+                with metrics.span("targeted"):
+                    downtime = netplan_apply.apply_targeted(targets, document)
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"Targeted apply failed ({e}); falling back to 'netplan apply'.")
+                with metrics.span("full"):
+                    downtime = netplan_apply.apply_full(document)
+        else:
+            print(f"Applying netplan configuration ({reason})...")
+            with metrics.span("full"):
+                downtime = netplan_apply.apply_full(document)
         print("netplan apply completed.")
+        netplan_apply.print_downtime(downtime)
     except Exception as e:
-        print(f"Could not run 'netplan apply': {e}")
+        print(f"Could not run 'netplan apply': {executor.describe(e)}")
         print("Run 'sudo netplan apply' manually if needed.")
+        return False
+    finally:
+        if inventory is not None:
+            inventory.invalidate()
+    apply_state.record("netplan", path=NETPLAN_FILE, sha256=apply_state.file_hash(NETPLAN_FILE))
+    return True
+
+
+def report_unchanged():
+    """Tell the user the netplan configuration is already in place."""
+    print(f"No changes: {NETPLAN_FILE} already contains this configuration and it was applied.")
+    print("Skipping backup, write and apply.")
+
+
+def run_preflight(yaml_content):
+    """
+    Check the generated configuration (netplan generate in a scratch root,
+    address and gateway sanity) before anything is backed up or written.
+
+    Returns:
+        bool: True if every check passed
+    """
+    with metrics.span("network.preflight"):
+        passed = preflight.run(NETPLAN_FILE, yaml_content)
+    if not passed:
+        print(f"Pre-flight checks failed; {NETPLAN_FILE} was not touched.")
+    return passed
 
 
-def enable_ip_forwarding():
+def enable_ip_forwarding(inventory=None):
     """
     Optionally enable IPv4 forwarding if user agrees.
 
     - Writes /etc/sysctl.d/99-ipforward.conf
     - Runs 'sysctl -p' on that file
+    - Offers the router performance profile (see sysctl_profile.py)
+    - Offers the nftables flowtable fast path (see nft_flowtable.py)
+
+    Args:
+        inventory (InterfaceInventory or None): shared inventory for this run
     """
     # Check if multiple non-loopback interfaces exist
-    if not network_core.has_multiple_non_loopback_interfaces():
+    with metrics.span("forwarding.discovery"):
+        multiple = network_core.has_multiple_non_loopback_interfaces(inventory)
+    if not multiple:
         return  # nothing to do
 
     ans = input(
@@ -153,31 +277,91 @@ def enable_ip_forwarding():
     conf_content = "net.ipv4.ip_forward=1\n"
     print(f"Writing IP forwarding config to {IP_FORWARD_CONF}")
     try:
-        with open(IP_FORWARD_CONF, "w") as f:
-            f.write(conf_content)
+        with metrics.span("forwarding.write"):
+            with open(IP_FORWARD_CONF, "w") as f:
+                f.write(conf_content)
         print("IP forwarding config written.")
         print("Applying sysctl settings...")
-        subprocess.check_call(["sysctl", "-p", IP_FORWARD_CONF])
+        with metrics.span("forwarding.sysctl"):
+            output = executor.run(["sysctl", "-p", IP_FORWARD_CONF]).stdout
+        print(output, end="")
         print("IPv4 forwarding enabled.")
     except Exception as e:
-        print(f"Failed to enable IP forwarding: {e}")
+        print(f"Failed to enable IP forwarding: {executor.describe(e)}")
+        return
 
+    ans = input(
+        "Also apply the router performance profile (sysctls sized from CPUs, memory and NICs)? (y/n): "
+    ).strip().lower()
+    if ans == "y":
+        with metrics.span("forwarding.profile"):
+            sysctl_profile.run()
 
-def configure_network():
+    ans = input(
+        "Add a flowtable fast path so established forwarded connections skip the forward chains? (y/n): "
+    ).strip().lower()
+    if ans == "y":
+        if inventory is None:
+            inventory = discovery.InterfaceInventory()
+        names = [name for name, _ip in inventory.non_loopback()]
+        chosen = input(f"Interfaces for the fast path [{','.join(names)}]: ").strip()
+        devices = nft_flowtable.parse_devices(chosen) if chosen else names
+        metrics.outcome("fastpath", firewall.configure_fastpath(devices))
+
+
+def offer_irq_balancing(iface):
+    """
+    Offer to spread the selected interface's IRQs and RPS/XPS queues across
+    CPUs (see irq_balance.py). Skipped on single-CPU hosts and for
+    interfaces without IRQs of their own.
+
+    Args:
+        iface (str): the interface chosen in network_core.choose_interface()
+    """
+    try:
+        irqs = irq_balance.read_interrupts()
+    except OSError:
+        return
+    if len(sysctl_profile.read_cpus()) < 2 or not irq_balance.interface_irqs(iface, irqs):
+        return
+    ans = input(
+        f"Spread {iface}'s interrupts and queues across CPUs (persisted across reboots)? (y/n): "
+    ).strip().lower()
+    if ans == "y":
+        with metrics.span("network.irq_balance"):
+            irq_balance.run(iface)
+
+
+def configure_network(inventory=None, router=False):
     """
     High-level function that runs the full network configuration flow.
 
     Uses functions from:
     - Person A (network_core)
     - Person B (this file)
+
+    Args:
+        inventory (InterfaceInventory or None): shared inventory for this run;
+            the system is scanned once and reused by every step.
+        router (bool): afterwards, offer IP forwarding (with the router
+            profile and fast path) and IRQ balancing for the interface;
+            off by default so that configuring an address never turns the
+            host into a router
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED, apply_state.FAILED (the
+        pre-flight checks or the apply failed), or None if the user aborted
     """
     print("\n==== Ubuntu Netplan Configuration Helper ====\n")
+    if inventory is None:
+        inventory = discovery.InterfaceInventory()
 
     # 1) Show current interfaces
-    interfaces = network_core.show_current_interfaces()
+    with metrics.span("network.discovery"):
+        interfaces = network_core.show_current_interfaces(inventory)
 
     # 2) User selects one
-    iface = network_core.choose_interface(interfaces)
+    iface = network_core.choose_interface(interfaces, inventory)
     print(f"\nYou selected interface: {iface}\n")
 
     # 3) Ask DHCP or Static
@@ -194,39 +378,124 @@ def configure_network():
             nameservers = ask_nameservers()
     else:
         print("You chose Static mode.")
-        current_ip = network_core.get_current_ipv4(iface)
+        current_ip = network_core.get_current_ipv4(iface, inventory)
         address_cidr = network_core.ask_ip_address(current_ip)
         nameservers = ask_nameservers()
-        gateway = ask_gateway()
+        gateway = ask_gateway(address_cidr)
 
     # Build YAML
-    yaml_content = build_netplan_yaml(
-        interface=iface,
-        mode=mode,
-        address_cidr=address_cidr,
-        gateway=gateway,
-        nameservers=nameservers,
-        renderer=DEFAULT_RENDERER,
-    )
+    with metrics.span("network.generate"):
+        yaml_content = build_netplan_yaml(
+            interface=iface,
+            mode=mode,
+            address_cidr=address_cidr,
+            gateway=gateway,
+            nameservers=nameservers,
+            renderer=DEFAULT_RENDERER,
+        )
 
     print("\nGenerated netplan configuration:\n")
     print(yaml_content)
 
+    with metrics.span("network.check"):
+        unchanged = apply_state.netplan_unchanged(NETPLAN_FILE, yaml_content)
+    if unchanged:
+        report_unchanged()
+        return apply_state.UNCHANGED
+
+    if not run_preflight(yaml_content):
+        return apply_state.FAILED
+
     # Confirm with user
     confirm = input(
         f"Do you want to write this config to {NETPLAN_FILE}? (y/n): "
     ).strip().lower()
     if confirm != "y":
         print("Aborting network configuration without changes.")
-        return
+        return None
 
     # Backup and write
-    backup_existing_netplan()
-    write_netplan_file(yaml_content)
+    with metrics.span("network.backup"):
+        previous = read_current_document()
+        backup_existing_netplan()
+    with metrics.span("network.write"):
+        write_netplan_file(yaml_content, inventory)
 
     # Apply?
     apply_now = input("Do you want to apply the new configuration now? (y/n): ").strip().lower()
     if apply_now == "y":
-        apply_netplan()
+        with metrics.span("network.apply"):
+            applied = apply_netplan(inventory, previous)
+        if not applied:
+            return apply_state.FAILED
     else:
         print("Remember to run 'sudo netplan apply' later to activate the changes.")
+
+    # Routing, only when asked for: reuse the same inventory instead of rescanning
+    if router:
+        enable_ip_forwarding(inventory)
+        offer_irq_balancing(iface)
+    return apply_state.CHANGED
+
+
+def configure_network_from_file(config_path, inventory=None):
+    """
+    Configure every interface described in a desired-state file at once.
+
+    The whole file is validated first; then one merged netplan file is
+    written and 'netplan apply' runs a single time.
+
+    Args:
+        config_path (str): path to the desired-state file
+        inventory (InterfaceInventory or None): shared inventory for this run
+
+    Returns:
+        apply_state.CHANGED, apply_state.UNCHANGED or apply_state.FAILED
+    """
+    print("\n==== Netplan Batch Configuration ====\n")
+    print(f"Loading desired state from {config_path}...")
+    try:
+        with metrics.span("network.validate"):
+            state = desired_state.load(config_path)
+    except OSError as e:
+        print(f"Could not read {config_path}: {e}")
+        return apply_state.FAILED
+    except desired_state.DesiredStateError as e:
+        print(f"Desired state is invalid ({len(e.errors)} problem(s)), nothing was written:")
+        for error in e.errors:
+            print(f"  - {error}")
+        return apply_state.FAILED
+
+    counts = ", ".join(f"{len(state[s])} {s}" for s in desired_state.SECTIONS if state[s])
+    print(f"Desired state is valid: {counts}.")
+
+    if inventory is not None:
+        missing = [name for name in state["ethernets"]
+                   if "match" not in state["ethernets"][name] and inventory.get(name) is None]
+        if missing:
+            print(f"Warning: not present on this host: {', '.join(missing)}")
+
+    with metrics.span("network.generate"):
+        yaml_content = build_netplan_document(state)
+    print("\nGenerated netplan configuration:\n")
+    print(yaml_content)
+
+    with metrics.span("network.check"):
+        unchanged = apply_state.netplan_unchanged(NETPLAN_FILE, yaml_content)
+    if unchanged:
+        report_unchanged()
+        return apply_state.UNCHANGED
+
+    if not run_preflight(yaml_content):
+        return apply_state.FAILED
+
+    with metrics.span("network.backup"):
+        previous = read_current_document()
+        backup_existing_netplan()
+    with metrics.span("network.write"):
+        write_netplan_file(yaml_content, inventory)
+    with metrics.span("network.apply"):
+        applied = apply_netplan(inventory, previous)
+    if not applied:
+        return apply_state.FAILED
+    return apply_state.CHANGED
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+nftables Flowtable Fast Path
+
+Generates a small table of its own that moves established forwarded
+connections onto a flowtable. The first packets of a connection go
+through the forward chains of the main ruleset as before; once conntrack
+sees the connection established, 'flow add' puts it in the flowtable and
+its later packets are forwarded from the ingress hook, skipping the
+forward chains, routing lookups and the rest of the netfilter path:
+
+    table inet fastpath {
+        flowtable ft {
+            hook ingress priority filter
+            devices = { eth0, eth1 }
+        }
+        chain forward {
+            type filter hook forward priority filter + 10; policy accept;
+            meta l4proto { tcp, udp } ct state established flow add @ft
+        }
+    }
+
+The chain runs after the main ruleset's forward chains (priority
+filter + 10), so only packets those chains accepted reach 'flow add'; a
+packet they drop never gets offloaded. The table is separate from the
+rules file, so it can be added and removed without touching it, and it
+is always replaced as a whole (see replace_script()).
+
+References:
+    - nftables flowtables: https://wiki.nftables.org/wiki-nftables/index.php/Flowtables
+    - Netfilter flowtable infrastructure: https://docs.kernel.org/networking/nf_flowtable.html
+    - nft(8) flowtable statement: https://www.netfilter.org/projects/nftables/manpage.html
+"""
+
+import os
+import re
+
+TABLE_FAMILY = "inet"
+TABLE_NAME = "fastpath"
+FLOWTABLE_NAME = "ft"
+CHAIN_PRIORITY = "filter + 10"     # after the main ruleset's forward chains
+PROTOCOLS = ("tcp", "udp")         # what flowtables can offload
+PROC_ROOT = "/proc"
+SYS_ROOT = "/sys"
+
+_IFNAME_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,15}$")
+
+
+def render(devices, table_name=TABLE_NAME):
+    """
+    Render the fast-path table for the given devices.
+
+    Args:
+        devices (list of str): interfaces whose forwarded flows are offloaded
+        table_name (str): name of the inet table
+
+    Returns:
+        str: an nft rules file
+    """
+    return "\n".join([
+        "# Flowtable fast path for forwarded connections, generated by assignment2.py",
+        f"table {TABLE_FAMILY} {table_name} {{",
+        f"\tflowtable {FLOWTABLE_NAME} {{",
+        "\t\thook ingress priority filter",
+        f"\t\tdevices = {{ {', '.join(devices)} }}",
+        "\t}",
+        "",
+        "\tchain forward {",
+        f"\t\ttype filter hook forward priority {CHAIN_PRIORITY}; policy accept;",
+        f"\t\tmeta l4proto {{ {', '.join(PROTOCOLS)} }} ct state established "
+        f"flow add @{FLOWTABLE_NAME}",
+        "\t}",
+        "}",
+        "",
+    ])
+
+
+def replace_script(text, table_name=TABLE_NAME):
+    """
+    Wrap a rendered fast path so that 'nft -f -' replaces the table as a
+    whole in one transaction: declare it (so the delete cannot fail), delete
+    it, add it back. Changing the devices of a flowtable in place fails
+    while the 'flow add' rule still uses it.
+    """
+    where = f"{TABLE_FAMILY} {table_name}"
+    return f"table {where} {{}}\ndelete table {where}\n{text}"
+
+
+def parse_devices(value):
+    """Split a comma/space separated interface list, keeping the order."""
+    devices = []
+    for name in re.split(r"[,\s]+", value.strip()):
+        if name and name not in devices:
+            devices.append(name)
+    return devices
+
+
+def validate(devices, ruleset=None, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    Check that the fast path can work on this host.
+
+    Args:
+        devices (list of str): flowtable devices
+        ruleset (Ruleset or None): the main ruleset, to detect a clash
+            with its table names
+        proc_root, sys_root (str): /proc and /sys (or fixture trees)
+
+    Returns:
+        (errors, warnings): two lists of str
+    """
+    errors, warnings = [], []
+    if not devices:
+        errors.append("no devices for the flowtable")
+    for name in devices:
+        if not _IFNAME_RE.match(name):
+            errors.append(f"{name!r} is not a valid interface name")
+        elif name == "lo":
+            errors.append("lo cannot be a flowtable device")
+        elif not os.path.isdir(os.path.join(sys_root, "class/net", name)):
+            errors.append(f"interface {name} does not exist")
+    if len(devices) == 1:
+        warnings.append(f"only {devices[0]} is in the flowtable: flows are offloaded only "
+                        f"when both directions use flowtable devices")
+
+    if ruleset is not None and (TABLE_FAMILY, TABLE_NAME) in ruleset.tables:
+        errors.append(f"the rules file already has a table {TABLE_FAMILY} {TABLE_NAME}")
+
+    try:
+        with open(os.path.join(proc_root, "sys/net/ipv4/ip_forward")) as f:
+            if f.read().strip() != "1":
+                warnings.append("IPv4 forwarding is off: nothing is forwarded, so nothing is offloaded")
+    except OSError:
+        pass
+    if not os.path.isdir(os.path.join(sys_root, "module/nf_flow_table")):
+        warnings.append("nf_flow_table is not loaded yet (nft loads it when the table is added)")
+    return errors, warnings
+
+
+def summary(devices, text):
+    """One deterministic line describing a rendered fast path (for dry runs)."""
+    lines = text.count("\n")
+    return (f"fastpath: table {TABLE_FAMILY} {TABLE_NAME}, flowtable {FLOWTABLE_NAME}, "
+            f"{len(devices)} device(s), 1 rule, {lines} lines")
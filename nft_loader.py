@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+"""
+Streaming nftables Loader
+
+Loads very large rules files with bounded memory. The file is read one
+line at a time through a generator pipeline:
+
+    iter_source_lines()  ->  check_syntax()  ->  chunks()  ->  nft -f - (stdin)
+
+Includes are expanded in place, braces and quotes are checked as lines
+pass through, and only a small line map (one entry per include boundary)
+is kept so that errors reported by nft against /dev/stdin can be
+translated back to the original file and line.
+
+References:
+    - nft(8): https://www.netfilter.org/projects/nftables/manpage.html
+    - Python generators: https://docs.python.org/3/howto/functional.html#generators
+    - Python subprocess.Popen: https://docs.python.org/3/library/subprocess.html#popen-objects
+    - Python bisect: https://docs.python.org/3/library/bisect.html
+"""
+
+import bisect
+import re
+import resource
+import subprocess
+import threading
+
+from nft_ruleset import NftParseError, iter_source_lines, DEFAULT_INCLUDE_DIRS
+
+CHUNK_BYTES = 64 * 1024
+_STDIN_ERR_RE = re.compile(r"(/dev/stdin|-):(\d+):")
+
+
+class LineMap:
+    """
+    Maps line numbers of the concatenated stream back to (source, line).
+
+    Only discontinuities are stored, so memory grows with the number of
+    include boundaries, not with the file size.
+    """
+
+    def __init__(self):
+        self.starts = []     # output line where a segment starts
+        self.segments = []   # (source, first source line)
+        self.lines = 0
+        self._last = None
+
+    def record(self, source, lineno):
+        self.lines += 1
+        if self._last != (source, lineno - 1):
+            self.starts.append(self.lines)
+            self.segments.append((source, lineno))
+        self._last = (source, lineno)
+
+    def lookup(self, out_line):
+        """Return (source, lineno) for a line of the concatenated stream."""
+        i = bisect.bisect_right(self.starts, out_line) - 1
+        if i < 0:
+            return None, out_line
+        source, first = self.segments[i]
+        return source, first + (out_line - self.starts[i])
+
+    def translate(self, message):
+        """Rewrite '/dev/stdin:N:' locations in nft output to 'file:line:'."""
+        def repl(match):
+            source, lineno = self.lookup(int(match.group(2)))
+            return f"{source}:{lineno}:"
+        return _STDIN_ERR_RE.sub(repl, message)
+
+
+def check_syntax(lines, line_map=None):
+    """
+    Pass (text, source, lineno) lines through while checking that braces
+    balance and quotes are closed.
+
+    Raises:
+        NftParseError: with the file and line of the first problem
+    """
+    open_blocks = []  # (source, lineno) of each unclosed '{'
+    for text, source, lineno in lines:
+        if '"' not in text and "'" not in text and "#" not in text:
+            # fast path: no quotes or comments to skip
+            opens, closes = text.count("{"), text.count("}")
+            if not closes:
+                open_blocks.extend([(source, lineno)] * opens)
+                if line_map is not None:
+                    line_map.record(source, lineno)
+                yield text
+                continue
+        in_quote = None
+        for ch in text:
+            if in_quote:
+                if ch == in_quote:
+                    in_quote = None
+                continue
+            if ch in "\"'":
+                in_quote = ch
+            elif ch == "#":
+                break
+            elif ch == "{":
+                open_blocks.append((source, lineno))
+            elif ch == "}":
+                if not open_blocks:
+                    raise NftParseError("unexpected '}'", source, lineno)
+                open_blocks.pop()
+        if in_quote:
+            raise NftParseError("unterminated string", source, lineno)
+        if line_map is not None:
+            line_map.record(source, lineno)
+        yield text
+    if open_blocks:
+        source, lineno = open_blocks[-1]
+        raise NftParseError("'{' is never closed", source, lineno)
+
+
+def chunks(texts, size=CHUNK_BYTES):
+    """Group lines into byte chunks of roughly the given size."""
+    buf, length = [], 0
+    for text in texts:
+        data = text if text.endswith("\n") else text + "\n"
+        data = data.encode()
+        buf.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buf)
+            buf, length = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def check_file(path, include_dirs=DEFAULT_INCLUDE_DIRS):
+    """
+    Run the include expansion and syntax checks without loading anything.
+
+    Returns:
+        LineMap for the expanded stream
+
+    Raises:
+        NftParseError / OSError
+    """
+    line_map = LineMap()
+    for _text in check_syntax(iter_source_lines(path, include_dirs), line_map):
+        pass
+    return line_map
+
+
+def stream_load(path, include_dirs=DEFAULT_INCLUDE_DIRS, check_only=False):
+    """
+    Stream a rules file into 'nft -f -' (or 'nft -c -f -' with check_only).
+
+    Returns:
+        dict with keys ok, lines, bytes, error, peak_rss_kb
+    """
+    line_map = LineMap()
+    cmd = ["nft", "-c", "-f", "-"] if check_only else ["nft", "-f", "-"]
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        return {"ok": False, "lines": 0, "bytes": 0, "error": f"could not run nft: {e}",
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+    drain.start()
+
+    sent, error = 0, None
+    try:
+        for chunk in chunks(check_syntax(iter_source_lines(path, include_dirs), line_map)):
+            proc.stdin.write(chunk)
+            sent += len(chunk)
+    except (NftParseError, OSError) as e:
+        error = str(e)
+        proc.kill()  # never hand nft a partial file
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        proc.wait()
+        drain.join()
+
+    if error is None and proc.returncode != 0:
+        message = b"".join(stderr).decode(errors="replace").strip()
+        error = line_map.translate(message) or f"nft exited with status {proc.returncode}"
+
+    return {
+        "ok": error is None,
+        "lines": line_map.lines,
+        "bytes": sent,
+        "error": error,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
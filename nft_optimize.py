@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+
+"""
+nftables Rules Analyzer / Optimizer
+
+Finds rules that cost per-packet evaluation time without changing what the
+ruleset does, and builds an equivalent ruleset without them:
+
+    duplicate    the same rule text as an earlier terminal rule in the chain
+    shadowed     every packet it matches was already matched by an earlier
+                 terminal rule with the same verdict
+    unreachable  shadowed by an earlier rule with a different verdict (the
+                 rule never fires, which is usually a mistake)
+    merge        a run of adjacent rules that differ in one match only,
+                 folded into one rule with an anonymous set:
+                     tcp dport 22 accept
+                     tcp dport 80 accept     ->  tcp dport { 22, 80, 443 } accept
+                     tcp dport 443 accept
+
+Rules are compared within one chain. A rule is only understood as a list of
+simple matches (addresses, ports, interfaces, protocols, ct state) followed
+by counter/log/comment and a verdict; anything else (limits, quotas, marks,
+NAT, bitmask operators) makes the rule opaque, and opaque rules are never
+used to shadow or merge others. The analysis is therefore conservative:
+whatever it removes or merges can be removed or merged without changing
+any verdict. Counters of merged rules are combined into one.
+
+The cost estimate counts match expressions a packet evaluates in the worst
+case (falling through every rule of a base chain and the chains it jumps
+to); a set lookup counts as one expression however many elements it has.
+
+References:
+    - nftables sets: https://wiki.nftables.org/wiki-nftables/index.php/Sets
+    - nftables performance: https://wiki.nftables.org/wiki-nftables/index.php/Performance
+    - nft(8), matches and statements: https://www.netfilter.org/projects/nftables/manpage.html
+    - Python ipaddress: https://docs.python.org/3/library/ipaddress.html
+"""
+
+import copy
+import ipaddress
+import itertools
+import re
+import socket
+
+from nft_compile import merge_intervals
+
+ADDR, PORT, STR, RAW = "addr", "port", "str", "raw"
+
+# Match selectors the analyzer understands: (protocol, field) -> value kind
+SELECTORS = {
+    ("ip", "saddr"): ADDR, ("ip", "daddr"): ADDR, ("ip", "protocol"): STR,
+    ("ip6", "saddr"): ADDR, ("ip6", "daddr"): ADDR, ("ip6", "nexthdr"): STR,
+    ("tcp", "sport"): PORT, ("tcp", "dport"): PORT,
+    ("udp", "sport"): PORT, ("udp", "dport"): PORT,
+    ("sctp", "sport"): PORT, ("sctp", "dport"): PORT,
+    ("th", "sport"): PORT, ("th", "dport"): PORT,
+    ("icmp", "type"): STR, ("icmpv6", "type"): STR,
+    ("ct", "state"): STR, ("ct", "direction"): STR,
+    ("meta", "l4proto"): STR, ("meta", "nfproto"): STR, ("meta", "protocol"): STR,
+    ("meta", "iifname"): STR, ("meta", "oifname"): STR,
+    ("meta", "iif"): STR, ("meta", "oif"): STR, ("meta", "pkttype"): STR,
+}
+# Meta keys nft prints without the 'meta' keyword
+BARE_META = ("iifname", "oifname", "iif", "oif", "l4proto", "nfproto", "pkttype")
+
+TERMINAL_VERDICTS = ("accept", "drop", "reject", "return", "goto")
+# Words that make a rule's match depend on state or have side effects
+STATEFUL_WORDS = {"limit", "quota", "meter", "numgen", "jhash", "symhash",
+                  "count", "last", "add", "update", "delete"}
+LOG_OPTIONS = ("prefix", "level", "flags", "group", "snaplen", "queue-threshold")
+
+_L3_PROTOCOLS = {"ip", "ip6"}
+_L4_PROTOCOLS = {"tcp", "udp", "sctp", "icmp", "icmpv6"}
+_SELECTOR_WORDS = set(BARE_META) | {proto for proto, _field in SELECTORS}
+_TOKEN_RE = re.compile(r'\{[^}]*\}|"[^"]*"|\S+')
+_EQ_OPS = ("==", "eq")
+_NE_OPS = ("!=", "ne")
+_OTHER_OPS = ("<", ">", "<=", ">=", "lt", "gt", "le", "ge", "&", "|", "^", "and", "or", "xor",
+              "map", "vmap")
+
+
+class Term:
+    """One match: key, value kind, parsed values and its token span."""
+    __slots__ = ("key", "kind", "negated", "text", "values", "start", "end")
+
+    def __init__(self, key, kind, negated, text, values, start, end):
+        self.key = key            # e.g. ("tcp", "dport")
+        self.kind = kind          # ADDR, PORT, STR or RAW (compare as text)
+        self.negated = negated
+        self.text = text          # the value as written
+        self.values = values      # networks, (low, high) ranges or strings
+        self.start = start        # token span of the whole match
+        self.end = end
+
+    def point(self):
+        """Return a hashable single value, or None for sets/ranges/CIDRs."""
+        if self.negated or self.kind == RAW or len(self.values) != 1:
+            return None
+        value = self.values[0]
+        if self.kind == ADDR:
+            return str(value.network_address) if value.num_addresses == 1 else None
+        if self.kind == PORT:
+            return value[0] if value[0] == value[1] else None
+        return value
+
+    def covers(self, other):
+        """True if every packet matching other also matches self (same key)."""
+        if self.negated or other.negated or RAW in (self.kind, other.kind):
+            return self.negated == other.negated and self.text == other.text
+        if self.kind == ADDR:
+            return all(any(n.version == m.version and n.subnet_of(m) for m in self.values)
+                       for n in other.values)
+        if self.kind == PORT:
+            return all(any(lo <= low and high <= hi for lo, hi in self.values)
+                       for low, high in other.values)
+        return set(other.values) <= set(self.values)
+
+    def overlaps(self, other):
+        """False only if no packet can match both self and other (same key)."""
+        if self.negated or other.negated or RAW in (self.kind, other.kind):
+            return True
+        if self.kind == ADDR:
+            return any(n.version == m.version and n.overlaps(m)
+                       for n in self.values for m in other.values)
+        if self.kind == PORT:
+            return any(lo <= high and low <= hi
+                       for lo, hi in self.values for low, high in other.values)
+        return bool(set(self.values) & set(other.values))
+
+
+class ParsedRule:
+    """A rule split into matches, trailing statements and verdict."""
+    __slots__ = ("text", "tokens", "terms", "tail", "verdict", "pure", "stateful")
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _TOKEN_RE.findall(text)
+        self.terms = []         # None when the matches could not be parsed
+        self.tail = ""          # statements + verdict, as text
+        self.verdict = None     # e.g. "accept", "jump blk0", "reject with tcp reset"
+        self.pure = False       # tail is only counter/log/comment + verdict
+        self.stateful = any(t in STATEFUL_WORDS for t in self.tokens)
+        _parse_rule(self)
+
+    @property
+    def terminal(self):
+        """Matching packets never reach the next rule of the chain."""
+        return self.verdict is not None and self.verdict.split()[0] in TERMINAL_VERDICTS
+
+    @property
+    def can_shadow(self):
+        return self.terminal and self.pure and self.terms is not None and not self.stateful
+
+    @property
+    def target(self):
+        """Chain named by a jump/goto verdict, if any."""
+        if self.verdict and self.verdict.split()[0] in ("jump", "goto"):
+            return self.tokens[-1]
+        return None
+
+    def expressions(self):
+        """Match expressions evaluated for this rule (at least one)."""
+        if self.terms is not None:
+            return max(1, len(self.terms))
+        return max(1, sum(1 for t in self.tokens if t in _SELECTOR_WORDS))
+
+    def covers(self, other):
+        """True if every packet matching other also matches self."""
+        mine = {t.key: t for t in self.terms}
+        theirs = {t.key: t for t in other.terms}
+        return all(key in theirs and term.covers(theirs[key]) for key, term in mine.items())
+
+    def disjoint(self, other):
+        """True if no packet can match both rules (so their order does not matter)."""
+        if self.terms is None or other.terms is None:
+            return False
+        theirs = {t.key: t for t in other.terms}
+        if any(t.key in theirs and not t.overlaps(theirs[t.key]) for t in self.terms):
+            return True
+        # a packet has one network and one transport protocol
+        for group in (_L3_PROTOCOLS, _L4_PROTOCOLS):
+            mine = {t.key[0] for t in self.terms} & group
+            other_protos = {t.key[0] for t in other.terms} & group
+            if mine and other_protos and not mine & other_protos:
+                return True
+        return False
+
+
+class Finding:
+    __slots__ = ("kind", "chain", "index", "other", "rule", "detail")
+
+    def __init__(self, kind, chain, index, other, rule, detail=""):
+        self.kind = kind        # "duplicate", "shadowed", "unreachable" or "merge"
+        self.chain = chain      # "family table chain"
+        self.index = index      # 1-based rule position in the original chain
+        self.other = other      # the shadowing rule's position / last rule of a run
+        self.rule = rule        # rule text (the merged rule for "merge")
+        self.detail = detail
+
+
+class Analysis:
+    __slots__ = ("findings", "optimized", "before", "after")
+
+    def __init__(self, findings, optimized, before, after):
+        self.findings = findings
+        self.optimized = optimized  # equivalent Ruleset
+        self.before = before        # estimate_cost() of the input
+        self.after = after          # estimate_cost() of the optimized ruleset
+
+    def count(self, kind):
+        return sum(1 for f in self.findings if f.kind == kind)
+
+    def is_optimal(self):
+        return not self.findings
+
+
+# ----------------------------------------------------------------------------
+# Rule parsing
+# ----------------------------------------------------------------------------
+def _split_values(text):
+    if text.startswith("{"):
+        return [v.strip() for v in text[1:-1].split(",") if v.strip()]
+    return [text]
+
+
+def _parse_port(value, proto):
+    low, sep, high = value.partition("-")
+    try:
+        if sep:
+            return int(low), int(high)
+        return int(value), int(value)
+    except ValueError:
+        # service name, e.g. 'ssh'; /etc/services knows tcp/udp/sctp
+        port = socket.getservbyname(value, proto if proto in ("tcp", "udp", "sctp") else "tcp")
+        return port, port
+
+
+def _parse_values(kind, text, proto):
+    """Parse a value or inline set; returns (kind, values), RAW when unsure."""
+    if text.startswith(("@", "$")) or " . " in text or (kind != ADDR and ":" in text):
+        return RAW, [text]
+    values = []
+    try:
+        for value in _split_values(text):
+            if kind == ADDR:
+                if "-" in value:
+                    first, last = (ipaddress.ip_address(v) for v in value.split("-", 1))
+                    values.extend(ipaddress.summarize_address_range(first, last))
+                else:
+                    values.append(ipaddress.ip_network(value, strict=False))
+            elif kind == PORT:
+                values.append(_parse_port(value, proto))
+            else:
+                if "*" in value:
+                    return RAW, [text]
+                values.extend(v for v in value.split(",") if v)
+    except (ValueError, OSError):
+        return RAW, [text]
+    if kind == ADDR and len(values) > 1:
+        values = list(ipaddress.collapse_addresses([v for v in values if v.version == 4])) + \
+            list(ipaddress.collapse_addresses([v for v in values if v.version == 6]))
+    elif kind == PORT and len(values) > 1:
+        values = merge_intervals(values)
+    return kind, values
+
+
+def verdict_start(tokens):
+    """Return the index where the verdict starts, or None if there is none."""
+    if tokens and tokens[-1] in ("accept", "drop", "return"):
+        return len(tokens) - 1
+    if len(tokens) > 1 and tokens[-2] in ("jump", "goto"):
+        return len(tokens) - 2
+    if "reject" in tokens:
+        return len(tokens) - 1 - tokens[::-1].index("reject")
+    return None
+
+
+def _parse_rule(rule):
+    tokens = rule.tokens
+    end = verdict_start(tokens)
+    if end is not None:
+        rule.verdict = " ".join(tokens[end:])
+    else:
+        end = len(tokens)
+
+    i, terms = 0, []
+    while i < end:
+        start = i
+        word = tokens[i]
+        if word in BARE_META:
+            key, i = ("meta", word), i + 1
+        elif i + 1 < end and (word, tokens[i + 1]) in SELECTORS:
+            key, i = (word, tokens[i + 1]), i + 2
+        else:
+            break
+        negated = False
+        if i < end and tokens[i] in _EQ_OPS + _NE_OPS:
+            negated = tokens[i] in _NE_OPS
+            i += 1
+        if i >= end or tokens[i] in _OTHER_OPS:
+            rule.terms = None
+            return
+        kind, values = _parse_values(SELECTORS[key], tokens[i], key[0])
+        i += 1
+        terms.append(Term(key, kind, negated, tokens[i - 1], values, start, i))
+    rule.terms = terms if len({t.key for t in terms}) == len(terms) else None
+    rule.tail = " ".join(tokens[i:])
+
+    # only counter / log / comment may sit between the matches and the verdict
+    while i < end:
+        word = tokens[i]
+        if word == "counter":
+            i += 1
+        elif word == "log":
+            i += 1
+            while i + 1 < end and tokens[i] in LOG_OPTIONS:
+                i += 2
+        elif word == "comment" and i + 1 < end:
+            i += 2
+        else:
+            return
+    rule.pure = rule.terms is not None
+
+
+# ----------------------------------------------------------------------------
+# Analysis
+# ----------------------------------------------------------------------------
+def _find_shadower(rule, general, points):
+    """Return the position of the earliest earlier rule that covers rule."""
+    best = next((pos for pos, other in general if other.covers(rule)), None)
+    if points:
+        pairs = [(t.key, t.point()) for t in rule.terms if t.point() is not None]
+        for size in range(len(pairs) + 1):
+            for combo in itertools.combinations(pairs, size):
+                pos = points.get(frozenset(combo))
+                if pos is not None and (best is None or pos < best):
+                    best = pos
+    return best
+
+
+def _remove_redundant(label, rules, findings):
+    """Return the rules of one chain without duplicates and shadowed rules."""
+    seen = {}        # rule text -> position of an earlier terminal rule
+    general = []     # (position, rule) shadowers with sets/ranges/CIDRs
+    points = {}      # frozenset of (key, value) -> position, single-value shadowers
+    kept = []
+    for pos, rule in enumerate(rules, start=1):
+        if rule.text in seen:
+            findings.append(Finding("duplicate", label, pos, seen[rule.text], rule.text))
+            continue
+        if rule.terms is not None:
+            shadow = _find_shadower(rule, general, points)
+            if shadow is not None:
+                other = rules[shadow - 1]
+                kind = "shadowed" if other.verdict == rule.verdict else "unreachable"
+                findings.append(Finding(kind, label, pos, shadow, rule.text, other.text))
+                continue
+        kept.append((pos, rule))
+        if rule.terminal and not rule.stateful:
+            seen.setdefault(rule.text, pos)
+        if rule.can_shadow:
+            pairs = [(t.key, t.point()) for t in rule.terms]
+            if all(value is not None for _key, value in pairs):
+                points.setdefault(frozenset(pairs), pos)
+            else:
+                general.append((pos, rule))
+    return kept
+
+
+def _merge_signature(rule, index):
+    """What must be equal for rules to merge on their index-th match."""
+    term = rule.terms[index]
+    if term.negated or term.kind == RAW:
+        return None
+    others = tuple((t.key, t.negated, t.text) for n, t in enumerate(rule.terms) if n != index)
+    return (index, term.key, term.kind, others, rule.tail)
+
+
+def _render_values(kind, values):
+    if kind == ADDR:
+        values = list(ipaddress.collapse_addresses([v for v in values if v.version == 4])) + \
+            list(ipaddress.collapse_addresses([v for v in values if v.version == 6]))
+        items = [str(n.network_address) if n.num_addresses == 1 else str(n) for n in values]
+    elif kind == PORT:
+        items = [str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in merge_intervals(values)]
+    else:
+        items = list(dict.fromkeys(values))
+    return items[0] if len(items) == 1 else "{ " + ", ".join(items) + " }"
+
+
+def _merge_runs(label, kept, findings):
+    """Fold runs of adjacent rules that differ in one match into one rule."""
+    out = []
+    i = 0
+    while i < len(kept):
+        pos, rule = kept[i]
+        run_end, signature = i + 1, None
+        if rule.pure and rule.terms:
+            for index in range(len(rule.terms)):
+                sig = _merge_signature(rule, index)
+                if sig is None:
+                    continue
+                j = i + 1
+                while j < len(kept) and kept[j][1].pure and kept[j][1].terms and \
+                        len(kept[j][1].terms) == len(rule.terms) and \
+                        _merge_signature(kept[j][1], index) == sig:
+                    j += 1
+                if j - i > run_end - i:
+                    run_end, signature = j, index
+        if signature is None:
+            out.append(rule)
+            i += 1
+            continue
+        run = [r for _p, r in kept[i:run_end]]
+        term = rule.terms[signature]
+        values = [v for r in run for v in r.terms[signature].values]
+        tokens = list(rule.tokens)
+        tokens[term.end - 1] = _render_values(term.kind, values)
+        merged = " ".join(tokens)
+        findings.append(Finding("merge", label, pos, kept[run_end - 1][0], merged,
+                                f"{len(run)} rules"))
+        out.append(ParsedRule(merged))
+        i = run_end
+    return out
+
+
+def estimate_cost(ruleset, parsed=None):
+    """
+    Estimate per-packet evaluation cost.
+
+    Args:
+        ruleset (Ruleset): the ruleset to estimate
+        parsed (dict or None): (family, table, chain) -> list of ParsedRule,
+            if the caller already parsed the rules
+
+    Returns:
+        dict "family table chain" -> (rules, worst-case expressions); for
+        base chains the cost includes the chains they jump to
+    """
+    if parsed is None:
+        parsed = {(t.family, t.name, c.name): [ParsedRule(r) for r in c.rules]
+                  for t in ruleset.tables.values() for c in t.chains.values()}
+
+    memo = {}
+
+    def cost(key, active):
+        if key in memo:
+            return memo[key]
+        if key in active or key not in parsed:
+            return 0
+        active = active | {key}
+        total = 0
+        for rule in parsed[key]:
+            total += rule.expressions()
+            if rule.target:
+                total += cost(key[:2] + (rule.target,), active)
+        memo[key] = total
+        return total
+
+    return {" ".join(key): (len(rules), cost(key, frozenset())) for key, rules in parsed.items()}
+
+
+def base_chains(ruleset):
+    """Return the "family table chain" labels of hooked (base) chains."""
+    return [f"{t.family} {t.name} {c.name}" for t in ruleset.tables.values()
+            for c in t.chains.values() if c.spec]
+
+
+def analyze(ruleset):
+    """
+    Analyze a parsed ruleset and build an equivalent optimized copy.
+
+    Returns:
+        Analysis
+    """
+    findings = []
+    optimized = copy.deepcopy(ruleset)
+    before, after = {}, {}
+    for table in optimized.tables.values():
+        for chain in table.chains.values():
+            key = (table.family, table.name, chain.name)
+            rules = before[key] = [ParsedRule(text) for text in chain.rules]
+            kept = _remove_redundant(" ".join(key), rules, findings)
+            after[key] = _merge_runs(" ".join(key), kept, findings)
+            chain.rules = [rule.text for rule in after[key]]
+            chain.handles = [None] * len(chain.rules)
+    return Analysis(findings, optimized, estimate_cost(ruleset, before),
+                    estimate_cost(optimized, after))
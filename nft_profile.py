@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+"""
+nftables Rule Profiler
+
+Shows which rules of the live ruleset packets actually hit:
+
+    1. rules without a counter get one ('replace rule ... handle N'), all
+       in one nft transaction; the counters are removed again at the end
+       unless they are to be kept
+    2. 'nft -j list ruleset' is read every interval and the per-rule packet
+       and byte counters are accumulated (a counter that goes backwards,
+       e.g. after a reload, counts from zero again)
+    3. hit rates are reported per rule and per chain, rules that never
+       matched are flagged, and hot accept rules are moved towards the top
+       of their chain where that keeps the chain's verdicts unchanged
+
+Sampling costs one listing per interval; the time it takes is reported as
+the profiler's overhead.
+
+A hot rule is only moved above a rule it cannot interfere with: one that
+no packet can match together with it (different ports, addresses or
+protocols), or an earlier terminal rule with the same verdict. Rules the
+analyzer does not understand, and non-terminal rules (jumps, logging,
+marks) that might match the same packets, are never jumped over.
+
+References:
+    - nftables counters: https://wiki.nftables.org/wiki-nftables/index.php/Counters
+    - nftables JSON (libnftables-json(5)): https://www.netfilter.org/projects/nftables/manpage.html
+    - Replacing rules: https://wiki.nftables.org/wiki-nftables/index.php/Simple_rule_management
+"""
+
+import copy
+import json
+import time
+
+import executor
+import nft_optimize
+import nft_ruleset
+
+DEFAULT_INTERVAL = 2.0
+REPORT_LIMIT = 20
+
+# Statements a counter must go in front of (they end rule evaluation)
+_STOP_STATEMENTS = ("dnat", "snat", "masquerade", "redirect", "queue", "tproxy", "fwd")
+
+
+class RuleStats:
+    __slots__ = ("chain", "position", "handle", "text", "packets", "bytes", "counted")
+
+    def __init__(self, chain, position, handle, text):
+        self.chain = chain        # (family, table, chain)
+        self.position = position  # 1-based position in the chain
+        self.handle = handle
+        self.text = text          # rule as listed, without counter values
+        self.packets = 0          # accumulated over the profile
+        self.bytes = 0
+        self.counted = False      # a counter was seen for this rule
+
+
+class Profile:
+    __slots__ = ("rules", "seconds", "samples", "overhead", "live")
+
+    def __init__(self, rules, seconds, samples, overhead, live):
+        self.rules = rules        # list of RuleStats, in ruleset order
+        self.seconds = seconds    # length of the profile
+        self.samples = samples
+        self.overhead = overhead  # seconds spent listing the ruleset
+        self.live = live          # Ruleset the profile started from
+
+    def rate(self, rule):
+        return rule.packets / self.seconds if self.seconds else 0.0
+
+    def chains(self):
+        """Return {(family, table, chain): [RuleStats, ...]}."""
+        result = {}
+        for rule in self.rules:
+            result.setdefault(rule.chain, []).append(rule)
+        return result
+
+    def dead(self):
+        """Rules with a counter that matched nothing during the profile."""
+        return [r for r in self.rules if r.counted and r.packets == 0]
+
+
+# ----------------------------------------------------------------------------
+# Counters
+# ----------------------------------------------------------------------------
+def with_counter(text):
+    """
+    Return the rule with a 'counter' statement placed where it counts the
+    packets the rule matches, the rule unchanged if it already has one, or
+    None if no safe place is known (verdict maps).
+    """
+    tokens = nft_optimize.ParsedRule(text).tokens
+    if "counter" in tokens:
+        return text
+    if "vmap" in tokens or "map" in tokens:
+        return None
+    at = nft_optimize.verdict_start(tokens)
+    if at is None:
+        at = next((i for i, t in enumerate(tokens) if t in _STOP_STATEMENTS), len(tokens))
+    return " ".join(tokens[:at] + ["counter"] + tokens[at:])
+
+
+def enable_counters(live):
+    """
+    Add a counter to every rule of the live ruleset that has none, in one
+    transaction.
+
+    Returns:
+        list of ((family, table, chain), position, original text) for the
+        rules that were changed, so disable_counters() can undo it
+    """
+    commands, added = [], []
+    for table in live.tables.values():
+        for chain in table.chains.values():
+            for position, (text, handle) in enumerate(zip(chain.rules, chain.handles), start=1):
+                counted = with_counter(text)
+                if counted is None or counted == text or handle is None:
+                    continue
+                commands.append(f"replace rule {table.family} {table.name} {chain.name} "
+                                f"handle {handle} {counted}")
+                added.append(((table.family, table.name, chain.name), position, text))
+    if commands:
+        executor.run(["nft", "-f", "-"], input="\n".join(commands) + "\n")
+    return added
+
+
+def disable_counters(added):
+    """
+    Put back the rules enable_counters() changed. Rules that were changed
+    by someone else in the meantime are left alone.
+
+    Returns:
+        int: number of rules restored
+    """
+    if not added:
+        return 0
+    live = nft_ruleset.load_live_ruleset()
+    commands = []
+    for (family, tname, cname), position, text in added:
+        table = live.tables.get((family, tname))
+        chain = table.chains.get(cname) if table else None
+        if chain is None or position > len(chain.rules):
+            continue
+        if chain.rules[position - 1] != with_counter(text):
+            continue
+        commands.append(f"replace rule {family} {tname} {cname} "
+                        f"handle {chain.handles[position - 1]} {text}")
+    if commands:
+        executor.run(["nft", "-f", "-"], input="\n".join(commands) + "\n")
+    return len(commands)
+
+
+def read_counters():
+    """
+    Read every rule counter with one 'nft -j list ruleset'.
+
+    Returns:
+        dict (family, table, chain, handle) -> (packets, bytes)
+    """
+    doc = json.loads(executor.check_output(["nft", "-j", "list", "ruleset"]))
+    counters = {}
+    for item in doc.get("nftables", []):
+        rule = item.get("rule")
+        if not rule:
+            continue
+        for expr in rule.get("expr", []):
+            counter = expr.get("counter") if isinstance(expr, dict) else None
+            if isinstance(counter, dict) and "packets" in counter:
+                key = (rule["family"], rule["table"], rule["chain"], rule["handle"])
+                counters[key] = (counter["packets"], counter.get("bytes", 0))
+                break
+    return counters
+
+
+# ----------------------------------------------------------------------------
+# Profiling
+# ----------------------------------------------------------------------------
+def profile(duration, interval=DEFAULT_INTERVAL, keep_counters=False, progress=print):
+    """
+    Profile the live ruleset for `duration` seconds.
+
+    Args:
+        duration (float): seconds to sample for
+        interval (float): seconds between samples
+        keep_counters (bool): leave the added counters in place afterwards
+        progress (callable or None): called with a line of text per sample
+
+    Returns:
+        Profile
+    """
+    live = nft_ruleset.load_live_ruleset()
+    added = enable_counters(live)
+    try:
+        # handles change when a rule is replaced; list again to get the new ones
+        current = nft_ruleset.load_live_ruleset() if added else live
+        stats, by_handle = [], {}
+        for table in current.tables.values():
+            for chain in table.chains.values():
+                key = (table.family, table.name, chain.name)
+                original = live.tables.get((table.family, table.name))
+                original = original.chains.get(chain.name) if original else None
+                for position, handle in enumerate(chain.handles, start=1):
+                    text = chain.rules[position - 1]
+                    if original is not None and position <= len(original.rules):
+                        text = original.rules[position - 1]
+                    rule = RuleStats(key, position, handle, text)
+                    stats.append(rule)
+                    by_handle[key + (handle,)] = rule
+
+        overhead, samples = 0.0, 0
+        last = {}
+        start = time.monotonic()
+        deadline = start + duration
+        while True:
+            before = time.monotonic()
+            counters = read_counters()
+            overhead += time.monotonic() - before
+            samples += 1
+            for key, (packets, nbytes) in counters.items():
+                rule = by_handle.get(key)
+                if rule is None:
+                    continue
+                if key in last:
+                    old_packets, old_bytes = last[key]
+                    # a counter that went backwards was reset: count from zero
+                    rule.packets += packets - old_packets if packets >= old_packets else packets
+                    rule.bytes += nbytes - old_bytes if nbytes >= old_bytes else nbytes
+                rule.counted = True
+                last[key] = (packets, nbytes)
+            now = time.monotonic()
+            if progress and samples > 1:
+                rate = sum(r.packets for r in stats) / (now - start)
+                progress(f"  sample {samples}: {rate:,.0f} matches/s so far")
+            if now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+        seconds = time.monotonic() - start
+    finally:
+        if added and not keep_counters:
+            disable_counters(added)
+    return Profile(stats, seconds, samples, overhead, live)
+
+
+def suggest_order(rules, rates):
+    """
+    Move hot accept rules up their chain where that keeps it equivalent.
+
+    Args:
+        rules (list of str): the chain's rules, in order
+        rates (list of float): matches per second, parallel to rules
+
+    Returns:
+        list of indices into rules: the suggested order
+    """
+    parsed = [nft_optimize.ParsedRule(r) for r in rules]
+    order = list(range(len(rules)))
+    for pos in range(1, len(order)):
+        moving = order[pos]
+        rule = parsed[moving]
+        if not (rule.pure and rule.verdict == "accept" and rates[moving] > 0):
+            continue
+        at = pos
+        while at > 0:
+            above = order[at - 1]
+            other = parsed[above]
+            if rates[above] >= rates[moving]:
+                break
+            same_verdict = other.can_shadow and other.verdict == rule.verdict
+            if not (same_verdict or rule.disjoint(other)):
+                break
+            at -= 1
+        if at != pos:
+            order.insert(at, order.pop(pos))
+    return order
+
+
+def expected_cost(rules, rates, order):
+    """
+    Average match expressions evaluated per matched packet for a chain
+    order (a packet matched by the k-th rule evaluated rules 1..k).
+    """
+    parsed = [nft_optimize.ParsedRule(r) for r in rules]
+    total_rate = sum(rates)
+    if not total_rate:
+        return 0.0
+    walked, cost = 0, 0.0
+    for index in order:
+        walked += parsed[index].expressions()
+        cost += rates[index] * walked
+    return cost / total_rate
+
+
+def reordered_ruleset(prof):
+    """
+    Apply suggest_order() to every profiled chain.
+
+    Returns:
+        (Ruleset, suggestions): a copy of the profiled ruleset with every
+        chain in its suggested order, and {(family, table, chain):
+        (moves, cost before, cost after)} for the chains that changed,
+        where moves is a list of (old position, new position)
+    """
+    ruleset = copy.deepcopy(prof.live)
+    suggestions = {}
+    for key, stats in prof.chains().items():
+        table = ruleset.tables.get(key[:2])
+        chain = table.chains.get(key[2]) if table else None
+        if chain is None or len(chain.rules) != len(stats):
+            continue
+        rates = [prof.rate(r) for r in stats]
+        order = suggest_order(chain.rules, rates)
+        if order == list(range(len(order))):
+            continue
+        moves = [(old + 1, new + 1) for new, old in enumerate(order) if new < old]
+        suggestions[key] = (moves, expected_cost(chain.rules, rates, range(len(order))),
+                            expected_cost(chain.rules, rates, order))
+        chain.rules = [chain.rules[i] for i in order]
+        chain.handles = [None] * len(chain.rules)
+    return ruleset, suggestions
+
+
+def print_report(prof, limit=REPORT_LIMIT):
+    """Print hit rates per chain and rule and the rules that never matched."""
+    samples = max(1, prof.samples)
+    print(f"Profiled {len(prof.rules)} rules for {prof.seconds:.1f} s: {prof.samples} samples, "
+          f"listing took {prof.overhead / samples * 1000:.1f} ms per sample "
+          f"({prof.overhead / max(prof.seconds, 1e-9):.2%} of the time)")
+
+    print(f"\n{'chain':36s} {'rules':>6s} {'matches/s':>12s} {'dead':>6s}")
+    for key, stats in prof.chains().items():
+        rate = sum(prof.rate(r) for r in stats)
+        dead = sum(1 for r in stats if r.counted and r.packets == 0)
+        print(f"{' '.join(key):36s} {len(stats):6d} {rate:12,.1f} {dead:6d}")
+
+    hot = sorted((r for r in prof.rules if r.packets), key=lambda r: r.packets, reverse=True)
+    print("\nHottest rules:")
+    for r in hot[:limit]:
+        print(f"  {prof.rate(r):12,.1f}/s {r.bytes / max(prof.seconds, 1e-9) / 1e3:10,.1f} kB/s  "
+              f"{' '.join(r.chain)} #{r.position}: {r.text}")
+    if not hot:
+        print("  (no rule matched any packet)")
+
+    dead = prof.dead()
+    print(f"\nRules that never matched: {len(dead)}")
+    for r in dead[:limit]:
+        print(f"  {' '.join(r.chain)} #{r.position}: {r.text}")
+    if len(dead) > limit:
+        print(f"  ... and {len(dead) - limit} more")
+    uncounted = [r for r in prof.rules if not r.counted]
+    if uncounted:
+        print(f"  ({len(uncounted)} rules could not be counted, e.g. verdict maps)")
+
+
+def print_suggestions(prof, suggestions, limit=REPORT_LIMIT):
+    """Print the reordering suggested by reordered_ruleset()."""
+    print("\nSuggested reordering (hot accept rules first, verdicts unchanged):")
+    if not suggestions:
+        print("  None: hot rules are already as early as they can safely be.")
+    for key, (moves, before, after) in suggestions.items():
+        stats = prof.chains()[key]
+        print(f"  {' '.join(key)}: {before:.1f} -> {after:.1f} expressions per matched packet")
+        for old, new in moves[:limit]:
+            rule = stats[old - 1]
+            print(f"    move #{old} to #{new} ({prof.rate(rule):,.1f}/s): {rule.text}")
+        if len(moves) > limit:
+            print(f"    ... and {len(moves) - limit} more")
@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+
+"""
+nftables Ruleset Query
+
+Answers questions about a large live ruleset without printing all of it:
+
+    match 10.1.2.3:443          rules that match 10.1.2.3 port 443: a rule
+                                must cover the address or leave it open,
+                                and the same for the port (rules with no
+                                address or port match at all are left out)
+    match :22 / match 10.0.0.1  port only / address only
+    chain inet filter input     the rules of one chain, one page at a time
+    set inet filter blocked     a set's definition and elements, paginated
+    handle inet filter 42       one rule by handle
+    summary                     tables, chains, sets and rule counts
+
+'nft -j list ruleset' is read as a stream and decoded one object at a
+time, so the index is built while nft is still writing and the whole
+JSON document is never held in memory. The index keeps rules by chain
+and handle, sets by name, and the addresses and ports each rule matches
+as sorted intervals, so a match query is a binary search instead of a
+scan over every rule.
+
+With caching on, the index is saved next to the apply state, keyed by the
+kernel's ruleset generation id (NFT_MSG_GETGEN over netfilter netlink,
+bumped by every commit) and the boot id; the next call reuses it if
+neither changed.
+
+References:
+    - libnftables JSON: https://manpages.debian.org/testing/libnftables1/libnftables-json.5.en.html
+    - nf_tables netlink API: https://git.netfilter.org/libnftnl/tree/include/linux/netfilter/nf_tables.h
+    - Python json.JSONDecoder.raw_decode: https://docs.python.org/3/library/json.html#json.JSONDecoder.raw_decode
+    - Python bisect: https://docs.python.org/3/library/bisect.html
+"""
+
+import bisect
+import ipaddress
+import json
+import os
+import pickle
+import socket
+import struct
+import subprocess
+
+import apply_state
+import discovery
+
+CACHE_FILE = os.path.join(apply_state.STATE_DIR, "query-index.pickle")
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+PAGE_SIZE = 50
+CHUNK_SIZE = 1 << 16
+INDEX_VERSION = 2
+
+# nf_tables netlink (linux/netfilter/nfnetlink.h, nf_tables.h)
+NETLINK_NETFILTER = 12
+NFNL_SUBSYS_NFTABLES = 10
+NFT_MSG_GETGEN = 16
+NFTA_GEN_ID = 1
+NFGENMSG = struct.Struct("=BBH")        # family, version, res_id (big endian)
+
+ADDRESS_FIELDS = ("saddr", "daddr")
+PORT_FIELDS = ("sport", "dport")
+VERDICTS = ("accept", "drop", "continue", "return", "queue")
+
+_settings = {"cache": False}
+
+
+def set_cache(enabled):
+    """Turn caching of the index between calls on or off (--query-cache)."""
+    _settings["cache"] = enabled
+
+
+class QueryError(Exception):
+    """A query that cannot be parsed or names something that does not exist."""
+
+
+class RuleIndex:
+    """
+    Index of one ruleset.
+
+    rules[i] is (family, table, chain, handle, raw JSON of the rule); the
+    text is rendered only for the rules a query shows, and one string per
+    rule keeps the cache small and quick to load. Chains and sets keep
+    their declaration order.
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.rules = []
+        self.chains = {}        # (family, table, chain) -> {"spec": str, "rules": [rule id]}
+        self.handles = {}       # (family, table, handle) -> rule id
+        self.sets = {}          # (family, table, name) -> {"spec": str, "elements": [str]}
+        self.tables = []        # (family, table)
+        self.addresses = {4: _Intervals(), 6: _Intervals()}
+        self.ports = _Intervals()
+        self.negated = []       # (rule id, field kind, intervals): rules with a '!=' match
+        self.constrains = {"addr": set(), "port": set()}   # rule ids matching on each field
+
+    def finish(self):
+        for intervals in (self.addresses[4], self.addresses[6], self.ports):
+            intervals.build()
+
+
+class _Intervals:
+    """
+    Sorted closed intervals with a running maximum of their upper ends, so
+    a point lookup stops as soon as no earlier interval can reach it.
+    """
+
+    def __init__(self):
+        self.items = []         # (low, high, rule id)
+        self.lows = []
+        self.reach = []
+
+    def add(self, low, high, rule_id):
+        self.items.append((low, high, rule_id))
+
+    def build(self):
+        self.items.sort()
+        self.lows = [low for low, _high, _rule in self.items]
+        self.reach, top = [], -1
+        for _low, high, _rule in self.items:
+            top = max(top, high)
+            self.reach.append(top)
+
+    def lookup(self, point):
+        """Rule ids with an interval containing point."""
+        found = set()
+        i = bisect.bisect_right(self.lows, point) - 1
+        while i >= 0 and self.reach[i] >= point:
+            _low, high, rule_id = self.items[i]
+            if high >= point:
+                found.add(rule_id)
+            i -= 1
+        return found
+
+
+# ----------------------------------------------------------------------------
+# Generation id and the cache
+# ----------------------------------------------------------------------------
+def ruleset_generation():
+    """
+    Return (boot id, nf_tables generation id), or None if the kernel cannot
+    be asked. The generation id counts ruleset commits since boot.
+    """
+    payload = NFGENMSG.pack(socket.AF_UNSPEC, 0, 0)
+    msg_type = (NFNL_SUBSYS_NFTABLES << 8) | NFT_MSG_GETGEN
+    try:
+        with open(BOOT_ID_FILE) as f:
+            boot_id = f.read().strip()
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_NETFILTER) as sock:
+            sock.settimeout(2)
+            header = discovery.NLMSG_HDR.pack(discovery.NLMSG_HDR.size + len(payload), msg_type,
+                                              discovery.NLM_F_REQUEST, 1, 0)
+            sock.sendto(header + payload, (0, 0))
+            data = sock.recv(65536)
+    except OSError:
+        return None
+    length, ntype, _flags, _seq, _pid = discovery.NLMSG_HDR.unpack_from(data, 0)
+    if ntype == discovery.NLMSG_ERROR:
+        return None
+    offset = discovery.NLMSG_HDR.size + NFGENMSG.size
+    while offset + discovery.RTATTR.size <= length:
+        attr_len, attr_type = discovery.RTATTR.unpack_from(data, offset)
+        if attr_len < discovery.RTATTR.size:
+            break
+        if attr_type == NFTA_GEN_ID:
+            return boot_id, struct.unpack_from(">I", data, offset + discovery.RTATTR.size)[0]
+        offset += (attr_len + 3) & ~3
+    return None
+
+
+def load_cached(generation, path=CACHE_FILE):
+    """Return the cached index if it was built for this generation, else None."""
+    if generation is None:
+        return None
+    try:
+        st = os.stat(path)
+        # only trust a cache file nobody else could have written
+        if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+            return None
+        with open(path, "rb") as f:
+            version, cached_generation, index = pickle.load(f)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, TypeError):
+        return None
+    if version != INDEX_VERSION or cached_generation != generation:
+        return None
+    return index
+
+
+def save_cached(index, path=CACHE_FILE):
+    """Store the index for its generation; failing to cache is not an error."""
+    if index.generation is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            pickle.dump((INDEX_VERSION, index.generation, index), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: could not cache the ruleset index in {path}: {e}")
+
+
+# ----------------------------------------------------------------------------
+# Streaming 'nft -j' reader
+# ----------------------------------------------------------------------------
+def iter_objects(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield (object, its JSON text) for the "nftables" array of a 'nft -j'
+    document as the objects arrive on a text stream.
+
+    A partial object is retried only once the buffer has doubled (or the
+    stream ended), so a huge set costs O(size) rather than O(size^2).
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while "[" not in buffer:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+    pos = buffer.index("[") + 1
+    eof = False
+    retry_at = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos < len(buffer) and len(buffer) >= retry_at:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                retry_at = 2 * len(buffer) - pos
+            else:
+                yield obj, buffer[pos:end]
+                pos, retry_at = end, 0
+                continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof, retry_at = True, 0
+            if pos >= len(buffer):
+                return
+        # drop what was consumed so the buffer stays one object long
+        buffer = buffer[pos:] + chunk
+        retry_at = max(0, retry_at - pos)
+        pos = 0
+
+
+def build_index(objects, generation=None):
+    """
+    Build a RuleIndex from (object, JSON text) pairs as iter_objects()
+    yields them.
+    """
+    index = RuleIndex()
+    index.generation = generation
+    refs = []       # named-set matches, resolved once every set is known
+    for obj, raw in objects:
+        if "rule" in obj:
+            _index_rule(index, obj["rule"], raw, refs)
+        elif "chain" in obj:
+            c = obj["chain"]
+            spec = ""
+            if "hook" in c:
+                spec = f"type {c.get('type')} hook {c['hook']} priority {c.get('prio')}; " \
+                       f"policy {c.get('policy', 'accept')};"
+            index.chains.setdefault((c["family"], c["table"], c["name"]),
+                                    {"spec": spec, "rules": []})["spec"] = spec
+        elif "set" in obj or "map" in obj:
+            s = obj.get("set") or obj.get("map")
+            kind = "set" if "set" in obj else "map"
+            key_type = s.get("type")
+            key_type = " . ".join(key_type) if isinstance(key_type, list) else key_type
+            spec = f"{kind} type {key_type}" + (f" : {s['map']}" if "map" in s else "")
+            if s.get("flags"):
+                flags = s["flags"] if isinstance(s["flags"], list) else [s["flags"]]
+                spec += f"; flags {','.join(flags)}"
+            index.sets[(s["family"], s["table"], s["name"])] = {
+                "spec": spec,
+                "elements": [value_text(e) for e in s.get("elem", [])],
+                "raw": s.get("elem", []),
+            }
+        elif "table" in obj:
+            index.tables.append((obj["table"]["family"], obj["table"]["name"]))
+    for rule_id, family, table, kind, op, name in refs:
+        raw = index.sets.get((family, table, name), {}).get("raw", [])
+        _add_terms(index, rule_id, kind, op, raw)
+    for entry in index.sets.values():
+        entry.pop("raw", None)
+    index.finish()
+    return index
+
+
+def _index_rule(index, rule, raw, refs):
+    rule_id = len(index.rules)
+    family, table, chain = rule["family"], rule["table"], rule["chain"]
+    exprs = rule.get("expr", [])
+    index.rules.append((family, table, chain, rule.get("handle"), raw))
+    index.chains.setdefault((family, table, chain), {"spec": "", "rules": []})["rules"].append(rule_id)
+    if rule.get("handle") is not None:
+        index.handles[(family, table, rule["handle"])] = rule_id
+    for expr in exprs:
+        match = expr.get("match") if isinstance(expr, dict) else None
+        if not match:
+            continue
+        left = match.get("left")
+        field = left.get("payload", {}).get("field") if isinstance(left, dict) else None
+        kind = "addr" if field in ADDRESS_FIELDS else "port" if field in PORT_FIELDS else None
+        if kind is None or match.get("op", "==") not in ("==", "!=", "in"):
+            continue
+        index.constrains[kind].add(rule_id)
+        right = match.get("right")
+        if isinstance(right, str) and right.startswith("@"):
+            refs.append((rule_id, family, table, kind, match.get("op", "=="), right[1:]))
+            continue
+        _add_terms(index, rule_id, kind, match.get("op", "=="), right)
+
+
+def _add_terms(index, rule_id, kind, op, value):
+    intervals = list(_intervals(kind, value))
+    if op == "!=":
+        index.negated.append((rule_id, kind, intervals))
+        return
+    for version, low, high in intervals:
+        target = index.ports if kind == "port" else index.addresses[version]
+        target.add(low, high, rule_id)
+
+
+def _intervals(kind, value):
+    """Yield (ip version or 0, low, high) for a JSON match value."""
+    if isinstance(value, list):
+        for item in value:
+            yield from _intervals(kind, item)
+        return
+    if isinstance(value, dict):
+        if "set" in value:
+            yield from _intervals(kind, value["set"])
+        elif "elem" in value:
+            yield from _intervals(kind, value["elem"].get("val"))
+        elif "range" in value:
+            low, high = value["range"]
+            for (v1, lo, _h1), (_v2, _l2, hi) in zip(_intervals(kind, low), _intervals(kind, high)):
+                yield v1, lo, hi
+        elif "prefix" in value and kind == "addr":
+            try:
+                net = ipaddress.ip_network(f"{value['prefix']['addr']}/{value['prefix']['len']}",
+                                           strict=False)
+            except ValueError:
+                return
+            yield net.version, int(net.network_address), int(net.broadcast_address)
+        return
+    if kind == "port":
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            yield 0, int(value), int(value)
+        else:
+            try:
+                port = socket.getservbyname(value)
+            except (OSError, TypeError):
+                return
+            yield 0, port, port
+        return
+    point = _address_int(value)
+    if point is not None:
+        yield point[0], point[1], point[1]
+
+
+def _address_int(value):
+    """(version, integer) of an address string, or None (inet_pton is ~10x ipaddress)."""
+    for family, version in ((socket.AF_INET, 4), (socket.AF_INET6, 6)):
+        try:
+            return version, int.from_bytes(socket.inet_pton(family, value), "big")
+        except (OSError, TypeError, ValueError):
+            continue
+    return None
+
+
+# ----------------------------------------------------------------------------
+# JSON expression -> nft syntax (for display)
+# ----------------------------------------------------------------------------
+def value_text(value):
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ",".join(value_text(v) for v in value)
+    if not isinstance(value, dict):
+        return json.dumps(value)
+    if "set" in value:
+        return "{ " + ", ".join(value_text(v) for v in value["set"]) + " }"
+    if "prefix" in value:
+        return f"{value_text(value['prefix']['addr'])}/{value['prefix']['len']}"
+    if "range" in value:
+        return "-".join(value_text(v) for v in value["range"])
+    if "elem" in value:
+        return value_text(value["elem"].get("val"))
+    if "concat" in value:
+        return " . ".join(value_text(v) for v in value["concat"])
+    if "payload" in value:
+        p = value["payload"]
+        return f"{p['protocol']} {p['field']}" if "protocol" in p else \
+            f"@{p.get('base')},{p.get('offset')},{p.get('len')}"
+    if "meta" in value:
+        key = value["meta"]["key"]
+        return key if key in ("iif", "oif", "iifname", "oifname", "mark") else f"meta {key}"
+    if "ct" in value:
+        ct = value["ct"]
+        return f"ct {ct.get('dir') + ' ' if ct.get('dir') else ''}{ct['key']}"
+    if "map" in value:
+        return f"{value_text(value['map']['key'])} map {value_text(value['map']['data'])}"
+    return json.dumps(value)
+
+
+def expr_text(expr):
+    """Render one statement of a JSON rule in nft syntax (JSON if unknown)."""
+    if not isinstance(expr, dict) or len(expr) != 1:
+        return json.dumps(expr)
+    (name, arg), = expr.items()
+    if name == "match":
+        op = arg.get("op", "==")
+        op = "" if op in ("==", "in") else f"{op} "
+        return f"{value_text(arg['left'])} {op}{value_text(arg['right'])}"
+    if name in VERDICTS:
+        return name
+    if name in ("jump", "goto"):
+        return f"{name} {arg['target']}"
+    if name == "counter":
+        return "counter" if not isinstance(arg, dict) else \
+            f"counter packets {arg.get('packets', 0)} bytes {arg.get('bytes', 0)}"
+    if name == "vmap":
+        return f"{value_text(arg['key'])} vmap {value_text(arg['data'])}"
+    if name == "log":
+        return "log" + "".join(f' prefix "{v}"' if k == "prefix" else f" {k} {v}"
+                               for k, v in (arg or {}).items())
+    if name == "limit":
+        per = f"/{arg.get('per', 'second')}"
+        return f"limit rate {'over ' if arg.get('inv') else ''}{arg.get('rate')}{per}"
+    if name == "reject":
+        return "reject" + (f" with {arg['type']} {arg['expr']}" if arg and "expr" in arg else "")
+    if name in ("snat", "dnat"):
+        target = value_text(arg.get("addr", ""))
+        return f"{name} to {target}" + (f":{value_text(arg['port'])}" if "port" in arg else "")
+    if name in ("masquerade", "notrack"):
+        return name
+    if name == "flow":
+        return f"flow {arg.get('op', 'add')} {arg.get('flowtable')}"
+    if name == "mangle":
+        return f"{value_text(arg['key'])} set {value_text(arg['value'])}"
+    return json.dumps(expr)
+
+
+def rule_text(exprs):
+    return " ".join(expr_text(e) for e in exprs)
+
+
+# ----------------------------------------------------------------------------
+# Loading and querying
+# ----------------------------------------------------------------------------
+def load_index(use_cache=None, cache_path=CACHE_FILE):
+    """
+    Index the live ruleset, from the cache when allowed and still current.
+
+    Args:
+        use_cache (bool or None): None follows set_cache()
+
+    Returns:
+        (RuleIndex, bool): the index and whether it came from the cache
+
+    Raises:
+        OSError / subprocess.SubprocessError: nft could not be run
+        ValueError: nft printed something that is not its JSON format
+    """
+    if use_cache is None:
+        use_cache = _settings["cache"]
+    generation = ruleset_generation() if use_cache else None
+    index = load_cached(generation, cache_path)
+    if index is not None:
+        return index, True
+    proc = subprocess.Popen(["nft", "-j", "list", "ruleset"], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True)
+    try:
+        index = build_index(iter_objects(proc.stdout), generation)
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, None, stderr)
+    if use_cache:
+        save_cached(index, cache_path)
+    return index, False
+
+
+def parse_endpoint(text):
+    """
+    Parse 'addr', 'addr:port', ':port', '[v6addr]:port' or a bare v6 address.
+
+    Returns:
+        (ipaddress address or None, port or None)
+    """
+    text = text.strip()
+    host, port = text, None
+    if text.startswith("["):
+        host, _, rest = text[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else None
+    elif text.count(":") == 1:
+        host, port = text.split(":")
+    try:
+        address = ipaddress.ip_address(host) if host else None
+        port = int(port) if port else None
+    except ValueError as e:
+        raise QueryError(f"not an address[:port]: {text} ({e})") from None
+    if address is None and port is None:
+        raise QueryError("give an address, a port or both")
+    if port is not None and not 0 <= port <= 65535:
+        raise QueryError(f"port out of range: {port}")
+    return address, port
+
+
+def match(index, address=None, port=None):
+    """
+    Rule ids that match `address` and `port` (either may be None), in
+    ruleset order. For each field given, a rule must either cover the
+    value or not match on that field at all; it must match on at least
+    one of them.
+    """
+    negated = {}
+    for rule_id, kind, intervals in index.negated:
+        negated.setdefault((rule_id, kind), []).extend(intervals)
+    hits = {}
+    for kind, value in (("addr", address), ("port", port)):
+        if value is None:
+            continue
+        if kind == "addr":
+            point, found = int(value), index.addresses[value.version].lookup(int(value))
+        else:
+            point, found = value, index.ports.lookup(value)
+        version = value.version if kind == "addr" else 0
+        for (rule_id, neg_kind), intervals in negated.items():
+            # 'ip daddr != ...' never matches an IPv6 packet
+            same = [(lo, hi) for v, lo, hi in intervals if v == version]
+            if neg_kind == kind and same and not any(lo <= point <= hi for lo, hi in same):
+                found.add(rule_id)
+        hits[kind] = found
+    found = set()
+    for kind, kind_hits in hits.items():
+        others = [other for other in hits if other != kind]
+        for rule_id in kind_hits:
+            # the other field is a wildcard for rules that do not match on it
+            if all(rule_id in hits[o] or rule_id not in index.constrains[o] for o in others):
+                found.add(rule_id)
+    return sorted(found)
+
+
+def find_chain(index, words):
+    """Resolve 'family table chain', 'table chain' or 'chain' to one chain key."""
+    keys = [k for k in index.chains if list(k[3 - len(words):]) == words] if 0 < len(words) <= 3 else []
+    if not keys:
+        raise QueryError(f"no chain {' '.join(words)}")
+    if len(keys) > 1:
+        raise QueryError(f"'{' '.join(words)}' is ambiguous: " + ", ".join(" ".join(k) for k in keys))
+    return keys[0]
+
+
+def find_set(index, words):
+    keys = [k for k in index.sets if list(k[3 - len(words):]) == words] if 0 < len(words) <= 3 else []
+    if not keys:
+        raise QueryError(f"no set {' '.join(words)}")
+    if len(keys) > 1:
+        raise QueryError(f"'{' '.join(words)}' is ambiguous: " + ", ".join(" ".join(k) for k in keys))
+    return keys[0]
+
+
+def page_of(items, page, page_size=PAGE_SIZE):
+    """Return (the items of a 1-based page, number of pages)."""
+    pages = max(1, -(-len(items) // page_size))
+    if not 1 <= page <= pages:
+        raise QueryError(f"page {page} out of range (1-{pages})")
+    start = (page - 1) * page_size
+    return items[start:start + page_size], pages
+
+
+def run_query(index, query, page=1, page_size=PAGE_SIZE):
+    """
+    Answer one query (see the module docstring for the forms).
+
+    Returns:
+        list of str: the lines to print
+    """
+    words = query.split()
+    if not words:
+        raise QueryError("empty query")
+    head, rest = words[0].lower(), words[1:]
+    if head not in ("match", "chain", "set", "handle", "summary"):
+        head, rest = "match", words
+    if head == "summary":
+        lines = [f"{len(index.tables)} table(s), {len(index.chains)} chain(s), "
+                 f"{len(index.sets)} set(s)/map(s), {len(index.rules)} rule(s)"]
+        for key, chain in index.chains.items():
+            lines.append(f"  chain {' '.join(key)}: {len(chain['rules'])} rule(s)")
+        for key, entry in index.sets.items():
+            lines.append(f"  set {' '.join(key)}: {len(entry['elements'])} element(s)")
+        return lines
+    if head == "match":
+        if len(rest) != 1:
+            raise QueryError("usage: match ADDRESS[:PORT] | :PORT")
+        address, port = parse_endpoint(rest[0])
+        found = match(index, address, port)
+        ids, pages = page_of(found, page, page_size) if found else ([], 1)
+        lines = [_rule_line(index, i, with_chain=True) for i in ids]
+        return [f"{len(found)} rule(s) match {rest[0]} (page {page}/{pages})"] + lines
+    if head == "chain":
+        key = find_chain(index, rest)
+        chain = index.chains[key]
+        ids, pages = page_of(chain["rules"], page, page_size) if chain["rules"] else ([], 1)
+        spec = f" {{ {chain['spec']} }}" if chain["spec"] else ""
+        lines = [f"chain {' '.join(key)}{spec}: {len(chain['rules'])} rule(s), page {page}/{pages}"]
+        return lines + [_rule_line(index, i) for i in ids]
+    if head == "set":
+        key = find_set(index, rest)
+        entry = index.sets[key]
+        elements, pages = page_of(entry["elements"], page, page_size) if entry["elements"] else ([], 1)
+        lines = [f"{' '.join(key)} {{ {entry['spec']} }}: {len(entry['elements'])} element(s), "
+                 f"page {page}/{pages}"]
+        return lines + [f"  {e}" for e in elements]
+    # handle
+    if not rest or not rest[-1].isdigit():
+        raise QueryError("usage: handle [FAMILY] TABLE HANDLE")
+    handle, where = int(rest[-1]), rest[:-1]
+    if len(where) == 2 and (where[0], where[1], handle) in index.handles:
+        return [_rule_line(index, index.handles[(where[0], where[1], handle)], with_chain=True)]
+    keys = [k for k in index.handles
+            if k[2] == handle and list(k[2 - len(where):2]) == where] if len(where) <= 2 else []
+    if not keys:
+        raise QueryError(f"no rule with handle {' '.join(rest)}")
+    return [_rule_line(index, index.handles[k], with_chain=True) for k in keys]
+
+
+def _rule_line(index, rule_id, with_chain=False):
+    family, table, chain, handle, raw = index.rules[rule_id]
+    where = f"{family} {table} {chain}: " if with_chain else ""
+    return f"  [{handle}] {where}{rule_text(json.loads(raw)['rule'].get('expr', []))}"
@@ -0,0 +1,853 @@
+#!/usr/bin/env python3
+
+"""
+nftables Ruleset Model - parser and structural diff
+
+Parses nftables rules files (and 'nft -a list ruleset' output) into a small
+in-memory model of tables, chains, rules, sets/maps and flowtables, and
+computes the delta between two rulesets as an nft script that can be
+applied in a single atomic transaction with 'nft -f -'.
+
+Supported syntax:
+    - table blocks with chain / set / map / flowtable blocks
+    - named objects (counter, quota, limit, ct ..., secmark, synproxy)
+    - flush ruleset, define / $variables, include "file" (globs allowed)
+    - add/create/insert commands for tables, chains, sets, rules, elements
+    - delete table (the 'table x; delete table x; table x { }' idiom)
+
+References:
+    - nftables Wiki: https://wiki.nftables.org/
+    - nft(8): https://www.netfilter.org/projects/nftables/manpage.html
+    - Atomic rule replacement: https://wiki.nftables.org/wiki-nftables/index.php/Atomic_rule_replacement
+    - Python difflib: https://docs.python.org/3/library/difflib.html
+"""
+
+import difflib
+import glob
+import os
+import re
+
+import executor
+
+FAMILIES = ("ip", "ip6", "inet", "arp", "bridge", "netdev")
+DEFAULT_INCLUDE_DIRS = ("/etc/nftables", "/etc")
+
+TABLE_BLOCKS = ("chain", "set", "map", "flowtable")
+TABLE_OBJECTS = ("counter", "quota", "limit", "ct", "secmark", "synproxy")
+
+# Standard priority names (nft(8), "CHAIN PRIORITIES")
+PRIORITY_NAMES = {"raw": -300, "mangle": -150, "dstnat": -100,
+                  "filter": 0, "security": 50, "srcnat": 100}
+BRIDGE_PRIORITY_NAMES = {"dstnat": -300, "filter": -200, "out": 100, "srcnat": 300}
+
+ELEMENT_CHUNK = 1000
+
+_TOKEN_RE = re.compile(r'"[^"]*"|\'[^\']*\'|#.*|[{};,]|[^\s{};,#"\']+')
+_HANDLE_RE = re.compile(r"#\s*handle\s+(\d+)")
+# A quoted string nft would accept unquoted: 'iifname "eth0"' is listed
+# by nft for 'iifname eth0' in a file
+_SIMPLE_QUOTED_RE = re.compile(r'"([A-Za-z0-9_.:/*+-]+)"|\'([A-Za-z0-9_.:/*+-]+)\'')
+# State the kernel keeps in named objects: counter values, quota usage
+_OBJECT_STATE_RE = re.compile(r"\b(packets \d+ bytes \d+|used \d+ \w*bytes)\b")
+
+
+class NftParseError(ValueError):
+    """Raised when a rules file cannot be parsed; carries file and line."""
+
+    def __init__(self, message, source=None, line=None):
+        self.source = source
+        self.line = line
+        where = f"{source}:{line}: " if source and line else ""
+        super().__init__(f"{where}{message}")
+
+
+class Chain:
+    __slots__ = ("name", "spec", "policy", "rules", "handles", "handle")
+
+    def __init__(self, name):
+        self.name = name
+        self.spec = None        # e.g. "type filter hook input priority 0"
+        self.policy = None      # base chains only
+        self.rules = []         # normalized rule text
+        self.handles = []       # parallel to rules (live ruleset only)
+        self.handle = None
+
+
+class NftSet:
+    __slots__ = ("name", "kind", "spec", "elements", "handle")
+
+    def __init__(self, name, kind="set"):
+        self.name = name
+        self.kind = kind        # "set" or "map"
+        self.spec = []          # e.g. ["type ipv4_addr", "flags interval"]
+        self.elements = []
+        self.handle = None
+
+
+class Table:
+    __slots__ = ("family", "name", "chains", "sets", "flowtables", "objects", "handle")
+
+    def __init__(self, family, name):
+        self.family = family
+        self.name = name
+        self.chains = {}
+        self.sets = {}
+        self.flowtables = {}    # name -> list of spec statements
+        self.objects = {}       # "kind name" -> body text
+        self.handle = None
+
+    def chain(self, name):
+        if name not in self.chains:
+            self.chains[name] = Chain(name)
+        return self.chains[name]
+
+
+class Ruleset:
+    __slots__ = ("tables", "flushed")
+
+    def __init__(self):
+        self.tables = {}        # (family, name) -> Table
+        self.flushed = False    # file starts from 'flush ruleset'
+
+    def table(self, family, name):
+        key = (family, name)
+        if key not in self.tables:
+            self.tables[key] = Table(family, name)
+        return self.tables[key]
+
+    def rule_count(self):
+        return sum(len(c.rules) for t in self.tables.values() for c in t.chains.values())
+
+
+# ----------------------------------------------------------------------------
+# Source reading and tokenizing
+# ----------------------------------------------------------------------------
+def _resolve_include(pattern, current, include_dirs):
+    """Return the sorted list of files an include statement refers to."""
+    if os.path.isabs(pattern):
+        candidates = [pattern]
+    else:
+        base = os.path.dirname(current) if current else "."
+        candidates = [os.path.join(base, pattern)]
+        candidates += [os.path.join(d, pattern) for d in include_dirs]
+    for candidate in candidates:
+        matches = sorted(glob.glob(candidate))
+        if matches:
+            return matches
+    if glob.has_magic(pattern):
+        return []  # an empty glob is not an error for nft either
+    raise NftParseError(f"include file not found: {pattern}")
+
+
+def iter_source_lines(path, include_dirs=DEFAULT_INCLUDE_DIRS, _stack=()):
+    """
+    Yield (text, source, lineno) for every line of a rules file, expanding
+    'include "..."' lines in place. Files are read lazily, one line at a time.
+
+    Raises:
+        NftParseError: on include cycles or missing include files
+    """
+    real = os.path.realpath(path)
+    if real in _stack:
+        raise NftParseError(f"include cycle through {path}")
+    with open(path) as f:
+        for lineno, text in enumerate(f, start=1):
+            stripped = text.strip()
+            if stripped.startswith("include "):
+                target = stripped[len("include "):].strip().rstrip(";").strip().strip('"')
+                try:
+                    files = _resolve_include(target, path, include_dirs)
+                except NftParseError as e:
+                    raise NftParseError(str(e), path, lineno) from None
+                for inc in files:
+                    yield from iter_source_lines(inc, include_dirs, _stack + (real,))
+                continue
+            yield text, path, lineno
+
+
+def tokenize(lines):
+    """
+    Turn (text, source, lineno) lines into (kind, value, source, lineno)
+    tokens. kind is one of 'word', '{', '}', ';', ',', 'comment', 'nl'.
+    """
+    for text, source, lineno in lines:
+        for match in _TOKEN_RE.finditer(text):
+            value = match.group(0)
+            if value.startswith("#"):
+                yield "comment", value, source, lineno
+            elif value in ("{", "}", ";", ","):
+                yield value, value, source, lineno
+            else:
+                yield "word", value, source, lineno
+        yield "nl", "\n", source, lineno
+
+
+def render(words):
+    """
+    Render a statement's words as normalized text: single spaces,
+    '{ a, b }' for inline sets and 'a,b' for flag lists outside braces.
+    Counter values ('packets N bytes N') are dropped so live listings
+    compare equal to files.
+    """
+    out = []
+    depth = 0
+    skip = 0
+    for i, w in enumerate(words):
+        if skip:
+            skip -= 1
+            continue
+        if w == "counter" and i + 1 < len(words) and words[i + 1] == "packets":
+            skip = 4
+        if w == "{":
+            depth += 1
+            out.append(" { ")
+        elif w == "}":
+            depth -= 1
+            out.append(" }")
+        elif w == ",":
+            out.append(", " if depth else ",")
+        else:
+            if out and not out[-1].endswith((" ", ",")):
+                out.append(" ")
+            out.append(w)
+    return re.sub(r" +", " ", "".join(out)).strip()
+
+
+def canonical(text):
+    """
+    Comparison key for rendered text: quotes are dropped from strings
+    that need none, so a file's 'iifname eth0' matches the live ruleset's
+    'iifname "eth0"'. Commands are still built from the original text.
+    """
+    if '"' not in text and "'" not in text:
+        return text
+    return _SIMPLE_QUOTED_RE.sub(lambda m: m.group(1) or m.group(2), text)
+
+
+def object_body(statements):
+    """A named object's body without the state the kernel adds to it."""
+    body = "; ".join(_OBJECT_STATE_RE.sub("", s).strip() for s in statements)
+    return re.sub(r"(; )+", "; ", body).strip("; ")
+
+
+def split_elements(words):
+    """Split the words of '{ a, b . c, d : accept }' into element strings."""
+    if words and words[0] == "{":
+        words = words[1:-1]
+    elements, current, depth = [], [], 0
+    for w in words:
+        if w == "," and depth == 0:
+            if current:
+                elements.append(render(current))
+            current = []
+            continue
+        if w == "{":
+            depth += 1
+        elif w == "}":
+            depth -= 1
+        current.append(w)
+    if current:
+        elements.append(render(current))
+    return elements
+
+
+def normalize_priority(family, words):
+    """Turn 'filter', 'filter + 10' or '-150' into an integer string."""
+    names = BRIDGE_PRIORITY_NAMES if family == "bridge" else PRIORITY_NAMES
+    total, sign = 0, 1
+    for w in words:
+        if w == "+":
+            sign = 1
+        elif w == "-":
+            sign = -1
+        elif w in names:
+            total += sign * names[w]
+        else:
+            try:
+                total += sign * int(w)
+            except ValueError:
+                return " ".join(words)
+    return str(total)
+
+
+# ----------------------------------------------------------------------------
+# Parser
+# ----------------------------------------------------------------------------
+class _Parser:
+    def __init__(self, tokens, ruleset):
+        self.tokens = iter(tokens)
+        self.pushed = []
+        self.ruleset = ruleset
+        self.defines = {}
+        self.source = None
+        self.line = None
+
+    def _next(self):
+        if self.pushed:
+            return self.pushed.pop()
+        return next(self.tokens, None)
+
+    def error(self, message):
+        raise NftParseError(message, self.source, self.line)
+
+    def read_statement(self, is_header):
+        """
+        Read one statement.
+
+        Returns:
+            (words, comment, opens_block)
+        """
+        words, comment, depth = [], None, 0
+        while True:
+            tok = self._next()
+            if tok is None:
+                if depth:
+                    self.error("unbalanced '{' at end of input")
+                return words, comment, False
+            kind, value, source, lineno = tok
+            if kind == "comment":
+                if depth == 0:
+                    comment = value
+                continue
+            if kind in ("nl", ";") and depth == 0:
+                if words:
+                    return words, comment, False
+                comment = None
+                continue
+            if kind == "nl":
+                continue
+            if not words:
+                self.source, self.line = source, lineno
+            if kind == "}":
+                if depth == 0:
+                    self.pushed.append(tok)
+                    return words, comment, False
+                depth -= 1
+                words.append("}")
+                continue
+            if kind == "{":
+                if depth == 0 and words and is_header(words):
+                    return words, comment, True
+                depth += 1
+                words.append("{")
+                continue
+            if value.startswith("$") and value[1:] in self.defines:
+                words.extend(self.defines[value[1:]])
+                continue
+            if value.startswith("$"):
+                self.error(f"undefined variable {value}")
+            words.append(value)
+
+    def block(self, is_header, handle_statement, nested):
+        """Read statements until the closing '}' (or EOF at top level)."""
+        while True:
+            words, comment, opens = self.read_statement(is_header)
+            if words:
+                handle_statement(words, comment, opens)
+            tok = self._next()
+            if tok is None:
+                if nested:
+                    self.error("missing '}' at end of input")
+                return
+            if tok[0] == "}":
+                if not nested:
+                    self.source, self.line = tok[2], tok[3]
+                    self.error("unexpected '}'")
+                return
+            self.pushed.append(tok)
+
+    # -- helpers -------------------------------------------------------------
+    def _family_name(self, words):
+        """Split [family] name from the front of words; default family is ip."""
+        if words and words[0] in FAMILIES and len(words) > 1:
+            return words[0], words[1], words[2:]
+        if not words:
+            self.error("missing table name")
+        return "ip", words[0], words[1:]
+
+    @staticmethod
+    def _handle(comment):
+        match = _HANDLE_RE.search(comment or "")
+        return int(match.group(1)) if match else None
+
+    # -- top level -------------------------------------------------------------
+    def parse(self):
+        def is_header(words):
+            if words[0] == "table":
+                return True
+            return words[0] in ("add", "create") and len(words) > 1 and \
+                words[1] in ("table", "chain", "set", "map", "flowtable")
+        self.block(is_header, self.top_statement, nested=False)
+        return self.ruleset
+
+    def top_statement(self, words, comment, opens):
+        head = words[0]
+        if head == "table":
+            family, name, _rest = self._family_name(words[1:])
+            table = self.ruleset.table(family, name)
+            if table.handle is None:
+                table.handle = self._handle(comment)
+            if opens:
+                self.table_body(table)
+            return
+        if head == "define":
+            if len(words) < 3 or words[2] != "=":
+                self.error("expected 'define NAME = value'")
+            self.defines[words[1]] = words[3:]
+            return
+        if head == "include":
+            self.error("include must be expanded before parsing")
+        if words[:2] == ["flush", "ruleset"]:
+            self.ruleset.flushed = True
+            self.ruleset.tables.clear()
+            return
+        if head == "delete" and len(words) > 1 and words[1] == "table":
+            family, name, _rest = self._family_name(words[2:])
+            self.ruleset.tables.pop((family, name), None)
+            return
+        if head in ("add", "create", "insert") and len(words) > 1:
+            self.command(words, opens)
+            return
+        self.error(f"unsupported statement: {render(words)}")
+
+    def command(self, words, opens):
+        verb, obj = words[0], words[1]
+        if obj == "table":
+            family, name, _rest = self._family_name(words[2:])
+            table = self.ruleset.table(family, name)
+            if opens:
+                self.table_body(table)
+            return
+        family, tname, rest = self._family_name(words[2:])
+        if not rest:
+            self.error(f"missing object name in '{verb} {obj}'")
+        table = self.ruleset.table(family, tname)
+        name, rest = rest[0], rest[1:]
+        if obj == "chain":
+            chain = table.chain(name)
+            if opens:
+                self.chain_body(table, chain)
+        elif obj in ("set", "map"):
+            nset = table.sets.setdefault(name, NftSet(name, obj))
+            if opens:
+                self.set_body(nset)
+        elif obj == "flowtable":
+            spec = table.flowtables.setdefault(name, [])
+            if opens:
+                self.spec_body(spec)
+        elif obj == "rule":
+            chain = table.chain(name)
+            if rest[:1] in (["position"], ["index"], ["handle"]):
+                self.error("positional rule commands are not supported in desired state")
+            if verb == "insert":
+                chain.rules.insert(0, render(rest))
+                chain.handles.insert(0, None)
+            else:
+                chain.rules.append(render(rest))
+                chain.handles.append(None)
+        elif obj == "element":
+            nset = table.sets.get(name)
+            if nset is None:
+                self.error(f"element added to unknown set {name}")
+            nset.elements.extend(split_elements(rest))
+        else:
+            self.error(f"unsupported command: {render(words)}")
+
+    # -- blocks ----------------------------------------------------------------
+    def table_body(self, table):
+        def is_header(words):
+            return words[0] in TABLE_BLOCKS + TABLE_OBJECTS
+
+        def statement(words, comment, opens):
+            head = words[0]
+            if head == "chain" and opens:
+                chain = table.chain(words[1])
+                chain.handle = self._handle(comment)
+                self.chain_body(table, chain)
+            elif head in ("set", "map") and opens:
+                nset = table.sets.setdefault(words[1], NftSet(words[1], head))
+                nset.handle = self._handle(comment)
+                self.set_body(nset)
+            elif head == "flowtable" and opens:
+                spec = table.flowtables.setdefault(words[1], [])
+                self.spec_body(spec)
+            elif head in TABLE_OBJECTS and opens:
+                key = render(words)
+                body = []
+                self.spec_body(body)
+                table.objects[key] = object_body(body)
+            elif head in TABLE_OBJECTS and len(words) == 2:
+                table.objects[render(words)] = ""    # 'counter NAME' needs no body
+            elif head in ("flags", "comment"):
+                pass  # table flags/comments are not diffed
+            else:
+                self.error(f"unexpected statement in table {table.name}: {render(words)}")
+
+        self.block(is_header, statement, nested=True)
+
+    def chain_body(self, table, chain):
+        def statement(words, comment, opens):
+            head = words[0]
+            if head == "type":
+                spec = list(words)
+                if "priority" in spec:
+                    i = spec.index("priority")
+                    end = i + 1
+                    while end < len(spec) and spec[end] not in ("device", "devices"):
+                        end += 1
+                    spec[i + 1:end] = [normalize_priority(table.family, spec[i + 1:end])]
+                chain.spec = render(spec)
+                if chain.policy is None:
+                    chain.policy = "accept"
+            elif head == "policy":
+                chain.policy = words[1]
+            elif head == "comment":
+                pass
+            else:
+                chain.rules.append(render(words))
+                chain.handles.append(self._handle(comment))
+
+        self.block(lambda words: False, statement, nested=True)
+
+    def set_body(self, nset):
+        def statement(words, comment, opens):
+            if words[0] == "elements":
+                if len(words) < 2 or words[1] != "=":
+                    self.error("expected 'elements = { ... }'")
+                nset.elements.extend(split_elements(words[2:]))
+            else:
+                nset.spec.append(render(words))
+
+        self.block(lambda words: False, statement, nested=True)
+
+    def spec_body(self, spec):
+        def statement(words, comment, opens):
+            if words[0] == "hook" and "priority" in words:
+                i = words.index("priority")
+                words = words[:i + 1] + [normalize_priority("netdev", words[i + 1:])]
+            spec.append(render(words))
+
+        self.block(lambda words: False, statement, nested=True)
+
+
+def parse_lines(lines):
+    """Parse (text, source, lineno) lines into a Ruleset."""
+    return _Parser(tokenize(lines), Ruleset()).parse()
+
+
+def parse_text(text, source="<string>"):
+    """Parse rules text into a Ruleset."""
+    lines = ((line, source, i) for i, line in enumerate(text.splitlines(True), start=1))
+    return parse_lines(lines)
+
+
+def load_ruleset(path, include_dirs=DEFAULT_INCLUDE_DIRS):
+    """Parse a rules file (with includes expanded) into a Ruleset."""
+    return parse_lines(iter_source_lines(path, include_dirs))
+
+
+def format_ruleset(ruleset):
+    """
+    Render a Ruleset back into an nft rules file.
+
+    The output holds what the model holds: includes and variables come out
+    expanded, and comments, table flags and counter values are not kept.
+    """
+    lines = ["flush ruleset", ""] if ruleset.flushed else []
+    for table in ruleset.tables.values():
+        lines.append(f"table {table.family} {table.name} {{")
+        for key, body in table.objects.items():
+            lines.append(f"\t{key} {{ {body} }}" if body else f"\t{key}")
+        for nset in table.sets.values():
+            lines.append(f"\t{nset.kind} {nset.name} {{")
+            lines.extend(f"\t\t{spec}" for spec in nset.spec)
+            if nset.elements:
+                lines.append(f"\t\telements = {{ {', '.join(nset.elements)} }}")
+            lines.append("\t}")
+        for name, spec in table.flowtables.items():
+            lines.append(f"\tflowtable {name} {{")
+            lines.extend(f"\t\t{statement}" for statement in spec)
+            lines.append("\t}")
+        for chain in table.chains.values():
+            lines.append(f"\tchain {chain.name} {{")
+            if chain.spec:
+                lines.append(f"\t\t{chain.spec}; policy {chain.policy or 'accept'};")
+            lines.extend(f"\t\t{rule}" for rule in chain.rules)
+            lines.append("\t}")
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def load_live_ruleset():
+    """
+    Parse the kernel's current ruleset.
+
+    'nft -a list ruleset' is used rather than the JSON listing so that the
+    live and desired rules go through the same text normalization; '-a'
+    adds the rule handles needed for targeted deletes.
+    """
+    output = executor.check_output(["nft", "-a", "list", "ruleset"])
+    return parse_text(output, source="<live ruleset>")
+
+
+# ----------------------------------------------------------------------------
+# Diff
+# ----------------------------------------------------------------------------
+class Delta:
+    """
+    Changes needed to turn one ruleset into another.
+
+    changes is a list of (category, action, description); commands are
+    grouped into ordered phases so that referenced objects exist before
+    they are used and are removed only after their users. A set,
+    flowtable or named object that has to be recreated is still in use
+    by live rules, so the chains using it are flushed first
+    ("chain_flushes") and their rules added back after it.
+    """
+
+    PHASES = ("tables", "chains", "chain_flushes", "sets", "elements", "rule_deletes",
+              "rule_adds", "chain_deletes", "set_deletes", "table_deletes")
+
+    def __init__(self):
+        self.changes = []
+        self.phases = {name: [] for name in self.PHASES}
+
+    def add(self, category, action, description, phase, *commands):
+        self.changes.append((category, action, description))
+        self.phases[phase].extend(commands)
+
+    def is_empty(self):
+        return not any(self.phases.values())
+
+    def counts(self):
+        """Return {(category, action): count}."""
+        result = {}
+        for category, action, _desc in self.changes:
+            result[(category, action)] = result.get((category, action), 0) + 1
+        return result
+
+    def script(self):
+        """Return the delta as one nft script (applied atomically by nft -f)."""
+        lines = []
+        for phase in self.PHASES:
+            lines.extend(self.phases[phase])
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _chain_decl(table, chain):
+    if chain.spec:
+        return (f"add chain {table.family} {table.name} {chain.name} "
+                f"{{ {chain.spec}; policy {chain.policy or 'accept'}; }}")
+    return f"add chain {table.family} {table.name} {chain.name}"
+
+
+def _set_decl(table, nset):
+    body = "; ".join(nset.spec)
+    return f"add {nset.kind} {table.family} {table.name} {nset.name} {{ {body}; }}"
+
+
+def _element_commands(verb, table, nset, elements):
+    elements = list(elements)
+    return [
+        f"{verb} element {table.family} {table.name} {nset.name} "
+        f"{{ {', '.join(elements[i:i + ELEMENT_CHUNK])} }}"
+        for i in range(0, len(elements), ELEMENT_CHUNK)
+    ]
+
+
+def _object_command(verb, table, key, body=""):
+    kind, name = key.rsplit(" ", 1)
+    command = f"{verb} {kind} {table.family} {table.name} {name}"
+    return f"{command} {{ {body} }}" if body else command
+
+
+def _uses(rule, set_names, object_names):
+    """True if a rule references one of the named sets/flowtables or objects."""
+    for name in set_names:
+        if re.search("@" + re.escape(name) + r"(?![\w.-])", rule):
+            return True
+    for name in object_names:
+        if re.search(r'\b(?:name|set) "?' + re.escape(name) + r'"?(?![\w.-])', rule):
+            return True
+    return False
+
+
+def _add_table(delta, table):
+    fam, tname = table.family, table.name
+    delta.add("table", "add", f"{fam} {tname}", "tables", f"add table {fam} {tname}")
+    for chain in table.chains.values():
+        delta.add("chain", "add", f"{fam} {tname} {chain.name}", "chains", _chain_decl(table, chain))
+        _add_rules(delta, table, chain, chain.rules)
+    for nset in table.sets.values():
+        _add_set(delta, table, nset)
+    for name, spec in table.flowtables.items():
+        delta.add("flowtable", "add", f"{fam} {tname} {name}", "sets",
+                  f"add flowtable {fam} {tname} {name} {{ {'; '.join(spec)}; }}")
+    for key, body in table.objects.items():
+        delta.add("object", "add", f"{fam} {tname} {key}", "sets",
+                  _object_command("add", table, key, body))
+
+
+def _add_set(delta, table, nset):
+    delta.add("set", "add", f"{table.family} {table.name} {nset.name}", "sets", _set_decl(table, nset))
+    if nset.elements:
+        delta.add("element", "add", f"{len(nset.elements)} in {nset.name}", "elements",
+                  *_element_commands("add", table, nset, nset.elements))
+
+
+def _add_rules(delta, table, chain, rules):
+    for rule in rules:
+        delta.add("rule", "add", f"{table.name} {chain.name}: {rule}", "rule_adds",
+                  f"add rule {table.family} {table.name} {chain.name} {rule}")
+
+
+def _diff_rules(delta, table, live, desired):
+    """Emit minimal rule deletes/inserts for one chain using live handles."""
+    prefix = f"{table.family} {table.name} {live.name}"
+    matcher = difflib.SequenceMatcher(None, [canonical(r) for r in live.rules],
+                                      [canonical(r) for r in desired.rules], autojunk=False)
+    anchor = None  # handle of the last live rule that is kept
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            anchor = live.handles[i2 - 1]
+            continue
+        if tag in ("delete", "replace"):
+            for i in range(i1, i2):
+                if live.handles[i] is None:
+                    raise NftParseError(f"live rule without handle in {prefix}")
+                delta.add("rule", "remove", f"{table.name} {live.name}: {live.rules[i]}",
+                          "rule_deletes", f"delete rule {prefix} handle {live.handles[i]}")
+        if tag in ("insert", "replace"):
+            # Each command lands right after the anchor (or at the chain
+            # head), so emit in reverse to keep the desired order.
+            for j in reversed(range(j1, j2)):
+                rule = desired.rules[j]
+                if anchor is None:
+                    cmd = f"insert rule {prefix} {rule}"
+                else:
+                    cmd = f"add rule {prefix} position {anchor} {rule}"
+                delta.add("rule", "add", f"{table.name} {live.name}: {rule}", "rule_adds", cmd)
+
+
+def _diff_table(delta, live, desired):
+    fam, tname = desired.family, desired.name
+
+    # Sets, flowtables and objects whose definition changed are deleted and
+    # added again; find them first, so the chains using them can be flushed
+    # before the delete (nft refuses to delete what a rule still uses).
+    replaced_sets = {name for name, nset in desired.sets.items()
+                     if name in live.sets and (
+                         live.sets[name].kind != nset.kind or
+                         [canonical(x) for x in live.sets[name].spec] != [canonical(x) for x in nset.spec])}
+    replaced_sets.update(name for name, spec in desired.flowtables.items()
+                         if name in live.flowtables and
+                         [canonical(x) for x in live.flowtables[name]] != [canonical(x) for x in spec])
+    replaced_objects = {key for key, body in desired.objects.items()
+                        if key in live.objects and canonical(live.objects[key]) != canonical(body)}
+    object_names = {key.rsplit(" ", 1)[1].strip('"') for key in replaced_objects}
+    flushed = set()
+    if replaced_sets or object_names:
+        flushed = {name for name, chain in live.chains.items()
+                   if any(_uses(rule, replaced_sets, object_names) for rule in chain.rules)}
+
+    for name, chain in desired.chains.items():
+        have = live.chains.get(name)
+        where = f"{fam} {tname} {name}"
+        if have is None:
+            delta.add("chain", "add", where, "chains", _chain_decl(desired, chain))
+            _add_rules(delta, desired, chain, chain.rules)
+        elif canonical(have.spec or "") != canonical(chain.spec or ""):
+            delta.add("chain", "change", where, "chains",
+                      f"flush chain {where}", f"delete chain {where}", _chain_decl(desired, chain))
+            _add_rules(delta, desired, chain, chain.rules)
+        else:
+            if chain.spec and have.policy != chain.policy:
+                delta.add("chain", "change", f"{where} policy {chain.policy}", "chains",
+                          _chain_decl(desired, chain))
+            if name in flushed:
+                delta.add("chain", "change", f"{where}: rules re-added around a replaced "
+                          f"set/flowtable/object", "chain_flushes", f"flush chain {where}")
+                _add_rules(delta, desired, chain, chain.rules)
+            else:
+                _diff_rules(delta, desired, have, chain)
+    for name in live.chains:
+        if name not in desired.chains:
+            where = f"{fam} {tname} {name}"
+            delta.add("chain", "remove", where,
+                      "chain_flushes" if name in flushed else "rule_deletes", f"flush chain {where}")
+            delta.phases["chain_deletes"].append(f"delete chain {where}")
+
+    for name, nset in desired.sets.items():
+        have = live.sets.get(name)
+        if have is None:
+            _add_set(delta, desired, nset)
+        elif name in replaced_sets:
+            delta.add("set", "change", f"{fam} {tname} {name}", "sets",
+                      f"delete {have.kind} {fam} {tname} {name}")
+            _add_set(delta, desired, nset)
+        else:
+            old = {canonical(e) for e in have.elements}
+            new = {canonical(e) for e in nset.elements}
+            removed = [e for e in have.elements if canonical(e) not in new]
+            added = [e for e in nset.elements if canonical(e) not in old]
+            if removed:
+                delta.add("element", "remove", f"{len(removed)} from {name}", "elements",
+                          *_element_commands("delete", desired, nset, removed))
+            if added:
+                delta.add("element", "add", f"{len(added)} to {name}", "elements",
+                          *_element_commands("add", desired, nset, added))
+    for name, have in live.sets.items():
+        if name not in desired.sets:
+            delta.add("set", "remove", f"{fam} {tname} {name}", "set_deletes",
+                      f"delete {have.kind} {fam} {tname} {name}")
+
+    for name, spec in desired.flowtables.items():
+        decl = f"add flowtable {fam} {tname} {name} {{ {'; '.join(spec)}; }}"
+        if name not in live.flowtables:
+            delta.add("flowtable", "add", f"{fam} {tname} {name}", "sets", decl)
+        elif name in replaced_sets:
+            delta.add("flowtable", "change", f"{fam} {tname} {name}", "sets",
+                      f"delete flowtable {fam} {tname} {name}", decl)
+    for name in live.flowtables:
+        if name not in desired.flowtables:
+            delta.add("flowtable", "remove", f"{fam} {tname} {name}", "set_deletes",
+                      f"delete flowtable {fam} {tname} {name}")
+
+    for key, body in desired.objects.items():
+        if key not in live.objects:
+            delta.add("object", "add", f"{fam} {tname} {key}", "sets",
+                      _object_command("add", desired, key, body))
+        elif key in replaced_objects:
+            delta.add("object", "change", f"{fam} {tname} {key}", "sets",
+                      _object_command("delete", desired, key),
+                      _object_command("add", desired, key, body))
+    for key in live.objects:
+        if key not in desired.objects:
+            delta.add("object", "remove", f"{fam} {tname} {key}", "set_deletes",
+                      _object_command("delete", desired, key))
+
+
+def diff_rulesets(live, desired):
+    """
+    Compute the changes that turn live into desired.
+
+    Tables absent from the desired file are only removed when it starts
+    with 'flush ruleset' (the same thing 'nft -f' would do); otherwise
+    tables owned by other tools are left alone.
+
+    Returns:
+        Delta
+    """
+    delta = Delta()
+    for key, table in desired.tables.items():
+        have = live.tables.get(key)
+        if have is None:
+            _add_table(delta, table)
+        else:
+            _diff_table(delta, have, table)
+    if desired.flushed:
+        for key, table in live.tables.items():
+            if key not in desired.tables:
+                delta.add("table", "remove", f"{table.family} {table.name}", "table_deletes",
+                          f"delete table {table.family} {table.name}")
+    return delta
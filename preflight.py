@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Pre-flight Checks
+
+Validates a configuration before anything is written, so a bad config is
+caught here instead of by 'netplan apply' or 'nft -f' on a live box:
+
+    netplan     'netplan generate --root-dir <scratch>' on the new file,
+                next to copies of the other files in /etc/netplan
+    nftables    'nft -c -f <file>' (parse and evaluate, commit nothing)
+    addresses   address, subnet, gateway and nameserver checks on the
+                netplan document (address_check.py, no commands)
+
+The checks are independent, so they run concurrently and the total
+wall-clock time stays close to the slowest single check. A check that
+passed for the same content earlier in the run is not repeated (with
+--mode both the combined pre-flight covers the per-step ones).
+
+References:
+    - netplan generate: https://netplan.readthedocs.io/en/stable/netplan-generate/
+    - nft(8) --check: https://www.netfilter.org/projects/nftables/manpage.html
+"""
+
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import address_check
+import apply_state
+import executor
+import netplan_model
+
+NETPLAN_DIR = "/etc/netplan"
+
+_settings = {"enabled": True}
+_passed = set()     # (check name, content hash) that passed in this run
+
+
+class CheckResult:
+    __slots__ = ("name", "errors", "warnings", "seconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.errors = []
+        self.warnings = []
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def set_enabled(enabled):
+    """Turn the pre-flight stage on or off (--skip-preflight)."""
+    _settings["enabled"] = enabled
+
+
+def check_netplan(netplan_file, content):
+    """
+    Run 'netplan generate' on the new file in a scratch root.
+
+    The other files of /etc/netplan are copied next to it, because netplan
+    merges every file and a conflict may only show up in combination.
+    """
+    result = CheckResult("netplan generate")
+    with tempfile.TemporaryDirectory(prefix="a2-preflight-") as root:
+        target_dir = os.path.join(root, os.path.dirname(netplan_file).lstrip("/"))
+        os.makedirs(target_dir)
+        for other in glob.glob(os.path.join(NETPLAN_DIR, "*.yaml")):
+            if os.path.abspath(other) != os.path.abspath(netplan_file):
+                shutil.copy(other, target_dir)
+        path = os.path.join(target_dir, os.path.basename(netplan_file))
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600), "w") as f:
+            f.write(content)
+        try:
+            executor.run(["netplan", "generate", "--root-dir", root])
+        except (OSError, subprocess.SubprocessError) as e:
+            result.errors.append(executor.describe(e).replace(root, ""))
+    return result
+
+
+def check_nft(rules_path):
+    """Run 'nft -c -f' on a rules file (nothing is committed)."""
+    result = CheckResult(f"nft -c {os.path.basename(rules_path)}")
+    try:
+        executor.run(["nft", "-c", "-f", rules_path])
+    except (OSError, subprocess.SubprocessError) as e:
+        result.errors.append(executor.describe(e))
+    return result
+
+
+def check_addresses(content):
+    """
+    Sanity-check the addresses of a netplan document (see address_check.py):
+    usable host addresses, no address or subnet used twice, no overlapping
+    subnets across interfaces, gateways on their interface's subnets
+    (unless the route is on-link) and valid nameservers.
+    """
+    result = CheckResult("addresses")
+    try:
+        doc = netplan_model.parse(content)
+    except netplan_model.NetplanParseError as e:
+        result.errors.append(f"netplan YAML: {e}")
+        return result
+    errors, warnings = address_check.check_document(doc)
+    result.errors.extend(errors)
+    result.warnings.extend(warnings)
+    return result
+
+
+def _rules_key(path):
+    """Cache key for a rules file: its hash including every included file."""
+    try:
+        return ("nft", path, apply_state.rules_hash(path))
+    except (OSError, ValueError):
+        return None   # unreadable or a broken include: never cached, let check_nft report it
+
+
+def _timed(check, *args):
+    start = time.perf_counter()
+    result = check(*args)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def run(netplan_file=None, netplan_content=None, rules_paths=()):
+    """
+    Run every applicable check concurrently and print the results.
+
+    Args:
+        netplan_file (str or None): where the netplan content will be written
+        netplan_content (str or None): the netplan YAML to check
+        rules_paths (list of str): nftables rules files to check
+
+    Returns:
+        bool: True if every check passed (or pre-flight is disabled)
+    """
+    if not _settings["enabled"]:
+        return True
+    jobs = []      # (cache key, check function, args)
+    if netplan_content is not None:
+        sha = apply_state.content_hash(netplan_content)
+        jobs.append((("netplan", netplan_file, sha), check_netplan, (netplan_file, netplan_content)))
+        jobs.append((("addresses", sha), check_addresses, (netplan_content,)))
+    for path in rules_paths:
+        jobs.append((_rules_key(path), check_nft, (path,)))
+
+    todo = [job for job in jobs if job[0] not in _passed]
+    if not todo:
+        return True
+    print("\nPre-flight checks (nothing is written unless all pass):")
+    start = time.perf_counter()
+    results = executor.concurrently(*(lambda job=job: _timed(job[1], *job[2]) for job in todo))
+    wall = time.perf_counter() - start
+
+    for (key, _check, _args), result in zip(todo, results):
+        status = "ok" if result.ok else "FAILED"
+        print(f"  {result.name:28s} {status:7s} {result.seconds * 1000:8.1f} ms")
+        for error in result.errors:
+            print(f"      error: {error}")
+        for warning in result.warnings:
+            print(f"      warning: {warning}")
+        if result.ok and key is not None:
+            _passed.add(key)
+    print(f"  {'wall clock':28s} {'':7s} {wall * 1000:8.1f} ms "
+          f"(checks alone: {sum(r.seconds for r in results) * 1000:.1f} ms)")
+    return all(result.ok for result in results)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+"""
+Router Performance Profile
+
+Derives forwarding-oriented kernel settings from the hardware instead of
+leaving a router on desktop defaults:
+
+    inputs      online CPUs (/sys/devices/system/cpu/online), MemTotal
+                (/proc/meminfo), and per NIC the rx/tx queue count and
+                link speed (/sys/class/net/<iface>/{queues,speed})
+    sysctls     ip_forward, netdev_max_backlog, netdev_budget,
+                nf_conntrack_max / buckets, socket buffer limits and
+                busy polling, written to one file in /etc/sysctl.d and
+                applied with a single 'sysctl -p' call
+    queues      RPS/XPS masks (and RFS flow counts), which are per-queue
+                sysfs files rather than sysctls, written after the sysctls
+
+Every reader takes the /proc and /sys roots as arguments, so the profile
+can be computed (and --dry-run shown) against fixture trees.
+
+References:
+    - Scaling in the Linux networking stack: https://docs.kernel.org/networking/scaling.html
+    - /proc/sys/net/core: https://docs.kernel.org/admin-guide/sysctl/net.html
+    - nf_conntrack sysctls: https://docs.kernel.org/networking/nf_conntrack-sysctl.html
+    - sysctl(8): https://man7.org/linux/man-pages/man8/sysctl.8.html
+"""
+
+import glob
+import os
+import subprocess
+
+import executor
+
+PROFILE_FILE = "/etc/sysctl.d/99-router-profile.conf"
+PROC_ROOT = "/proc"
+SYS_ROOT = "/sys"
+
+# Speed assumed for links that do not report one (virtual NICs report -1)
+DEFAULT_SPEED_MBPS = 1000
+# Backlog sizing: how much traffic one CPU's backlog queue should absorb
+BACKLOG_MS = 10
+AVG_PACKET_BYTES = 512
+# Conntrack sizing: share of RAM for the table and the cost of one entry
+CONNTRACK_MEM_SHARE = 1 / 32
+CONNTRACK_ENTRY_BYTES = 384
+# Socket buffers: bandwidth-delay product at this round-trip time
+BUFFER_RTT_MS = 20
+BUSY_POLL_USECS = 50
+RFS_FLOW_ENTRIES = 32768
+
+# Limits the profile only ever raises: a host tuned higher keeps its value
+RAISE_ONLY = (
+    "net.core.netdev_max_backlog", "net.core.netdev_budget",
+    "net.netfilter.nf_conntrack_max", "net.netfilter.nf_conntrack_buckets",
+    "net.core.rmem_max", "net.core.wmem_max", "net.ipv4.tcp_rmem", "net.ipv4.tcp_wmem",
+    "net.core.rps_sock_flow_entries",
+)
+
+
+class Hardware:
+    __slots__ = ("cpus", "mem_bytes", "nics")
+
+    def __init__(self, cpus, mem_bytes, nics):
+        self.cpus = cpus            # online CPU ids
+        self.mem_bytes = mem_bytes
+        self.nics = nics            # [Nic]
+
+
+class Nic:
+    __slots__ = ("name", "rx_queues", "tx_queues", "speed")
+
+    def __init__(self, name, rx_queues, tx_queues, speed):
+        self.name = name
+        self.rx_queues = rx_queues
+        self.tx_queues = tx_queues
+        self.speed = speed          # Mbit/s, None if unknown
+
+
+class Profile:
+    __slots__ = ("sysctls", "queues")
+
+    def __init__(self):
+        self.sysctls = {}           # key -> value, in file order
+        self.queues = []            # (sysfs path relative to the /sys root, value)
+
+
+def parse_cpu_list(text):
+    """Parse a kernel CPU list such as '0-3,8,10-11' into sorted ids."""
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def cpu_mask(cpus):
+    """
+    Render CPU ids as a sysfs CPU mask: hex, in comma-separated 32-bit
+    groups ('ff', '1,00000000').
+    """
+    value = 0
+    for cpu in cpus:
+        value |= 1 << cpu
+    groups = []
+    while True:
+        groups.append(value & 0xFFFFFFFF)
+        value >>= 32
+        if not value:
+            break
+    groups.reverse()
+    return ",".join([f"{groups[0]:x}"] + [f"{g:08x}" for g in groups[1:]])
+
+
+def read_value(path):
+    """Read a small sysfs/procfs file, stripped (None if unreadable)."""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_cpus(proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """Return the online CPU ids (falls back to /proc/cpuinfo)."""
+    online = read_value(os.path.join(sys_root, "devices/system/cpu/online"))
+    if online:
+        return parse_cpu_list(online)
+    cpuinfo = read_value(os.path.join(proc_root, "cpuinfo")) or ""
+    count = sum(1 for line in cpuinfo.splitlines() if line.startswith("processor"))
+    return list(range(count or 1))
+
+
+def read_memory(proc_root=PROC_ROOT):
+    """Return MemTotal from /proc/meminfo in bytes (0 if unknown)."""
+    for line in (read_value(os.path.join(proc_root, "meminfo")) or "").splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) * 1024
+    return 0
+
+
+def read_nics(sys_root=SYS_ROOT):
+    """
+    Return the physical NICs (those with a 'device' link) with their queue
+    counts and link speed.
+    """
+    nics = []
+    base = os.path.join(sys_root, "class/net")
+    for name in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+        path = os.path.join(base, name)
+        if not os.path.exists(os.path.join(path, "device")):
+            continue
+        rx = len(glob.glob(os.path.join(path, "queues", "rx-*")))
+        tx = len(glob.glob(os.path.join(path, "queues", "tx-*")))
+        try:
+            speed = int(read_value(os.path.join(path, "speed")))
+        except (TypeError, ValueError):
+            speed = None
+        nics.append(Nic(name, rx, tx, speed if speed and speed > 0 else None))
+    return nics
+
+
+def read_hardware(proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """Read CPUs, memory and NICs from a /proc and /sys tree."""
+    return Hardware(read_cpus(proc_root, sys_root), read_memory(proc_root), read_nics(sys_root))
+
+
+def _pow2(value, low, high):
+    """Round value up to a power of two, clamped to [low, high]."""
+    value = max(low, min(high, int(value)))
+    return 1 << (value - 1).bit_length()
+
+
+def compute_profile(hw):
+    """
+    Compute the router profile for the hardware.
+
+    Args:
+        hw (Hardware): what read_hardware() found
+
+    Returns:
+        Profile: the sysctls to write and the per-queue sysfs values
+    """
+    profile = Profile()
+    sysctls = profile.sysctls
+    ncpu = max(1, len(hw.cpus))
+    speeds = [nic.speed or DEFAULT_SPEED_MBPS for nic in hw.nics] or [DEFAULT_SPEED_MBPS]
+    total_bps = sum(speeds) * 1_000_000
+    max_bps = max(speeds) * 1_000_000
+
+    sysctls["net.ipv4.ip_forward"] = 1
+
+    # Each CPU has its own backlog: size it for BACKLOG_MS of its share of line rate
+    pps = total_bps / 8 / AVG_PACKET_BYTES
+    sysctls["net.core.netdev_max_backlog"] = _pow2(pps * BACKLOG_MS / 1000 / ncpu, 1000, 262144)
+    sysctls["net.core.netdev_budget"] = 600 if max_bps >= 10_000_000_000 else 300
+
+    if hw.mem_bytes:
+        entries = hw.mem_bytes * CONNTRACK_MEM_SHARE / CONNTRACK_ENTRY_BYTES
+        conntrack = _pow2(entries, 65536, 4194304)
+        # _pow2 rounds up; stay within the memory share
+        if conntrack > entries and conntrack > 65536:
+            conntrack //= 2
+        sysctls["net.netfilter.nf_conntrack_max"] = conntrack
+        sysctls["net.netfilter.nf_conntrack_buckets"] = conntrack // 4
+
+    # Buffers for one bandwidth-delay product on the fastest link, at most 1/64 of RAM
+    bdp = max_bps / 8 * BUFFER_RTT_MS / 1000
+    if hw.mem_bytes:
+        bdp = min(bdp, hw.mem_bytes / 64)
+    buffer_max = _pow2(bdp, 4 * 1024 * 1024, 256 * 1024 * 1024)
+    sysctls["net.core.rmem_max"] = buffer_max
+    sysctls["net.core.wmem_max"] = buffer_max
+    sysctls["net.ipv4.tcp_rmem"] = f"4096 131072 {buffer_max}"
+    sysctls["net.ipv4.tcp_wmem"] = f"4096 65536 {buffer_max}"
+
+    # Busy polling trades a core's idle time for latency: only with cores to spare
+    busy = BUSY_POLL_USECS if ncpu >= 4 else 0
+    sysctls["net.core.busy_poll"] = busy
+    sysctls["net.core.busy_read"] = busy
+
+    if ncpu > 1:
+        sysctls["net.core.rps_sock_flow_entries"] = RFS_FLOW_ENTRIES
+        profile.queues = queue_settings(hw)
+    return profile
+
+
+def queue_settings(hw):
+    """
+    RPS/XPS values per NIC queue. A NIC with fewer rx queues than CPUs has
+    its receive work spread over every CPU by RPS (with RFS flow counts);
+    one with enough queues relies on hardware RSS. Tx queues get disjoint
+    CPU sets round-robin, so each CPU transmits on one queue.
+    """
+    settings = []
+    everything = cpu_mask(hw.cpus)
+    for nic in hw.nics:
+        base = f"class/net/{nic.name}/queues"
+        if 0 < nic.rx_queues < len(hw.cpus):
+            flows = RFS_FLOW_ENTRIES // nic.rx_queues
+            for q in range(nic.rx_queues):
+                settings.append((f"{base}/rx-{q}/rps_cpus", everything))
+                settings.append((f"{base}/rx-{q}/rps_flow_cnt", flows))
+        for q in range(nic.tx_queues):
+            cpus = hw.cpus[q::nic.tx_queues]
+            if cpus:
+                settings.append((f"{base}/tx-{q}/xps_cpus", cpu_mask(cpus)))
+    return settings
+
+
+def render(profile):
+    """Render the sysctl file for a profile."""
+    lines = ["# Router performance profile, generated from the hardware by assignment2.py"]
+    lines += [f"{key} = {value}" for key, value in profile.sysctls.items()]
+    return "\n".join(lines) + "\n"
+
+
+def current_value(key, proc_root=PROC_ROOT):
+    """Read a sysctl's current value from /proc/sys (None if absent)."""
+    value = read_value(os.path.join(proc_root, "sys", key.replace(".", "/")))
+    return " ".join(value.split()) if value is not None else None
+
+
+def keep_higher(profile, proc_root=PROC_ROOT):
+    """
+    Keep the running value of every RAISE_ONLY limit that is already
+    higher than the profile's (field by field for tcp_rmem / tcp_wmem).
+    """
+    for key in RAISE_ONLY:
+        current = current_value(key, proc_root)
+        if key not in profile.sysctls or current is None:
+            continue
+        try:
+            ours = [int(v) for v in str(profile.sysctls[key]).split()]
+            theirs = [int(v) for v in current.split()]
+        except ValueError:
+            continue
+        if len(ours) != len(theirs):
+            continue
+        merged = [max(a, b) for a, b in zip(ours, theirs)]
+        profile.sysctls[key] = merged[0] if len(merged) == 1 else " ".join(map(str, merged))
+
+
+def print_profile(hw, profile, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """Print the inputs and the computed values next to the current ones."""
+    print(f"\nRouter profile for {len(hw.cpus)} CPU(s), "
+          f"{hw.mem_bytes / 2 ** 30:.1f} GiB RAM:")
+    for nic in hw.nics:
+        speed = f"{nic.speed} Mbit/s" if nic.speed else f"speed unknown, assuming {DEFAULT_SPEED_MBPS}"
+        print(f"  {nic.name:12s} {nic.rx_queues} rx / {nic.tx_queues} tx queue(s), {speed}")
+    print(f"\n  {'sysctl':36s} {'current':>22s} {'profile':>22s}")
+    for key, value in profile.sysctls.items():
+        current = current_value(key, proc_root)
+        mark = "" if current == str(value) else "  *"
+        print(f"  {key:36s} {current or '-':>22s} {str(value):>22s}{mark}")
+    if profile.queues:
+        print(f"\n  {'queue setting':36s} {'current':>22s} {'profile':>22s}")
+        for path, value in profile.queues:
+            current = read_value(os.path.join(sys_root, path))
+            name = path[len("class/net/"):].replace("/queues/", " ")
+            print(f"  {name:36s} {current or '-':>22s} {str(value):>22s}")
+    print("\n  (* = differs from the running kernel; limits already higher are kept)")
+
+
+def apply_profile(profile, path=PROFILE_FILE, sys_root=SYS_ROOT):
+    """
+    Write the sysctl file, load it with one 'sysctl -p' call and write the
+    queue settings.
+
+    'sysctl -e' skips keys this kernel does not have (the conntrack keys
+    exist only once nf_conntrack is loaded); the file keeps them for the
+    next boot.
+
+    Returns:
+        list of str: queue settings that could not be written
+    """
+    with open(path, "w") as f:
+        f.write(render(profile))
+    output = executor.run(["sysctl", "-e", "-p", path]).stdout
+    print(output, end="")
+    failed = []
+    for rel, value in profile.queues:
+        try:
+            with open(os.path.join(sys_root, rel), "w") as f:
+                f.write(f"{value}\n")
+        except OSError as e:
+            failed.append(f"{rel}: {e.strerror}")
+    return failed
+
+
+def run(dry_run=False, proc_root=PROC_ROOT, sys_root=SYS_ROOT, path=PROFILE_FILE):
+    """
+    Compute the router profile and show it (dry run) or apply it.
+
+    Returns:
+        bool: True on success
+    """
+    hw = read_hardware(proc_root, sys_root)
+    profile = compute_profile(hw)
+    keep_higher(profile, proc_root)
+    print_profile(hw, profile, proc_root, sys_root)
+    if dry_run:
+        print(f"\nDry run: nothing written (would write {path} and "
+              f"{len(profile.queues)} queue setting(s)).")
+        return True
+    print(f"\nWriting {path} and applying it...")
+    try:
+        failed = apply_profile(profile, path, sys_root)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Failed to apply the router profile: {executor.describe(e)}")
+        return False
+    for line in failed:
+        print(f"  [WARNING] queue setting not applied: {line}")
+    print("Router profile applied.")
+    return True